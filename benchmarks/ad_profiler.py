@@ -0,0 +1,241 @@
+"""Profiler of the evaluation of PorePy AD operator trees.
+
+The time of the assembly goes into the recursive evaluation of ``pp.ad.Operator``
+trees, which neither ``TimedSolutionStrategy`` (per equation) nor viztracer (per Python
+function) resolve. :class:`OperatorProfiler` wraps the recursive parsing method of
+PorePy, and records the self time, the number of calls and the sparsity of the result
+of every node. The nodes are aggregated by operator type and by the source location
+where the operator was created, typically a method of a model in ``porepy/models``.
+
+Example:
+    >>> with OperatorProfiler() as profiler:
+    ...     model.prepare_simulation()
+    ...     pp.run_time_dependent_model(model, {"prepare_simulation": False})
+    >>> profiler.print_report()
+    >>> profiler.write_collapsed_stacks("operators.collapsed")
+
+The collapsed stacks can be rendered as a flame graph with ``flamegraph.pl`` or loaded
+into https://www.speedscope.app.
+
+"""
+
+import os
+import sys
+from collections import defaultdict
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+import numpy as np
+import porepy as pp
+import scipy.sparse as sps
+
+# Candidates for the recursive parsing method, in order of preference. The location
+# of the method has moved between PorePy versions.
+_PARSE_METHODS = [
+    (pp.ad.EquationSystem, "_parse_operator"),
+    (pp.ad.Operator, "_parse_operator"),
+]
+
+# Frames in these parts of PorePy are skipped when locating the creation of an
+# operator, they only implement the operator algebra.
+_AD_PACKAGE = "/porepy/numerics/ad/"
+
+
+@dataclass
+class NodeStats:
+    """Aggregated statistics of a group of operator nodes."""
+
+    calls: int = 0
+    self_time: float = 0
+    inclusive_time: float = 0
+    nnz: int = 0
+    shapes: set = field(default_factory=set)
+
+
+def relative_path(path: str) -> str:
+    """Short form of a source file path for reports, e.g. ``porepy/grids/grid.py``.
+
+    Files outside PorePy are shortened to their name.
+
+    """
+    path = path.replace(os.sep, "/")
+    if "/porepy/" in path:
+        return "porepy/" + path.rsplit("/porepy/", 1)[1]
+    return os.path.basename(path)
+
+
+def _creation_site() -> str:
+    """The innermost frame outside the AD package and this module."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename.replace(os.sep, "/")
+        if _AD_PACKAGE not in path and frame.f_code.co_filename != __file__:
+            return (
+                f"{relative_path(path)}:{frame.f_lineno} ({frame.f_code.co_name})"
+            )
+        frame = frame.f_back
+    return "<unknown>"
+
+
+def _label(op: pp.ad.Operator) -> str:
+    """Operator type, with the operation for composite operators."""
+    operation = getattr(getattr(op, "operation", None), "name", None)
+    if operation is None or operation == "void":
+        return type(op).__name__
+    return f"{type(op).__name__}[{operation}]"
+
+
+def _sparsity(result: Any) -> tuple[int, tuple]:
+    """Number of nonzeros and shape of an evaluated operator.
+
+    For AD arrays, the Jacobian is considered. Dense arrays count all their entries.
+
+    """
+    if isinstance(result, pp.ad.AdArray):
+        result = result.jac
+    if sps.issparse(result):
+        return result.nnz, result.shape
+    if isinstance(result, np.ndarray):
+        return result.size, result.shape
+    return 1, ()
+
+
+class OperatorProfiler:
+    """Context manager recording the evaluation of every AD operator node.
+
+    Operators are only attributed to their creation site if they are created inside
+    the context, i.e. ``prepare_simulation`` should run within it.
+
+    """
+
+    def __init__(self) -> None:
+        self.by_type: dict[str, NodeStats] = defaultdict(NodeStats)
+        """Statistics aggregated by operator type and operation."""
+
+        self.by_site: dict[str, NodeStats] = defaultdict(NodeStats)
+        """Statistics aggregated by the source location where operators were created."""
+
+        self.stacks: dict[tuple[str, ...], float] = defaultdict(float)
+        """Self time of each path from an equation to a node in the operator trees."""
+
+        self._stack: list[list] = []
+        self._patches: list[tuple[Any, str, Callable]] = []
+
+    def __enter__(self) -> "OperatorProfiler":
+        for owner, name in _PARSE_METHODS:
+            if name in vars(owner):
+                self._patch(owner, name, self._wrap_parse(getattr(owner, name)))
+                break
+        else:
+            raise RuntimeError("Operator parsing method not found in this PorePy.")
+        self._patch(
+            pp.ad.Operator, "__init__", self._wrap_init(pp.ad.Operator.__init__)
+        )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches.clear()
+        self._stack.clear()
+
+    def _patch(self, owner: Any, name: str, replacement: Callable) -> None:
+        self._patches.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def _wrap_init(self, original: Callable) -> Callable:
+        def __init__(op, *args, **kwargs):
+            original(op, *args, **kwargs)
+            op._profiler_site = _creation_site()
+
+        return __init__
+
+    def _wrap_parse(self, original: Callable) -> Callable:
+        profiler = self
+
+        def _parse_operator(*args, **kwargs):
+            # The node is the first operator argument besides ``self``, or ``self`` if
+            # the method is an operator method without operator arguments.
+            operators = [a for a in args[1:] if isinstance(a, pp.ad.Operator)]
+            if operators:
+                op = operators[0]
+            elif args and isinstance(args[0], pp.ad.Operator):
+                op = args[0]
+            else:
+                return original(*args, **kwargs)
+
+            frame = profiler._frame(op)
+            path = tuple(f[0] for f in profiler._stack) + (frame,)
+            profiler._stack.append([frame, 0.0])
+            tic = perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - tic
+                _, children_time = profiler._stack.pop()
+                if profiler._stack:
+                    profiler._stack[-1][1] += elapsed
+            profiler._record(op, path, elapsed, elapsed - children_time, result)
+            return result
+
+        return _parse_operator
+
+    def _frame(self, op: pp.ad.Operator) -> str:
+        name = getattr(op, "name", "")
+        if name:
+            return f"{_label(op)} '{name[:40]}'"
+        return _label(op)
+
+    def _record(
+        self,
+        op: pp.ad.Operator,
+        path: tuple[str, ...],
+        inclusive_time: float,
+        self_time: float,
+        result: Any,
+    ) -> None:
+        nnz, shape = _sparsity(result)
+        site = getattr(op, "_profiler_site", "<unknown>")
+        for stats in (self.by_type[_label(op)], self.by_site[site]):
+            stats.calls += 1
+            stats.self_time += self_time
+            stats.inclusive_time += inclusive_time
+            stats.nnz += nnz
+            stats.shapes.add(shape)
+        self.stacks[path] += self_time
+
+    def print_report(self, num_rows: int = 20, file: Optional[Any] = None) -> None:
+        """Print the most expensive operator types and creation sites by self time.
+
+        Parameters:
+            num_rows: Number of rows of each table.
+            file: Stream to print to, defaults to stdout.
+
+        """
+        for title, table in (("Operator type", self.by_type), ("Site", self.by_site)):
+            rows = sorted(table.items(), key=lambda item: item[1].self_time)
+            print(
+                f"{'Self [s]':>10} {'Incl. [s]':>10} {'Calls':>8} {'Avg. nnz':>12}  "
+                f"{title}",
+                file=file,
+            )
+            for key, stats in reversed(rows[-num_rows:]):
+                print(
+                    f"{stats.self_time:10.3e} {stats.inclusive_time:10.3e} "
+                    f"{stats.calls:8d} {stats.nnz / stats.calls:12.0f}  {key}",
+                    file=file,
+                )
+            print("", file=file)
+
+    def write_collapsed_stacks(self, path: str) -> None:
+        """Write the self times in the collapsed stack format of flame graphs.
+
+        Parameters:
+            path: The output file. Times are written in microseconds.
+
+        """
+        with open(path, "w") as f:
+            for stack, self_time in self.stacks.items():
+                frames = ";".join(frame.replace(";", ",") for frame in stack)
+                f.write(f"{frames} {round(self_time * 1e6)}\n")
@@ -0,0 +1,133 @@
+"""Benchmarks of the individual discretizations of the benchmark models.
+
+``TimedSolutionStrategy`` times every discretization class per grid dimension, but
+only within full simulations. Here, each discretization is timed in isolation on the
+prepared data of a model: the unique discretizations of all equations are found as in
+``EquationSystem.discretize``, grouped by class and grid dimension, and ``discretize``
+is called on all grids of a group. Interface discretizations are grouped by the
+dimension of the mortar grid. The model is prepared from the model cache, so the setup
+does not discretize.
+
+The discretizations are parameterized over the classes and dimensions listed in
+``model_setups.py``. The combinations a model has are found once in ``setup_cache``, on
+the coarsest grid of each geometry, so that the other combinations are skipped without
+preparing a model. So are discretizations which do not implement ``discretize``.
+Discretization classes missing from the parameters are reported on stderr.
+
+"""
+
+import sys
+from functools import partial
+
+import porepy as pp
+
+from benchmarks.model_setups import (
+    DIMENSIONS,
+    DISCRETIZATIONS,
+    GEOMETRIES,
+    PHYSICS,
+    default_case_args,
+    make_benchmark_model,
+    max_case_timeout,
+    start_case_budget,
+    stop_case_budget,
+)
+
+
+def discretization_groups(model) -> dict[tuple[str, int], list[tuple]]:
+    """The discretizations of a prepared model, grouped by class and grid dimension.
+
+    Parameters:
+        model: A model after ``prepare_simulation``.
+
+    Returns:
+        Pairs of discretization and grid for each class name and dimension.
+
+    """
+    # Imported here, since importing the base model limits the threads of the process.
+    from benchmarks.larger_models.base_model import unique_discretizations
+
+    groups: dict[tuple[str, int], list[tuple]] = {}
+    for discr, grids in unique_discretizations(model.equation_system).items():
+        for g in grids:
+            key = (type(discr).__name__, g.dim)
+            groups.setdefault(key, []).append((discr, g))
+    return groups
+
+
+def implements_discretize(model, discr, g) -> bool:
+    """Whether a discretization can be discretized on a grid of a prepared model.
+
+    ``discretize_on_grid`` ignores a ``NotImplementedError`` on subdomains, e.g. of
+    ``GradP`` and other parts of ``Biot``, which would then be timed as no work.
+
+    Parameters:
+        model: A model after ``prepare_simulation``.
+        discr: The discretization.
+        g: A subdomain or a mortar grid.
+
+    Returns:
+        False if ``discretize`` raises a ``NotImplementedError``.
+
+    """
+    from benchmarks.larger_models.base_model import discretize_on_grid
+
+    try:
+        if isinstance(g, pp.MortarGrid):
+            discretize_on_grid(model.mdg, discr, g)
+        else:
+            discr.discretize(g, model.mdg.subdomain_data(g))
+    except NotImplementedError:
+        return False
+    return True
+
+
+class Discretize:
+    """Time of a discretization class on all grids of a dimension."""
+
+    params = [PHYSICS, GEOMETRIES, DISCRETIZATIONS, DIMENSIONS]
+    param_names = ["physics", "geometry", "discretization", "dimension"]
+    timeout = max_case_timeout()
+    number = 1
+    rounds = 1
+    repeat = (1, 5, 300.0)
+
+    def setup_cache(self):
+        cases = set()
+        for physics in PHYSICS:
+            for geometry in GEOMETRIES:
+                model = make_benchmark_model(
+                    {"geometry": geometry, "grid_refinement": 0, "physics": physics},
+                    cached=True,
+                )
+                model.prepare_simulation()
+                for (name, dim), group in discretization_groups(model).items():
+                    if name not in DISCRETIZATIONS:
+                        print(
+                            f"Discretization {name!r} of {physics} is not tracked.",
+                            file=sys.stderr,
+                        )
+                    if any(implements_discretize(model, *pair) for pair in group):
+                        cases.add((physics, geometry, name, dim))
+        return cases
+
+    def setup(self, cases, physics, geometry, discretization, dimension):
+        if (physics, geometry, discretization, dimension) not in cases:
+            raise NotImplementedError(f"{discretization=}, {dimension=}")
+        from benchmarks.larger_models.base_model import discretize_on_grid
+
+        args = default_case_args(physics, geometry)
+        start_case_budget(physics, geometry, args["grid_refinement"])
+        model = make_benchmark_model(args, cached=True)
+        model.prepare_simulation()
+        self.calls = [
+            partial(discretize_on_grid, model.mdg, discr, g)
+            for discr, g in discretization_groups(model)[(discretization, dimension)]
+        ]
+
+    def teardown(self, cases, physics, geometry, discretization, dimension):
+        stop_case_budget()
+
+    def time_discretize(self, cases, physics, geometry, discretization, dimension):
+        for call in self.calls:
+            call()
@@ -1,4 +1,159 @@
+"""Benchmarks of the time to import PorePy.
+
+``timeraw_import_porepy`` measures the total import time. ``ImportTimeBreakdown``
+splits it up with ``python -X importtime``, so that a regression can be attributed to
+the PorePy subpackage or third-party dependency which caused it.
+
+"""
+
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Packages tracked by the breakdown. The time of a package is the sum of the self times
+# of all its modules, no matter which module imported them.
+TRACKED_PACKAGES = [
+    "porepy",
+    "porepy.applications",
+    "porepy.compositional",
+    "porepy.examples",
+    "porepy.fracs",
+    "porepy.geometry",
+    "porepy.grids",
+    "porepy.models",
+    "porepy.numerics",
+    "porepy.params",
+    "porepy.utils",
+    "porepy.viz",
+    "numpy",
+    "scipy",
+    "gmsh",
+    "meshio",
+    "networkx",
+    "sympy",
+    "matplotlib",
+    "numba",
+]
+
+# Number of fresh interpreters, the median per module is used.
+NUM_RUNS = 5
+
+# Number of modules printed in the report of the heaviest imports.
+NUM_TOP_MODULES = 20
+
+
 def timeraw_import_porepy():
     return """
     import porepy
-    """
\ No newline at end of file
+    """
+
+
+@dataclass
+class ImportNode:
+    """A module in the import tree, times in seconds."""
+
+    name: str
+    self_time: float
+    cumulative_time: float
+    children: list["ImportNode"] = field(default_factory=list)
+
+
+def parse_importtime(output: str) -> list[ImportNode]:
+    """Build the import tree from the output of ``python -X importtime``.
+
+    The output lists modules after the modules they import, indented by two spaces per
+    level of nesting.
+
+    Parameters:
+        output: The stderr of the interpreter.
+
+    Returns:
+        The modules imported directly by the executed code, with their imports as
+        children.
+
+    """
+    pending: dict[int, list[ImportNode]] = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        node = ImportNode(
+            name.strip(), int(self_us) * 1e-6, int(cumulative_us) * 1e-6
+        )
+        node.children = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append(node)
+    return pending.get(min(pending), []) if pending else []
+
+
+def _walk(nodes: list[ImportNode]):
+    for node in nodes:
+        yield node
+        yield from _walk(node.children)
+
+
+def package_self_times(roots: list[ImportNode]) -> dict[str, float]:
+    """Sum of the self times of all modules of each tracked package."""
+    times = {}
+    for package in TRACKED_PACKAGES:
+        modules = [
+            node
+            for node in _walk(roots)
+            if node.name == package or node.name.startswith(package + ".")
+        ]
+        if modules:
+            times[package] = sum(node.self_time for node in modules)
+    return times
+
+
+def measure_import(statement: str = "import porepy") -> list[ImportNode]:
+    """Run a statement with ``-X importtime`` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def print_heaviest_modules(roots: list[ImportNode], file: Optional[object] = None):
+    """Print the modules with the largest cumulative import time."""
+    nodes = sorted(_walk(roots), key=lambda node: node.cumulative_time, reverse=True)
+    print(f"{'Cumul. [s]':>10} {'Self [s]':>10}  Module", file=file)
+    for node in nodes[:NUM_TOP_MODULES]:
+        print(
+            f"{node.cumulative_time:10.4f} {node.self_time:10.4f}  {node.name}",
+            file=file,
+        )
+
+
+class ImportTimeBreakdown:
+    """Import time of ``porepy`` split by package."""
+
+    params = [TRACKED_PACKAGES]
+    param_names = ["package"]
+
+    def setup_cache(self):
+        # Discard the first run, which may compile and cache bytecode.
+        measure_import()
+        runs = [measure_import() for _ in range(NUM_RUNS)]
+        print_heaviest_modules(runs[-1], file=sys.stderr)
+        times = [package_self_times(roots) for roots in runs]
+        return {
+            package: statistics.median(t.get(package, 0.0) for t in times)
+            for package in TRACKED_PACKAGES
+            if any(package in t for t in times)
+        }
+
+    def setup(self, times, package):
+        # Optional dependencies may not be installed.
+        if package not in times:
+            raise NotImplementedError(f"{package=}")
+
+    def track_import_time(self, times, package):
+        return times[package]
+
+    track_import_time.unit = "seconds"  # type: ignore[attr-defined]
@@ -0,0 +1,290 @@
+"""Archive of the structure of the assembled Jacobians of every benchmarked commit.
+
+The sparsity of the Jacobian determines the cost of every linear solve, and fill-in
+added by a change in a single equation slows down all downstream benchmarks. For the
+first Newton iteration of each representative case, the archive stores the number of
+nonzeros of every (equation, variable) block, the bandwidth and structural hashes of
+the matrix and of the rows of each equation. The archive lives next to the asv results
+in ``.asv/jacobians/<commit>/``, one compressed ``.npz`` file per case, and is
+published together with them.
+
+Two commits are compared with ``run_jacobian_diff.py``, which lists the blocks whose
+number of nonzeros changed and the equations whose pattern changed.
+
+"""
+
+import hashlib
+import pathlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import porepy as pp
+import scipy.sparse as sps
+
+from benchmarks.model_setups import (
+    CASE_TIMEOUTS,
+    GEOMETRIES,
+    PHYSICS,
+    default_case_args,
+    make_benchmark_model,
+)
+
+ARCHIVE_DIR = pathlib.Path(__file__).parents[1] / ".asv" / "jacobians"
+
+
+@dataclass
+class JacobianStructure:
+    """Structure of an assembled Jacobian, blocked by equation and variable."""
+
+    equations: list[str]
+    """Names of the equations, the block rows."""
+
+    variables: list[str]
+    """Names of the variables, the block columns."""
+
+    block_nnz: np.ndarray
+    """Number of nonzeros of each (equation, variable) block."""
+
+    equation_hashes: list[str]
+    """Structural hash of the rows of each equation."""
+
+    shape: tuple[int, int]
+    nnz: int
+    bandwidth: int
+    structural_hash: str
+
+
+def _pattern_hash(A: sps.csr_matrix) -> str:
+    """Hash of the sparsity pattern of a matrix with sorted indices."""
+    digest = hashlib.sha256()
+    digest.update(np.asarray(A.shape, dtype=np.int64).tobytes())
+    digest.update(np.diff(A.indptr).astype(np.int64).tobytes())
+    digest.update(A.indices.astype(np.int64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def bandwidth(A: sps.csr_matrix) -> int:
+    """Largest distance of a nonzero from the diagonal."""
+    if A.nnz == 0:
+        return 0
+    rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+    return int(np.abs(rows - A.indices).max())
+
+
+def jacobian_structure(
+    A: sps.spmatrix, equation_system: pp.ad.EquationSystem
+) -> JacobianStructure:
+    """Block structure of a Jacobian assembled by an equation system.
+
+    Parameters:
+        A: The Jacobian, as returned by ``assemble_linear_system``.
+        equation_system: The equation system which assembled it. The rows of the
+            equations are taken from ``assembled_equation_indices``.
+
+    Returns:
+        The structure of the Jacobian. Variables defined on several grids form a
+        single block column.
+
+    """
+    A = sps.csr_matrix(A)
+    A.eliminate_zeros()
+    A.sort_indices()
+
+    variables: list[str] = []
+    column_block = np.full(A.shape[1], -1)
+    for variable in equation_system.variables:
+        if variable.name not in variables:
+            variables.append(variable.name)
+        column_block[equation_system.dofs_of([variable])] = variables.index(
+            variable.name
+        )
+
+    equations = list(equation_system.assembled_equation_indices)
+    block_nnz = np.zeros((len(equations), len(variables)), dtype=np.int64)
+    equation_hashes = []
+    for i, name in enumerate(equations):
+        rows = A[equation_system.assembled_equation_indices[name]]
+        block_nnz[i] = np.bincount(
+            column_block[rows.indices], minlength=len(variables)
+        )
+        equation_hashes.append(_pattern_hash(rows))
+
+    return JacobianStructure(
+        equations=equations,
+        variables=variables,
+        block_nnz=block_nnz,
+        equation_hashes=equation_hashes,
+        shape=A.shape,
+        nnz=A.nnz,
+        bandwidth=bandwidth(A),
+        structural_hash=_pattern_hash(A),
+    )
+
+
+def archive_path(commit: str, case: str) -> pathlib.Path:
+    return ARCHIVE_DIR / commit[:8] / f"{case}.npz"
+
+
+def save_structure(path: pathlib.Path, structure: JacobianStructure) -> None:
+    """Write a structure to a compressed ``.npz`` file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        equations=np.array(structure.equations),
+        variables=np.array(structure.variables),
+        block_nnz=structure.block_nnz,
+        equation_hashes=np.array(structure.equation_hashes),
+        shape=np.array(structure.shape),
+        nnz=structure.nnz,
+        bandwidth=structure.bandwidth,
+        structural_hash=structure.structural_hash,
+    )
+
+
+def load_structure(path: pathlib.Path) -> JacobianStructure:
+    """Read a structure written by :func:`save_structure`."""
+    with np.load(path) as data:
+        return JacobianStructure(
+            equations=data["equations"].tolist(),
+            variables=data["variables"].tolist(),
+            block_nnz=data["block_nnz"],
+            equation_hashes=data["equation_hashes"].tolist(),
+            shape=tuple(data["shape"].tolist()),
+            nnz=int(data["nnz"]),
+            bandwidth=int(data["bandwidth"]),
+            structural_hash=str(data["structural_hash"]),
+        )
+
+
+def _block_nnz(structure: JacobianStructure, row: int, variable: str) -> int:
+    if variable not in structure.variables:
+        return 0
+    return int(structure.block_nnz[row, structure.variables.index(variable)])
+
+
+def diff_structures(old: JacobianStructure, new: JacobianStructure) -> list[str]:
+    """Describe the differences between two structures, one line per difference.
+
+    Parameters:
+        old: The structure of the earlier commit.
+        new: The structure of the later commit.
+
+    Returns:
+        Changes of the matrix size, nonzeros and bandwidth, added or removed
+        equations and variables, blocks with a different number of nonzeros, and
+        equations with the same nonzeros per block but a different pattern. The
+        list is empty if the structures are identical.
+
+    """
+    if old.structural_hash == new.structural_hash:
+        return []
+
+    lines = []
+    for name, before, after in (
+        ("shape", old.shape, new.shape),
+        ("nnz", old.nnz, new.nnz),
+        ("bandwidth", old.bandwidth, new.bandwidth),
+    ):
+        if before != after:
+            lines.append(f"{name}: {before} -> {after}")
+    for kind, before, after in (
+        ("equation", old.equations, new.equations),
+        ("variable", old.variables, new.variables),
+    ):
+        lines += [f"removed {kind}: {name}" for name in before if name not in after]
+        lines += [f"added {kind}: {name}" for name in after if name not in before]
+
+    changed_blocks: list[tuple[int, str]] = []
+    for i, equation in enumerate(new.equations):
+        if equation not in old.equations:
+            continue
+        k = old.equations.index(equation)
+        num_changed = len(changed_blocks)
+        for variable in sorted(set(old.variables) | set(new.variables)):
+            before = _block_nnz(old, k, variable)
+            after = _block_nnz(new, i, variable)
+            if before != after:
+                changed_blocks.append(
+                    (
+                        after - before,
+                        f"block ({equation}, {variable}): nnz {before} -> {after} "
+                        f"({after - before:+d})",
+                    )
+                )
+        # Nonzeros moved within the blocks of the equation.
+        unchanged_blocks = len(changed_blocks) == num_changed
+        if unchanged_blocks and old.equation_hashes[k] != new.equation_hashes[i]:
+            lines.append(f"pattern changed: {equation}")
+    # Largest fill-in first.
+    lines += [line for _, line in sorted(changed_blocks, key=lambda b: -abs(b[0]))]
+    return lines
+
+
+def record_structures(commit: Optional[str] = None) -> dict[str, JacobianStructure]:
+    """Assemble the representative cases and archive their Jacobian structures.
+
+    Parameters:
+        commit: The PorePy commit the archive is filed under. Defaults to the commit
+            of the installed PorePy. If it cannot be determined, nothing is archived.
+
+    Returns:
+        The structure of each case, keyed by ``"<physics>-<geometry>"``.
+
+    """
+    # Imported here, since importing the base model limits the threads of the process.
+    from benchmarks.larger_models.base_model import porepy_commit
+
+    commit = commit or porepy_commit()
+    structures = {}
+    for physics in PHYSICS:
+        for geometry in GEOMETRIES:
+            args = default_case_args(physics, geometry)
+            if CASE_TIMEOUTS[(physics, geometry, args["grid_refinement"])] is None:
+                continue
+            model = make_benchmark_model(args, cached=True)
+            model.prepare_simulation()
+            model.before_nonlinear_loop()
+            model.before_nonlinear_iteration()
+            model.assemble_linear_system()
+            case = f"{physics}-{geometry}"
+            structures[case] = jacobian_structure(
+                model.linear_system[0], model.equation_system
+            )
+            if commit is not None:
+                save_structure(archive_path(commit, case), structures[case])
+    return structures
+
+
+class JacobianSize:
+    """Nonzeros and bandwidth of the Jacobian of the first Newton iteration."""
+
+    params = [PHYSICS, GEOMETRIES]
+    param_names = ["physics", "geometry"]
+    timeout = 1800
+
+    def setup_cache(self):
+        return {
+            case: (structure.nnz, structure.shape[0], structure.bandwidth)
+            for case, structure in record_structures().items()
+        }
+
+    def setup(self, sizes, physics, geometry):
+        if f"{physics}-{geometry}" not in sizes:
+            raise NotImplementedError(f"{physics=}, {geometry=}")
+
+    def track_nnz(self, sizes, physics, geometry):
+        return sizes[f"{physics}-{geometry}"][0]
+
+    track_nnz.unit = "nonzeros"  # type: ignore[attr-defined]
+
+    def track_nnz_per_row(self, sizes, physics, geometry):
+        nnz, num_rows, _ = sizes[f"{physics}-{geometry}"]
+        return nnz / num_rows
+
+    track_nnz_per_row.unit = "nonzeros"  # type: ignore[attr-defined]
+
+    def track_bandwidth(self, sizes, physics, geometry):
+        return sizes[f"{physics}-{geometry}"][2]
+
+    track_bandwidth.unit = "rows"  # type: ignore[attr-defined]
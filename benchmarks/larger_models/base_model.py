@@ -4,16 +4,124 @@ os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
+import json
+import pathlib
+import subprocess
+from contextlib import contextmanager
 import porepy as pp
 import numpy as np
 from time import time
 import scipy.sparse as sps
 
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 
 from porepy.numerics.ad import _ad_utils
 
 
+def unique_discretizations(equation_system: pp.ad.EquationSystem) -> dict:
+    """The discretizations of all equations, with the grids to discretize them on.
+
+    Parameters:
+        equation_system: The equation system of a model.
+
+    Returns:
+        The unique discretizations as keys, the subdomains or interfaces as values.
+
+    """
+    # This is copied from EquationSystem.discretize
+    equation_names = [key for key in equation_system.equations]
+    discr = []
+    for name in equation_names:
+        # this raises a key error if a given equation name is unknown
+        eqn = equation_system._equations[name]
+        # This will expand the list discr with new discretizations.
+        # The list may contain duplicates.
+        discr += equation_system._recursive_discretization_search(eqn, list())
+
+    # Uniquify to save computational time.
+    return _ad_utils.uniquify_discretization_list(discr)
+
+
+def discretize_on_grid(mdg: pp.MixedDimensionalGrid, discr, g) -> None:
+    """Discretize on a subdomain or interface, as ``_ad_utils.discretize`` does.
+
+    Parameters:
+        mdg: The mixed-dimensional grid containing ``g``.
+        discr: The discretization.
+        g: A subdomain or a mortar grid.
+
+    """
+    if isinstance(g, pp.MortarGrid):
+        data = mdg.interface_data(g)  # type:ignore
+        g_primary, g_secondary = mdg.interface_to_subdomain_pair(g)
+        d_primary = mdg.subdomain_data(g_primary)
+        d_secondary = mdg.subdomain_data(g_secondary)
+        discr.discretize(g_primary, g_secondary, g, d_primary, d_secondary, data)
+    else:
+        data = mdg.subdomain_data(g)
+        try:
+            discr.discretize(g, data)
+        except NotImplementedError:
+            # This will likely be GradP and other Biot discretizations
+            pass
+
+
+def _operator_parse_method() -> tuple[type, str] | None:
+    """The owner and name of the recursive parsing method of Ad operators.
+
+    The method has moved between PorePy versions. None if it is not found.
+
+    """
+    for owner in (pp.ad.EquationSystem, pp.ad.Operator):
+        if "_parse_operator" in vars(owner):
+            return owner, "_parse_operator"
+    return None
+
+
+@contextmanager
+def equation_parsing_timer(equations: dict[int, str], times: dict[str, float]):
+    """Time the parsing of the operator of each equation within the block.
+
+    The parsing method of PorePy is wrapped, and the calls on the operators of the
+    equations are timed, not the nested calls on their subtrees. Thus, the equations
+    are timed within the single evaluation of all of them by ``EquationSystem``.
+
+    Parameters:
+        equations: The names of the equations, by the id of their operators.
+        times: The parsing time of each equation in seconds is added to this.
+
+    """
+    location = _operator_parse_method()
+    if location is None:
+        yield
+        return
+    owner, name = location
+    original = getattr(owner, name)
+    depth = 0
+
+    def _parse_operator(*args, **kwargs):
+        nonlocal depth
+        # The operator is the first operator argument besides ``self``, or ``self``
+        # for an operator method.
+        operators = [a for a in args[1:] if isinstance(a, pp.ad.Operator)]
+        op = operators[0] if operators else args[0] if args else None
+        equ_name = equations.get(id(op)) if depth == 0 else None
+        depth += 1
+        tic = time()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            depth -= 1
+            if equ_name is not None:
+                times[equ_name] = times.get(equ_name, 0.0) + time() - tic
+
+    setattr(owner, name, _parse_operator)
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
 @dataclass
 class TimeMeasurements:
     """Class for storing time measurements."""
@@ -34,12 +142,67 @@ class TimeMeasurements:
     after_nonlinear_iteration: float = 0
     check_nonlinear_convergence: float = 0
 
+    def flatten(self) -> dict[str, float]:
+        """All timings as a flat dictionary of total times in seconds.
+
+        Lists of repeated measurements are summed. Granular timings are prefixed with
+        ``"assembly: "`` and ``"discretization: "``, respectively. If the granular
+        assembly was only timed for a sample of the assemblies, its total is
+        extrapolated to all of them.
+
+        """
+        flat = {}
+        for key, value in asdict(self).items():
+            if key == "granular_assembly":
+                for name, times in value.items():
+                    flat[f"assembly: {name}"] = (
+                        sum(times) / len(times) * len(self.full_assembly)
+                    )
+            elif key == "granular_discretization":
+                for name, t in value.items():
+                    flat[f"discretization: {name}"] = t
+            elif isinstance(value, list):
+                flat[key] = sum(value)
+            else:
+                flat[key] = value
+        return flat
+
+
+def porepy_commit() -> str | None:
+    """The commit of the PorePy installation, if it can be determined.
+
+    asv provides the commit in the environment of the benchmark processes, otherwise it
+    is read from the git repository of an editable PorePy installation.
+
+    """
+    if "ASV_COMMIT" in os.environ:
+        return os.environ["ASV_COMMIT"]
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=pathlib.Path(pp.__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
 
 class TimedSolutionStrategy(pp.SolutionStrategy):
-    """A solution strategy that measures the time taken by the different components."""
+    """A solution strategy that measures the time taken by the different components.
+
+    After the simulation, the timings are printed and appended as a JSON line to the
+    file given by the model parameter ``"timings_file"`` (default ``timings.jsonl``).
+    Set the parameter to ``None`` to disable the export.
+
+    """
 
     def __init__(self, params: dict):
         super().__init__(params)
+        if self.params.get("granular_assembly_sampling", 1) < 1:
+            raise ValueError("granular_assembly_sampling must be at least 1.")
 
         self._timings = TimeMeasurements()
 
@@ -63,19 +226,7 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
     def discretize(self):
         full_time = time()
 
-        # This is copied from EquationSystem.discretize
-        equation_names = [key for key in self.equation_system.equations]
-        discr = []
-        for name in equation_names:
-            # this raises a key error if a given equation name is unknown
-            eqn = self.equation_system._equations[name]
-            # This will expand the list discr with new discretizations.
-            # The list may contain duplicates.
-            discr += self.equation_system._recursive_discretization_search(eqn, list())
-
-        # Uniquify to save computational time, then discretize.
-        unique_discr = _ad_utils.uniquify_discretization_list(discr)
-
+        unique_discr = unique_discretizations(self.equation_system)
         self._discretize_from_list(unique_discr)
         self._timings.full_discretization += time() - full_time
 
@@ -109,21 +260,7 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
 
             for g in unique_discr[discr]:
                 tic = time()
-                if isinstance(g, pp.MortarGrid):
-                    data = mdg.interface_data(g)  # type:ignore
-                    g_primary, g_secondary = mdg.interface_to_subdomain_pair(g)
-                    d_primary = mdg.subdomain_data(g_primary)
-                    d_secondary = mdg.subdomain_data(g_secondary)
-                    discr.discretize(
-                        g_primary, g_secondary, g, d_primary, d_secondary, data
-                    )
-                else:
-                    data = mdg.subdomain_data(g)
-                    try:
-                        discr.discretize(g, data)
-                    except NotImplementedError:
-                        # This will likely be GradP and other Biot discretizations
-                        pass
+                discretize_on_grid(mdg, discr, g)
                 toc = time() - tic
 
                 name = discr.__class__.__name__
@@ -172,10 +309,11 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
 
     def assemble_linear_system(self):
         # This is copied from EquationSystem!
-        # Be aware that the equation system is assemled twice, once by a standard
-        # assembly (all equations) and once by a granular assembly (equation by
-        # equation). The granular assembly is used to measure the time spent on each
-        # equation.
+        # To measure the time spent on each equation, the parsing of each equation is
+        # timed within the single evaluation of all equations, see
+        # equation_parsing_timer. For long runs, the model parameter
+        # "granular_assembly_sampling" = n restricts the granular timings to every n-th
+        # assembly, which avoids the small overhead of the timing on the others.
 
         equation_system = self.equation_system
 
@@ -204,8 +342,22 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
         ]
         rows = list(equ_blocks.values())
 
+        sampling = self.params.get("granular_assembly_sampling", 1)
+        granular = len(self._timings.full_assembly) % sampling == 0
+
         tic = time()
-        ad_list: list[pp.ad.AdArray] = equation_system.evaluate(eqs, True, None)
+        if granular:
+            times: dict[str, float] = {}
+            equations = {id(eq): equ_name for equ_name, eq in zip(equ_blocks, eqs)}
+            with equation_parsing_timer(equations, times):
+                ad_list: list[pp.ad.AdArray] = equation_system.evaluate(
+                    eqs, True, None
+                )
+            tm = self._timings.granular_assembly
+            for equ_name, t in times.items():
+                tm.setdefault(equ_name, []).append(t)
+        else:
+            ad_list = equation_system.evaluate(eqs, True, None)
 
         for row, equ_name, ad in zip(rows, equ_blocks, ad_list):
             if row is not None:
@@ -243,16 +395,6 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
 
         self._timings.full_assembly.append(time() - tic)
 
-        # Granular timings
-        tm = self._timings.granular_assembly
-        for name, eq in equation_system.equations.items():
-            tic = time()
-            equation_system.evaluate(eq, True, None)
-            if name in tm:
-                tm[name].append(time() - tic)
-            else:
-                tm[name] = [time() - tic]
-
     def save_data_time_step(self) -> None:
         """Export the model state at a given time step and log time.
 
@@ -346,9 +488,7 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
             )
             for key in assembly_sorted:
                 value = self._timings.granular_assembly[key]
-                print(
-                    f"Average assembly time for {key}: {sum(value) / num_assemblies:.2e}s"
-                )
+                print(f"Average assembly time for {key}: {np.mean(value):.2e}s")
         else:  # Should be more than 3
             # Print both the average and the standard deviation on the same line
             print(
@@ -360,7 +500,7 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
             for key in assembly_sorted:
                 value = self._timings.granular_assembly[key]
                 print(
-                    f"Average assembly time for {key}: {sum(value) / num_assemblies:.2e}s",
+                    f"Average assembly time for {key}: {np.mean(value):.2e}s",
                     " +/- ",
                     f"{np.std(value):.2e}",
                 )
@@ -379,3 +519,24 @@ class TimedSolutionStrategy(pp.SolutionStrategy):
         for key in discretization_sorted:
             value = self._timings.granular_discretization[key]
             print(f"Discretization time for {key}: {value:.2e}s")
+
+        self.export_timings()
+
+    def timings_record(self) -> dict:
+        """Machine-readable record of the timings and the model they belong to."""
+        return {
+            "commit": porepy_commit(),
+            "porepy_version": pp.__version__,
+            "model": type(self).__name__,
+            "num_dofs": int(self.equation_system.num_dofs()),
+            "num_assemblies": len(self._timings.full_assembly),
+            "timings": self._timings.flatten(),
+        }
+
+    def export_timings(self) -> None:
+        """Append the timings record to the file set in ``params["timings_file"]``."""
+        timings_file = self.params.get("timings_file", "timings.jsonl")
+        if timings_file is None:
+            return
+        with open(timings_file, "a") as f:
+            f.write(json.dumps(self.timings_record()) + "\n")
@@ -10,7 +10,11 @@ from time import time
 import scipy.sparse as sps
 
 
-from base_model import TimedSolutionStrategy
+# Run as a script, or imported through the benchmarks package.
+if __package__:
+    from .base_model import TimedSolutionStrategy
+else:
+    from base_model import TimedSolutionStrategy
 from porepy.examples.flow_benchmark_2d_case_4 import (
     FlowBenchmark2dCase4Model,
     solid_constants,
@@ -11,7 +11,11 @@ import scipy.sparse as sps
 
 from porepy.numerics.nonlinear import line_search
 
-from base_model import TimedSolutionStrategy
+# Run as a script, or imported through the benchmarks package.
+if __package__:
+    from .base_model import TimedSolutionStrategy
+else:
+    from base_model import TimedSolutionStrategy
 from porepy.examples.flow_benchmark_2d_case_4 import (
     Geometry as FlowBenchmark2dCase4Geometry,
     solid_constants,
@@ -10,7 +10,11 @@ import numpy as np
 import time
 from porepy.numerics.nonlinear import line_search
 
-from base_model import TimedSolutionStrategy
+# Run as a script, or imported through the benchmarks package.
+if __package__:
+    from .base_model import TimedSolutionStrategy
+else:
+    from base_model import TimedSolutionStrategy
 from porepy.examples.flow_benchmark_2d_case_3 import (
     Geometry as FlowBenchmark2dCase3Geometry,
 )
@@ -0,0 +1,178 @@
+"""Comparison of linear solvers on frozen linear systems.
+
+The linear system of the first Newton iteration of each benchmark case is assembled
+once per PorePy version and stored in the model cache (see
+``model_cache.frozen_linear_system``). All solvers then work on the same matrix, and
+their setup (factorization, preconditioner) and solve phases are timed separately.
+Iterative solvers additionally report their number of iterations, and all solvers the
+relative residual of their solution.
+
+Solvers depending on optional packages (pypardiso, pyamg) are skipped if these are not
+installed.
+
+"""
+
+import importlib.util
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sps
+import scipy.sparse.linalg as spla
+
+from benchmarks.model_cache import frozen_linear_system
+from benchmarks.model_setups import (
+    CASE_TIMEOUTS,
+    GEOMETRIES,
+    PHYSICS,
+    default_case_args,
+)
+
+# Tolerance and iteration limits of the iterative solvers.
+RTOL = 1e-8
+RESTART = 50
+MAX_RESTARTS = 20
+
+
+class LinearSolver:
+    """A linear solver, split into a setup and a solve phase."""
+
+    requires: Optional[str] = None
+    """Optional package the solver depends on."""
+
+    def setup(self, A: sps.csr_matrix) -> None:
+        pass
+
+    def solve(self, A: sps.csr_matrix, b: np.ndarray) -> tuple[np.ndarray, int]:
+        """Solve the system and return the solution and the number of iterations."""
+        raise NotImplementedError
+
+
+class SciPySpsolve(LinearSolver):
+    """``scipy.sparse.linalg.spsolve``, which factorizes within the solve."""
+
+    def solve(self, A, b):
+        return spla.spsolve(A, b), 1
+
+
+class SciPySuperLU(LinearSolver):
+    """SuperLU factorization, reused by the solve."""
+
+    def setup(self, A):
+        self.lu = spla.splu(A.tocsc())
+
+    def solve(self, A, b):
+        return self.lu.solve(b), 1
+
+
+class PyPardiso(LinearSolver):
+    """The Intel MKL Pardiso solver through pypardiso."""
+
+    requires = "pypardiso"
+
+    def setup(self, A):
+        import pypardiso
+
+        self.solver = pypardiso.PyPardisoSolver()
+        self.solver.factorize(A)
+
+    def solve(self, A, b):
+        # The factorization of the setup is reused for the same matrix.
+        return self.solver.solve(A, b), 1
+
+
+class _PreconditionedGMRES(LinearSolver):
+    """Restarted GMRES with the preconditioner built in ``setup``."""
+
+    preconditioner: spla.LinearOperator
+
+    def solve(self, A, b):
+        iterations = 0
+
+        def count(_):
+            nonlocal iterations
+            iterations += 1
+
+        x, _ = spla.gmres(
+            A,
+            b,
+            M=self.preconditioner,
+            rtol=RTOL,
+            restart=RESTART,
+            maxiter=MAX_RESTARTS,
+            callback=count,
+            callback_type="pr_norm",
+        )
+        return x, iterations
+
+
+class GMRESILU(_PreconditionedGMRES):
+    """GMRES preconditioned by an incomplete LU factorization."""
+
+    def setup(self, A):
+        try:
+            ilu = spla.spilu(A.tocsc())
+        except RuntimeError as error:
+            # E.g. a zero pivot in the saddle-point systems of poromechanics.
+            raise NotImplementedError(f"No incomplete LU factorization: {error}")
+        self.preconditioner = spla.LinearOperator(A.shape, ilu.solve)
+
+
+class GMRESAMG(_PreconditionedGMRES):
+    """GMRES preconditioned by a smoothed aggregation AMG V-cycle."""
+
+    requires = "pyamg"
+
+    def setup(self, A):
+        import pyamg
+
+        self.preconditioner = pyamg.smoothed_aggregation_solver(A).aspreconditioner()
+
+
+SOLVERS: dict[str, type[LinearSolver]] = {
+    "spsolve": SciPySpsolve,
+    "superlu": SciPySuperLU,
+    "pypardiso": PyPardiso,
+    "gmres_ilu": GMRESILU,
+    "gmres_amg": GMRESAMG,
+}
+
+
+class LinearSolvers:
+    """Setup and solve time, iterations and residual of each solver and case."""
+
+    params = [PHYSICS, GEOMETRIES, list(SOLVERS)]
+    param_names = ["physics", "geometry", "solver"]
+    timeout = 1800
+    number = 1
+    repeat = (1, 5, 300.0)
+
+    def setup(self, physics, geometry, solver):
+        args = default_case_args(physics, geometry)
+        if CASE_TIMEOUTS[(physics, geometry, args["grid_refinement"])] is None:
+            raise NotImplementedError(f"{physics=}, {geometry=}")
+        solver_class = SOLVERS[solver]
+        if solver_class.requires and not importlib.util.find_spec(
+            solver_class.requires
+        ):
+            raise NotImplementedError(f"{solver_class.requires} is not installed.")
+
+        self.A, self.b = frozen_linear_system(args)
+        self.solver = solver_class()
+        self.solver.setup(self.A)
+
+    def time_setup(self, physics, geometry, solver):
+        self.solver.setup(self.A)
+
+    def time_solve(self, physics, geometry, solver):
+        self.solver.solve(self.A, self.b)
+
+    def track_iterations(self, physics, geometry, solver):
+        return self.solver.solve(self.A, self.b)[1]
+
+    track_iterations.unit = "iterations"  # type: ignore[attr-defined]
+
+    def track_relative_residual(self, physics, geometry, solver):
+        x, _ = self.solver.solve(self.A, self.b)
+        return np.linalg.norm(self.b - self.A @ x) / np.linalg.norm(self.b)
+
+    track_relative_residual.unit = "relative residual"  # type: ignore[attr-defined]
@@ -0,0 +1,258 @@
+"""Memory benchmarks of the model lifecycle.
+
+``PeakMemory`` records the peak resident memory of the process with asv. Note that asv
+measures the peak over the whole benchmark process, including ``setup``: the peaks of
+assembly and solve are at least that of preparing the (cached) model.
+
+``TracedAllocations`` isolates the stages. The peak of each stage is the high-water
+mark of the resident memory during the stage above the resident memory before it,
+read from ``/proc/self/status`` after resetting the mark through
+``/proc/self/clear_refs`` (Linux only). This includes the memory allocated in
+compiled code, e.g. the factorization of SuperLU and its fill-in in the solve. The
+memory the stage retains is traced with ``tracemalloc`` and split by the part of
+PorePy which made the allocation. ``tracemalloc`` only sees the allocations of the
+Python memory allocator, which includes the arrays of numpy and scipy but not the
+memory allocated by compiled libraries themselves, so the retained memory is a lower
+bound. The largest allocation sites of each stage are printed to stderr, use
+``--show-stderr`` to see them in the asv log.
+
+"""
+
+import os
+import sys
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.model_matrix import ModelMatrix
+from benchmarks.model_setups import (
+    GEOMETRIES,
+    PHYSICS,
+    make_benchmark_model,
+    start_case_budget,
+    stop_case_budget,
+)
+
+STAGES = ["prepare_simulation", "assemble_linear_system", "solve_linear_system"]
+
+# Allocations are attributed to the innermost PorePy frame of their traceback, and
+# grouped by the location of that frame in the PorePy package. Allocations without a
+# PorePy frame, or in other parts of PorePy, count as "other".
+ALLOCATION_GROUPS: dict[str, tuple[str, ...]] = {
+    "ad": ("numerics/ad/",),
+    "discretization": (
+        "numerics/fv/",
+        "numerics/vem/",
+        "numerics/interface_laws/",
+    ),
+    "grids": ("grids/", "fracs/"),
+    "models": ("models/",),
+}
+
+# Number of frames stored per allocation, needed to see past scipy and numpy frames.
+TRACEBACK_DEPTH = 25
+
+# Number of allocation sites printed per stage.
+NUM_TOP_SITES = 10
+
+
+def _porepy_location(traceback: tracemalloc.Traceback) -> tuple[str, int] | None:
+    """Innermost frame of a traceback within PorePy, as path relative to the package."""
+    # Tracebacks are ordered from the oldest to the most recent frame.
+    for frame in reversed(traceback):
+        path = frame.filename.replace(os.sep, "/")
+        if "/porepy/" in path:
+            return path.rsplit("/porepy/", 1)[1], frame.lineno
+    return None
+
+
+def _group(location: tuple[str, int] | None) -> str:
+    if location is not None:
+        for group, prefixes in ALLOCATION_GROUPS.items():
+            if location[0].startswith(prefixes):
+                return group
+    return "other"
+
+
+def _status_bytes(field: str) -> int:
+    """A memory field of ``/proc/self/status``, e.g. ``VmHWM``, in bytes."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise OSError(f"{field} is not in /proc/self/status.")
+
+
+def reset_peak_rss() -> bool:
+    """Reset the high-water mark of the resident memory of the process.
+
+    Returns:
+        Whether the mark could be reset, only possible on Linux.
+
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def trace_stages(args: dict) -> dict[str, dict]:
+    """Trace the allocations of each stage of a single Newton iteration.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``.
+
+    Returns:
+        For each stage in :data:`STAGES`, a dictionary with the peak resident bytes
+        of the stage (``"peak"``, None if it cannot be measured), the traced bytes
+        retained after the stage per allocation group (``"groups"``) and the largest
+        allocation sites by retained bytes (``"sites"``).
+
+    """
+    model = make_benchmark_model(args)
+    stages = {
+        "prepare_simulation": [model.prepare_simulation],
+        "assemble_linear_system": [
+            model.before_nonlinear_loop,
+            model.before_nonlinear_iteration,
+            model.assemble_linear_system,
+        ],
+        "solve_linear_system": [model.solve_linear_system],
+    }
+
+    results = {}
+    tracemalloc.start(TRACEBACK_DEPTH)
+    try:
+        for stage, calls in stages.items():
+            before = tracemalloc.take_snapshot()
+            tracing_before = tracemalloc.get_tracemalloc_memory()
+            baseline = _status_bytes("VmRSS")
+            measured = reset_peak_rss()
+            for call in calls:
+                call()
+            peak = None
+            if measured:
+                # The traces of the new allocations are resident as well.
+                tracing = tracemalloc.get_tracemalloc_memory() - tracing_before
+                peak = _status_bytes("VmHWM") - baseline - tracing
+            after = tracemalloc.take_snapshot()
+
+            groups: dict[str, int] = {group: 0 for group in ALLOCATION_GROUPS}
+            groups["other"] = 0
+            sites: dict[str, int] = defaultdict(int)
+            for stat in after.compare_to(before, "traceback"):
+                location = _porepy_location(stat.traceback)
+                groups[_group(location)] += stat.size_diff
+                site = "<outside porepy>" if location is None else "%s:%d" % location
+                sites[site] += stat.size_diff
+
+            top = sorted(sites.items(), key=lambda item: item[1], reverse=True)
+            results[stage] = {
+                "peak": peak,
+                "groups": groups,
+                "sites": top[:NUM_TOP_SITES],
+            }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+class PeakMemory(ModelMatrix):
+    """Peak resident memory of the process, including setup."""
+
+    def setup(self, physics, geometry, grid_refinement):
+        self.model = self.make_model(physics, geometry, grid_refinement)
+
+    def peakmem_prepare_simulation(self, physics, geometry, grid_refinement):
+        self.model.prepare_simulation()
+
+    def peakmem_single_iteration(self, physics, geometry, grid_refinement):
+        # Prepare, assemble and solve. Assembly and solve alone cannot be isolated, as
+        # the peak includes setup.
+        self.model.prepare_simulation()
+        self.model.before_nonlinear_loop()
+        self.model.before_nonlinear_iteration()
+        self.model.assemble_linear_system()
+        self.model.solve_linear_system()
+
+
+class TracedAllocations:
+    """Per-stage allocations on the coarsest grids, measured with ``tracemalloc``.
+
+    Tracing slows down the simulation considerably, so only the coarsest grid of every
+    case is traced, once, in ``setup_cache``. Cases which exceed their time budget or
+    fail are skipped.
+
+    """
+
+    params = [PHYSICS, GEOMETRIES, STAGES]
+    param_names = ["physics", "geometry", "stage"]
+    timeout = 3600
+
+    def setup_cache(self):
+        traces = {}
+        for physics in PHYSICS:
+            for geometry in GEOMETRIES:
+                args = {
+                    "physics": physics,
+                    "geometry": geometry,
+                    "grid_refinement": 0,
+                }
+                try:
+                    start_case_budget(physics, geometry, args["grid_refinement"])
+                except NotImplementedError:
+                    continue
+                try:
+                    traces[(physics, geometry)] = trace_stages(args)
+                except TimeoutError:
+                    print(f"{physics=}, {geometry=} timed out.", file=sys.stderr)
+                    continue
+                except Exception as err:
+                    print(f"{physics=}, {geometry=} failed: {err!r}", file=sys.stderr)
+                    continue
+                finally:
+                    stop_case_budget()
+                for stage, trace in traces[(physics, geometry)].items():
+                    print(
+                        f"Largest allocation sites of {stage} ({physics=}, "
+                        f"{geometry=}):",
+                        file=sys.stderr,
+                    )
+                    for site, size in trace["sites"]:
+                        print(f"    {size / 2**20:10.2f} MiB  {site}", file=sys.stderr)
+        return traces
+
+    def setup(self, traces, physics, geometry, stage):
+        if (physics, geometry) not in traces:
+            raise NotImplementedError(f"{physics=}, {geometry=}")
+
+    def track_peak(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["peak"]
+
+    track_peak.unit = "bytes"  # type: ignore[attr-defined]
+
+    def track_retained_ad(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["groups"]["ad"]
+
+    track_retained_ad.unit = "bytes"  # type: ignore[attr-defined]
+
+    def track_retained_discretization(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["groups"]["discretization"]
+
+    track_retained_discretization.unit = "bytes"  # type: ignore[attr-defined]
+
+    def track_retained_grids(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["groups"]["grids"]
+
+    track_retained_grids.unit = "bytes"  # type: ignore[attr-defined]
+
+    def track_retained_models(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["groups"]["models"]
+
+    track_retained_models.unit = "bytes"  # type: ignore[attr-defined]
+
+    def track_retained_other(self, traces, physics, geometry, stage):
+        return traces[(physics, geometry)][stage]["groups"]["other"]
+
+    track_retained_other.unit = "bytes"  # type: ignore[attr-defined]
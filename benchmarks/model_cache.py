@@ -0,0 +1,354 @@
+"""On-disk cache of meshed and discretized benchmark models.
+
+Meshing with gmsh and the MPFA/MPSA discretizations dominate the setup of the
+benchmark suites, yet they only depend on the PorePy sources and the benchmark case.
+This module stores the mixed-dimensional grid and the discretization matrices of a
+case after its first (cold) preparation. The cache entries are content-addressed by a
+hash of the installed PorePy sources and the arguments passed to
+:func:`~benchmarks.model_setups.make_benchmark_model`. Later setups load the grid from a
+pickle and the matrices from memory-mapped ``.npy`` files instead of recomputing them.
+
+The cache lives in ``~/.cache/porepy-profiling`` by default, this can be changed with
+the ``POREPY_PROFILING_CACHE`` environment variable. It is deliberately kept outside
+``.asv/``, so that ``job.sh`` does not publish it. Since every benchmarked commit adds
+its own entries, the least recently used entries are evicted whenever a new entry is
+written, such that the cache stays below ``POREPY_PROFILING_CACHE_SIZE`` gigabytes
+(10 by default).
+
+"""
+
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import shutil
+import tempfile
+from typing import Any, Iterator, Optional, Type
+from unittest import mock
+
+import numpy as np
+import porepy as pp
+import scipy.sparse as sps
+
+# Bump this if the layout of a cache entry changes.
+CACHE_FORMAT_VERSION = 1
+
+_MANIFEST = "manifest.json"
+_GRID_FILE = "mdg.pkl"
+
+
+def cache_dir() -> pathlib.Path:
+    """Root directory of the model cache."""
+    default = pathlib.Path.home() / ".cache" / "porepy-profiling"
+    return pathlib.Path(os.environ.get("POREPY_PROFILING_CACHE", default))
+
+
+def cache_size_limit() -> int:
+    """Maximum size of the model cache in bytes."""
+    return int(float(os.environ.get("POREPY_PROFILING_CACHE_SIZE", 10)) * 1e9)
+
+
+@functools.cache
+def porepy_source_hash() -> str:
+    """Hash of all Python sources of the installed PorePy package.
+
+    This identifies the PorePy commit without relying on git metadata, which is not
+    available in the environments built by asv.
+
+    """
+    root = pathlib.Path(pp.__file__).parent
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob("*.py")):
+        digest.update(path.relative_to(root).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def cache_key(args: dict) -> str:
+    """Content-addressed key of a benchmark case.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``, e.g. geometry,
+            grid_refinement and physics.
+
+    Returns:
+        A hex digest identifying the case for the installed PorePy sources.
+
+    """
+    payload = {
+        "format": CACHE_FORMAT_VERSION,
+        "porepy": porepy_source_hash(),
+        "args": {key: args[key] for key in sorted(args)},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:24]
+
+
+class CachedModelMixin:
+    """Model mixin which reuses the grid and discretization matrices from the cache.
+
+    On a cache miss, the model is prepared as usual and the cache entry is written
+    after discretization. On a cache hit, the meshing step in ``set_geometry`` and the
+    whole of ``discretize`` are replaced by loading the stored data. All other steps of
+    ``prepare_simulation`` (variables, equations, parameters) run unchanged.
+
+    """
+
+    _cache_entry: pathlib.Path
+    """Directory of the cache entry of this model, set by :func:`with_model_cache`."""
+
+    _cache_hit: bool = False
+    """Whether the grid of this model was loaded from the cache."""
+
+    _mdg_pickle: Optional[bytes] = None
+    """The pickled grid on a cache miss, stored before any data is attached to it."""
+
+    mdg: pp.MixedDimensionalGrid
+
+    def set_geometry(self) -> None:
+        grid_file = self._cache_entry / _GRID_FILE
+        if not (self._cache_entry / _MANIFEST).exists():
+            super().set_geometry()  # type: ignore[misc]
+            self._mdg_pickle = pickle.dumps(self.mdg, protocol=pickle.HIGHEST_PROTOCOL)
+            return
+
+        _mark_used(self._cache_entry)
+        with open(grid_file, "rb") as f:
+            mdg = pickle.load(f)
+        # Only the meshing step is replaced, the rest of the geometry setup (domain,
+        # fracture network, local coordinates) runs as usual.
+        with mock.patch.object(pp, "create_mdg", return_value=mdg):
+            super().set_geometry()  # type: ignore[misc]
+        # Geometries which do not mesh through ``pp.create_mdg`` are not cacheable, the
+        # discretization matrices would not match the freshly created grid.
+        self._cache_hit = self.mdg is mdg
+
+    def discretize(self) -> None:
+        if self._cache_hit:
+            load_discretization_matrices(self.mdg, self._cache_entry)
+            return
+
+        super().discretize()  # type: ignore[misc]
+        if self._mdg_pickle is not None:
+            write_cache_entry(self.mdg, self._mdg_pickle, self._cache_entry)
+            self._mdg_pickle = None
+
+
+def with_model_cache(model_class: Type, args: dict) -> Type:
+    """Wrap a benchmark model class to use the on-disk cache.
+
+    Parameters:
+        model_class: The model class selected by ``make_benchmark_model``.
+        args: The arguments which define the benchmark case, used for the cache key.
+
+    Returns:
+        A subclass of ``model_class`` with :class:`CachedModelMixin` mixed in.
+
+    """
+    return type(
+        model_class.__name__,
+        (CachedModelMixin, model_class),
+        {"_cache_entry": cache_dir() / cache_key(args)},
+    )
+
+
+def _grid_data(mdg: pp.MixedDimensionalGrid) -> list[tuple[str, dict]]:
+    """Data dictionaries of all subdomains and interfaces in a deterministic order."""
+    data = [("subdomain", mdg.subdomain_data(sd)) for sd in mdg.subdomains()]
+    data += [("interface", mdg.interface_data(intf)) for intf in mdg.interfaces()]
+    return data
+
+
+def _save_value(directory: pathlib.Path, stem: str, value: Any) -> dict:
+    """Save a single discretization matrix and return its manifest entry."""
+    if sps.issparse(value):
+        storage = value.format if value.format in ("csr", "csc") else "csr"
+        stored = value.asformat(storage)
+        for name in ("data", "indices", "indptr"):
+            np.save(directory / f"{stem}_{name}.npy", getattr(stored, name))
+        return {
+            "kind": "sparse",
+            "stem": stem,
+            "storage": storage,
+            "format": value.format,
+            "shape": list(value.shape),
+        }
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(directory / f"{stem}.npy", value)
+        return {"kind": "dense", "stem": stem}
+    with open(directory / f"{stem}.pkl", "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"kind": "pickle", "stem": stem}
+
+
+def _load_value(directory: pathlib.Path, entry: dict) -> Any:
+    """Load a single discretization matrix described by a manifest entry."""
+    stem = entry["stem"]
+    if entry["kind"] == "sparse":
+        # Copy-on-write mapping: the matrices are read lazily from disk, but PorePy is
+        # still free to modify them in place.
+        arrays = tuple(
+            np.load(directory / f"{stem}_{name}.npy", mmap_mode="c")
+            for name in ("data", "indices", "indptr")
+        )
+        matrix_class = sps.csc_matrix if entry["storage"] == "csc" else sps.csr_matrix
+        matrix = matrix_class(arrays, shape=tuple(entry["shape"]), copy=False)
+        return matrix.asformat(entry["format"])
+    if entry["kind"] == "dense":
+        return np.load(directory / f"{stem}.npy", mmap_mode="c")
+    with open(directory / f"{stem}.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+@contextlib.contextmanager
+def _new_entry(entry: pathlib.Path) -> Iterator[pathlib.Path]:
+    """Temporary directory for a new cache entry, moved in place when complete."""
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = pathlib.Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+    try:
+        yield tmp
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process has written the same entry in the meantime.
+            if not (entry / _MANIFEST).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict_cache()
+
+
+def _mark_used(entry: pathlib.Path) -> None:
+    """Record the use of a cache entry, for the eviction of unused entries."""
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(entry / _MANIFEST)
+
+
+def evict_cache(max_size: Optional[int] = None) -> None:
+    """Remove the least recently used cache entries until the cache fits its limit.
+
+    An entry is used when it is written or loaded. Entries which are in use by
+    concurrent benchmark processes were loaded last, and are thus evicted last.
+
+    Parameters:
+        max_size: The maximum size of the cache in bytes. Defaults to
+            :func:`cache_size_limit`.
+
+    """
+    if max_size is None:
+        max_size = cache_size_limit()
+    entries = []
+    for entry in cache_dir().glob("*/" + _MANIFEST):
+        try:
+            last_used = entry.stat().st_mtime
+            size = sum(f.stat().st_size for f in entry.parent.iterdir())
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            continue
+        entries.append((last_used, size, entry.parent))
+    entries.sort(reverse=True)
+    total = 0
+    for _, size, entry in entries:
+        total += size
+        if total > max_size:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def write_cache_entry(
+    mdg: pp.MixedDimensionalGrid, mdg_pickle: bytes, entry: pathlib.Path
+) -> None:
+    """Write the grid and discretization matrices of a prepared model to the cache.
+
+    The entry is assembled in a temporary directory and moved in place in one step,
+    so concurrent or interrupted runs never leave a partial entry behind.
+
+    Parameters:
+        mdg: The discretized mixed-dimensional grid.
+        mdg_pickle: The pickled grid before discretization.
+        entry: Target directory of the cache entry.
+
+    """
+    with _new_entry(entry) as tmp:
+        (tmp / _GRID_FILE).write_bytes(mdg_pickle)
+        manifest: list[dict] = []
+        # Files are numbered rather than named after keywords, which are free text.
+        counter = 0
+        for grid_type, data in _grid_data(mdg):
+            matrices: dict[str, dict] = {}
+            stored_matrices = data.get(pp.DISCRETIZATION_MATRICES, {})
+            for keyword, matrix_dict in stored_matrices.items():
+                matrices[keyword] = {}
+                for key, value in matrix_dict.items():
+                    matrices[keyword][key] = _save_value(tmp, f"m{counter}", value)
+                    counter += 1
+            manifest.append({"grid_type": grid_type, "matrices": matrices})
+        # The manifest is written last, its existence marks a complete entry.
+        with open(tmp / _MANIFEST, "w") as f:
+            json.dump(manifest, f)
+
+
+def load_discretization_matrices(
+    mdg: pp.MixedDimensionalGrid, entry: pathlib.Path
+) -> None:
+    """Attach the cached discretization matrices to the data of a grid.
+
+    Parameters:
+        mdg: The mixed-dimensional grid loaded from the same cache entry.
+        entry: Directory of the cache entry.
+
+    """
+    _mark_used(entry)
+    with open(entry / _MANIFEST) as f:
+        manifest = json.load(f)
+    for (_, data), grid_entry in zip(_grid_data(mdg), manifest, strict=True):
+        matrices = data.setdefault(pp.DISCRETIZATION_MATRICES, {})
+        for keyword, matrix_entries in grid_entry["matrices"].items():
+            keyword_matrices = matrices.setdefault(keyword, {})
+            for key, value in matrix_entries.items():
+                keyword_matrices[key] = _load_value(entry, value)
+
+
+def frozen_linear_system(args: dict) -> tuple[sps.csr_matrix, np.ndarray]:
+    """The linear system of the first Newton iteration of a benchmark case.
+
+    The system is assembled once per PorePy version from the cached model and stored
+    next to it. Later calls map the stored arrays into memory.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``.
+
+    Returns:
+        The Jacobian matrix and the right-hand side.
+
+    """
+    entry = cache_dir() / f"{cache_key(args)}-linear-system"
+    if not (entry / _MANIFEST).exists():
+        # Imported here, model_setups depends on this module.
+        from benchmarks.model_setups import make_benchmark_model
+
+        model = make_benchmark_model(args, cached=True)
+        model.prepare_simulation()
+        model.before_nonlinear_loop()
+        model.before_nonlinear_iteration()
+        model.assemble_linear_system()
+        A, b = model.linear_system
+        with _new_entry(entry) as tmp:
+            manifest = {
+                "A": _save_value(tmp, "A", sps.csr_matrix(A)),
+                "b": _save_value(tmp, "b", np.asarray(b)),
+            }
+            with open(tmp / _MANIFEST, "w") as f:
+                json.dump(manifest, f)
+
+    _mark_used(entry)
+    with open(entry / _MANIFEST) as f:
+        manifest = json.load(f)
+    return _load_value(entry, manifest["A"]), _load_value(entry, manifest["b"])
+
+
+def clear_cache() -> None:
+    """Remove all cache entries."""
+    shutil.rmtree(cache_dir(), ignore_errors=True)
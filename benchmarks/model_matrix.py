@@ -0,0 +1,80 @@
+"""Benchmarks over all cases of ``make_benchmark_model``.
+
+Every suite is parameterized over physics, geometry and grid refinement, which shows
+how the cost of the simulation stages scales with mesh size and fracture count.
+Expensive combinations are skipped or limited by ``CASE_TIMEOUTS`` in
+``model_setups.py``.
+
+"""
+
+from benchmarks.model_setups import (
+    GEOMETRIES,
+    GRID_REFINEMENTS,
+    PHYSICS,
+    make_benchmark_model,
+    max_case_timeout,
+    start_case_budget,
+    stop_case_budget,
+)
+
+
+class ModelMatrix:
+    """Common parameterization and setup of the suites below."""
+
+    params = [PHYSICS, GEOMETRIES, GRID_REFINEMENTS]
+    param_names = ["physics", "geometry", "grid_refinement"]
+
+    timeout = max_case_timeout()
+    # The timed calls modify the model, so each sample needs a fresh setup. The
+    # expensive cases stop repeating after five minutes.
+    number = 1
+    rounds = 1
+    repeat = (1, 5, 300.0)
+
+    def make_model(self, physics, geometry, grid_refinement, cached=False):
+        start_case_budget(physics, geometry, grid_refinement)
+        return make_benchmark_model(
+            {
+                "geometry": geometry,
+                "grid_refinement": grid_refinement,
+                "physics": physics,
+            },
+            cached=cached,
+        )
+
+    def teardown(self, physics, geometry, grid_refinement):
+        stop_case_budget()
+
+
+class PrepareSimulation(ModelMatrix):
+
+    def setup(self, physics, geometry, grid_refinement):
+        self.model = self.make_model(physics, geometry, grid_refinement)
+
+    def time_prepare_simulation(self, physics, geometry, grid_refinement):
+        self.model.prepare_simulation()
+
+
+class PreSolve(ModelMatrix):
+
+    def setup(self, physics, geometry, grid_refinement):
+        self.model = self.make_model(physics, geometry, grid_refinement, cached=True)
+        self.model.prepare_simulation()
+
+    def time_pre_solve(self, physics, geometry, grid_refinement):
+        self.model.before_nonlinear_loop()
+        self.model.before_nonlinear_iteration()
+        self.model.assemble_linear_system()
+
+
+class Solve(ModelMatrix):
+
+    def setup(self, physics, geometry, grid_refinement):
+        self.model = self.make_model(physics, geometry, grid_refinement, cached=True)
+        self.model.prepare_simulation()
+        self.model.before_nonlinear_loop()
+        self.model.before_nonlinear_iteration()
+        self.model.assemble_linear_system()
+
+    def time_solve(self, physics, geometry, grid_refinement):
+        self.model.solve_linear_system()
@@ -1,5 +1,7 @@
+import signal
 import warnings
-from typing import Optional, Type
+from time import perf_counter
+from typing import Callable, Optional, Type
 
 import porepy as pp
 # Models 1 and 4 use FractureSolidConstants class, others use its parent SolidConstants.
@@ -25,6 +27,8 @@ from porepy.examples.flow_benchmark_3d_case_3 import Geometry as Case3dGeo
 from porepy.examples.flow_benchmark_3d_case_3 import Permeability as Case3dPermeability
 from porepy.models.poromechanics import Poromechanics
 
+from benchmarks.model_cache import with_model_cache
+
 
 # Ignore type errors inherent to the ``Poromechanics`` class.
 class Case1Poromech2D(  # type: ignore[misc]
@@ -62,7 +66,7 @@ class Case4Poromech2D(  # type: ignore[misc]
     pass
 
 
-def make_benchmark_model(args: dict):
+def make_benchmark_model(args: dict, cached: bool = False, timed: bool = False):
     """Create a benchmark model based on the provided arguments.
 
     Parameters:
@@ -73,6 +77,14 @@ def make_benchmark_model(args: dict):
             3D grid.
             - grid_refinement (int): Specifies the grid refinement level.
             - physics (str): Specifies the type of physics ("flow" or "poromechanics").
+            - cell_size (float, optional): Overrides the cell size implied by
+            grid_refinement for the 2D geometries. Ignored for geometry 3.
+        cached: If True, the model loads its grid and discretization matrices from the
+            on-disk cache in :mod:`benchmarks.model_cache`, and populates the cache on
+            the first call. Use it for benchmarks which do not time meshing or
+            discretization.
+        timed: If True, the model records the time of its stages with the
+            ``TimedSolutionStrategy`` from ``larger_models/base_model.py``.
 
     Returns:
         model: An instance of the selected benchmark model with the specified
@@ -103,7 +115,9 @@ def make_benchmark_model(args: dict):
     # Set cell_size/refinement_level model parameter based on choice of geometry and
     # grid refinement.
     if args['geometry'] in [0, 1, 2]:
-        if args['grid_refinement'] == 0:
+        if "cell_size" in args:
+            cell_size = args["cell_size"]
+        elif args['grid_refinement'] == 0:
             cell_size = 0.1
         elif args['grid_refinement'] == 1:
             cell_size = 0.01
@@ -152,4 +166,221 @@ def make_benchmark_model(args: dict):
     if model is None:
         raise ValueError(f"{args['geometry']=}, {args['physics']=}")
 
+    if timed:
+        # Imported here, since the module pins the number of BLAS threads on import.
+        from benchmarks.larger_models.base_model import TimedSolutionStrategy
+
+        model = type(model.__name__, (TimedSolutionStrategy, model), {})
+
+    if cached:
+        model = with_model_cache(model, args)
+
     return model(model_params)
+
+
+PHYSICS = ["flow", "poromechanics"]
+GEOMETRIES = [0, 1, 2, 3]
+GRID_REFINEMENTS = [0, 1, 2]
+
+# Names of the equations of the benchmark models, and the classes of the discretizations
+# wrapped by their Ad operators. asv needs the parameters of a suite before any model is
+# prepared, so suites over equations or discretizations use these lists. Combinations
+# which a model does not have are skipped, names which are not listed are not tracked.
+EQUATIONS = [
+    "mass_balance_equation",
+    "interface_darcy_flux_equation",
+    "well_flux_equation",
+    "momentum_balance_equation",
+    "interface_force_balance_equation",
+    "normal_fracture_deformation_equation",
+    "tangential_fracture_deformation_equation",
+]
+DISCRETIZATIONS = ["Biot", "Mpfa", "Mpsa", "Tpfa", "Upwind", "UpwindCoupling"]
+DIMENSIONS = [0, 1, 2, 3]
+
+# Time budget in seconds of a single benchmark sample (setup and timed call) for each
+# combination of physics, geometry and grid refinement. Combinations set to None are too
+# expensive for the benchmark host and are skipped, e.g. the finest 3D grid needs ~20 GB
+# of memory.
+CASE_TIMEOUTS: dict[tuple[str, int, int], Optional[float]] = {
+    ("flow", 0, 0): 60,
+    ("flow", 0, 1): 120,
+    ("flow", 0, 2): 600,
+    ("flow", 1, 0): 60,
+    ("flow", 1, 1): 120,
+    ("flow", 1, 2): 600,
+    ("flow", 2, 0): 120,
+    ("flow", 2, 1): 300,
+    ("flow", 2, 2): 900,
+    ("flow", 3, 0): 300,
+    ("flow", 3, 1): 1200,
+    ("flow", 3, 2): None,
+    ("poromechanics", 0, 0): 120,
+    ("poromechanics", 0, 1): 300,
+    ("poromechanics", 0, 2): 1200,
+    ("poromechanics", 1, 0): 120,
+    ("poromechanics", 1, 1): 300,
+    ("poromechanics", 1, 2): 1200,
+    ("poromechanics", 2, 0): 300,
+    ("poromechanics", 2, 1): 900,
+    ("poromechanics", 2, 2): None,
+    ("poromechanics", 3, 0): 900,
+    ("poromechanics", 3, 1): None,
+    ("poromechanics", 3, 2): None,
+}
+
+
+def default_case_args(physics: str, geometry: int) -> dict:
+    """Arguments of the representative case of a geometry.
+
+    This is grid refinement 1 as in the nightly benchmarks, except for the 3D geometry,
+    which uses its coarsest grid.
+
+    """
+    return {
+        "physics": physics,
+        "geometry": geometry,
+        "grid_refinement": 0 if geometry == 3 else 1,
+    }
+
+
+def max_case_timeout() -> float:
+    """The largest time budget among the benchmark cases which are not skipped."""
+    return max(t for t in CASE_TIMEOUTS.values() if t is not None)
+
+
+def _raise_case_timeout(signum, frame):
+    raise TimeoutError("The benchmark case exceeded its time budget.")
+
+
+def start_case_budget(physics: str, geometry: int, grid_refinement: int) -> None:
+    """Skip a benchmark case if it is too expensive, otherwise start its time budget.
+
+    To be called first thing in the ``setup`` of a parameterized suite, with
+    :func:`stop_case_budget` in the ``teardown``. The budget is enforced with
+    ``SIGALRM`` where available, so that a single slow combination fails instead of
+    exhausting the timeout of the whole suite.
+
+    Parameters:
+        physics: The physics of the case.
+        geometry: The geometry of the case.
+        grid_refinement: The grid refinement level of the case.
+
+    Raises:
+        NotImplementedError: If the case is skipped. asv reports such benchmarks as
+            skipped rather than failed.
+
+    """
+    timeout = CASE_TIMEOUTS[(physics, geometry, grid_refinement)]
+    if timeout is None:
+        raise NotImplementedError(f"{physics=}, {geometry=}, {grid_refinement=}")
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _raise_case_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+
+def stop_case_budget() -> None:
+    """Stop the time budget started by :func:`start_case_budget`."""
+    if hasattr(signal, "SIGALRM"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# Simulations use a single time step and relaxed Newton tolerance to ensure 1-2 Newton
+# iterations. The model is expected to be prepared before the run.
+RUN_PARAMS = {
+    "prepare_simulation": False,
+    "nl_divergence_tol": 1e8,
+    "max_iterations": 25,
+    "nl_convergence_tol": 1e-2,
+    "nl_convergence_tol_res": 1e-2,
+}
+
+
+def run_with_solver_statistics(model) -> dict[str, float]:
+    """Run a prepared model to the end and count its time steps and Newton iterations.
+
+    Parameters:
+        model: A model on which ``prepare_simulation`` has been called.
+
+    Returns:
+        The wall time of the run in seconds (``"time"``), and the numbers of converged
+        time steps (``"time_steps"``), Newton iterations (``"iterations"``) and
+        degrees of freedom (``"num_dofs"``).
+
+    """
+    counts = {"time_steps": 0, "iterations": 0}
+    after_nonlinear_convergence = model.after_nonlinear_convergence
+
+    # The iteration counter of the solver statistics is reset every time step, collect
+    # it before that happens.
+    def counting_after_nonlinear_convergence(*args, **kwargs):
+        counts["time_steps"] += 1
+        counts["iterations"] += model.nonlinear_solver_statistics.num_iteration
+        return after_nonlinear_convergence(*args, **kwargs)
+
+    model.after_nonlinear_convergence = counting_after_nonlinear_convergence
+
+    tic = perf_counter()
+    pp.run_time_dependent_model(model, RUN_PARAMS)
+    elapsed = perf_counter() - tic
+
+    return {
+        "time": elapsed,
+        "num_dofs": model.equation_system.num_dofs(),
+        **counts,
+    }
+
+
+def fastest_run_statistics(make_model: Callable, num_runs: int = 3) -> dict[str, float]:
+    """The solver statistics of the fastest of several runs of a case.
+
+    Parameters:
+        make_model: Creates a new model of the case.
+        num_runs: Number of runs.
+
+    Returns:
+        The statistics of :func:`run_with_solver_statistics` of the fastest run.
+
+    """
+    runs = []
+    for _ in range(num_runs):
+        model = make_model()
+        model.prepare_simulation()
+        runs.append(run_with_solver_statistics(model))
+    return min(runs, key=lambda run: run["time"])
+
+
+class _RunSimulationNormalized:
+    """End-to-end run, normalized by its work.
+
+    A change in convergence (more Newton iterations) shows in the number of iterations,
+    a change in the cost of each iteration in the normalized times.
+
+    Subclasses define ``setup_cache`` with :func:`fastest_run_statistics` of their
+    case. asv shares the cache of a ``setup_cache`` function between all classes using
+    it, so it cannot be inherited. The leading underscore hides this class from the
+    benchmark discovery of asv.
+
+    """
+
+    timeout = 600
+
+    def track_time_per_newton_iteration(self, stats):
+        return stats["time"] / stats["iterations"]
+
+    track_time_per_newton_iteration.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_time_per_time_step(self, stats):
+        return stats["time"] / stats["time_steps"]
+
+    track_time_per_time_step.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_time_per_dof(self, stats):
+        return stats["time"] / stats["num_dofs"]
+
+    track_time_per_dof.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_newton_iterations(self, stats):
+        return stats["iterations"]
+
+    track_newton_iterations.unit = "iterations"  # type: ignore[attr-defined]
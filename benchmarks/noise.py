@@ -0,0 +1,233 @@
+"""Measurement of the noise of the benchmark machine.
+
+The benchmarks run on a small virtual machine, whose speed varies with the load of the
+host (noisy neighbors) and with throttling. A benchmark measured twice on the same
+commit can then differ by more than a genuine regression. The functions here are used
+by ``run_noise_controlled.py`` to measure this noise and to keep it out of the results:
+
+- :func:`calibrate` times a fixed workload, which exercises the interpreter, dense
+  linear algebra and memory bandwidth. Its score is the reference time of the machine
+  divided by the current time: 1 on a machine at its usual speed, below 1 if it is
+  slowed down.
+- :func:`reject_outliers` drops samples far from the median, in units of the median
+  absolute deviation, e.g. samples hit by a burst of load on the host.
+- :func:`median_ci` is the distribution-free confidence interval of the median, from
+  which the number of repeats needed for a target precision is estimated.
+
+The scores are saved next to the results, in ``.asv/calibration/<machine>/``, with one
+file per results file. ``benchmarks/regressions.py`` reads them to judge changes
+against the noise of the machine.
+
+"""
+
+import json
+import pathlib
+from dataclasses import asdict, dataclass
+from time import perf_counter
+
+import numpy as np
+from scipy import stats
+
+# Sizes of the calibration workload, about 0.1 s on the benchmark machine.
+_LOOP_SIZE = 200_000
+_MATRIX_SIZE = 200
+_ARRAY_SIZE = 4_000_000
+
+
+@dataclass
+class Calibration:
+    """The result of a calibration of the machine."""
+
+    time: float
+    """Median time of the workload in seconds."""
+
+    score: float
+    """Reference time divided by ``time``, below 1 if the machine is slower."""
+
+    noise: float
+    """Relative spread of the repeats of the workload, see :func:`relative_spread`."""
+
+
+def calibration_workload() -> None:
+    """A fixed workload, sensitive to the clock rate, cache and memory bandwidth."""
+    # Interpreter speed, which dominates the AD framework.
+    total = 0
+    for i in range(_LOOP_SIZE):
+        total += i * i
+    # Floating point throughput.
+    rng = np.random.default_rng(0)
+    a = rng.random((_MATRIX_SIZE, _MATRIX_SIZE))
+    a @ a
+    # Memory bandwidth, which dominates sparse matrix operations.
+    x = np.ones(_ARRAY_SIZE)
+    (x * 2.0).sum()
+
+
+def calibration_times(repeats: int = 7) -> np.ndarray:
+    """Time the calibration workload.
+
+    Parameters:
+        repeats: Number of timings, after a first run to warm up.
+
+    Returns:
+        The timings in seconds.
+
+    """
+    calibration_workload()
+    times = []
+    for _ in range(repeats):
+        tic = perf_counter()
+        calibration_workload()
+        times.append(perf_counter() - tic)
+    return np.array(times)
+
+
+def relative_spread(values: np.ndarray) -> float:
+    """Robust relative standard deviation, the scaled median absolute deviation
+    divided by the median."""
+    values = np.asarray(values, dtype=float)
+    median = np.median(values)
+    return float(1.4826 * np.median(np.abs(values - median)) / median)
+
+
+def reject_outliers(samples: np.ndarray, threshold: float = 3.0) -> np.ndarray:
+    """Drop the samples far from the median.
+
+    Parameters:
+        samples: The samples.
+        threshold: Samples deviating from the median by more than this many scaled
+            median absolute deviations are dropped.
+
+    Returns:
+        The remaining samples, in their original order.
+
+    """
+    samples = np.asarray(samples, dtype=float)
+    median = np.median(samples)
+    deviation = np.abs(samples - median)
+    mad = 1.4826 * np.median(deviation)
+    if mad == 0:
+        return samples
+    return samples[deviation <= threshold * mad]
+
+
+def median_ci(samples: np.ndarray, confidence: float = 0.99) -> tuple[float, float]:
+    """Distribution-free confidence interval of the median, from order statistics.
+
+    Parameters:
+        samples: The samples.
+        confidence: The confidence level, 99% as for the intervals of asv.
+
+    Returns:
+        The bounds of the interval. Infinite if there are too few samples for the
+        confidence level, e.g. fewer than 8 for 99%.
+
+    """
+    x = np.sort(np.asarray(samples, dtype=float))
+    n = x.size
+    # The interval [x_(j), x_(n-j+1)] covers the median with probability
+    # 1 - 2 P(B <= j - 1), with B binomial with n trials and probability 1/2.
+    j = int(stats.binom.ppf((1 - confidence) / 2, n, 0.5)) if n > 0 else 0
+    if j == 0:
+        return -np.inf, np.inf
+    return float(x[j - 1]), float(x[n - j])
+
+
+def relative_ci_width(samples: np.ndarray, confidence: float = 0.99) -> float:
+    """Width of :func:`median_ci` relative to the median."""
+    lo, hi = median_ci(samples, confidence)
+    return (hi - lo) / float(np.median(samples))
+
+
+def calibration_dir(results_dir: pathlib.Path, machine: str) -> pathlib.Path:
+    """The directory of the calibration records of a machine."""
+    return results_dir.parent / "calibration" / machine
+
+
+def calibrate(
+    results_dir: pathlib.Path, machine: str, recalibrate: bool = False
+) -> Calibration:
+    """Time the calibration workload and score it against the machine's reference.
+
+    Parameters:
+        results_dir: The asv results directory.
+        machine: The asv machine name.
+        recalibrate: Measure a new reference time for the machine. The reference is
+            measured on the first calibration of a machine, and should only be
+            renewed if the machine itself changed.
+
+    Returns:
+        The calibration.
+
+    """
+    path = calibration_dir(results_dir, machine) / "reference.json"
+    if recalibrate or not path.exists():
+        reference = float(np.median(calibration_times(repeats=21)))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"time": reference}))
+    else:
+        reference = json.loads(path.read_text())["time"]
+    times = calibration_times()
+    time = float(np.median(times))
+    return Calibration(time=time, score=reference / time, noise=relative_spread(times))
+
+
+@dataclass
+class CalibratedResult:
+    """The noise control of a benchmark result."""
+
+    score: float
+    """Median calibration score of the rounds of the benchmark."""
+
+    min_score: float
+    """Lowest calibration score of the rounds."""
+
+    noise: float
+    """Largest relative spread of the calibration workload in the rounds."""
+
+    ci_width: float
+    """Relative width of the 99% confidence interval of the median of the kept
+    samples."""
+
+    repeats: int
+    """Number of kept samples."""
+
+    outliers: int
+    """Number of rejected samples."""
+
+
+def write_calibration(
+    results_dir: pathlib.Path,
+    machine: str,
+    results_file: str,
+    results: dict[str, CalibratedResult],
+) -> None:
+    """Save the calibrated results of a results file, next to earlier ones.
+
+    Parameters:
+        results_dir: The asv results directory.
+        machine: The asv machine name.
+        results_file: The name of the asv results file, ``<commit>-<env>.json``.
+        results: The calibrated results by benchmark name and parameter label, e.g.
+            ``"model_matrix.Solve.time_solve('flow', 0, 0)"``.
+
+    """
+    path = calibration_dir(results_dir, machine) / results_file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    records = json.loads(path.read_text()) if path.exists() else {}
+    records.update({key: asdict(result) for key, result in results.items()})
+    path.write_text(json.dumps(records, indent=1))
+
+
+def read_calibration(
+    results_dir: pathlib.Path, machine: str, results_file: str
+) -> dict[str, CalibratedResult]:
+    """The calibrated results of a results file, see :func:`write_calibration`."""
+    path = calibration_dir(results_dir, machine) / results_file
+    if not path.exists():
+        return {}
+    return {
+        key: CalibratedResult(**record)
+        for key, record in json.loads(path.read_text()).items()
+    }
+
@@ -0,0 +1,233 @@
+"""Hardware performance counters of the simulation stages.
+
+The wall time of a stage does not tell whether a regression comes from more work
+(instructions), worse locality (cache misses), mispredicted branches or a lower
+throughput per cycle, e.g. when sparse matrix-vector products saturate the memory
+bandwidth. :class:`PerfCounters` reads the counters of the CPU for the calling thread
+around a block of code, through the ``perf_event_open`` system call of Linux. Only
+user space is counted, which ``kernel.perf_event_paranoid`` up to 2 allows without
+privileges. Other threads, e.g. the thread pools of BLAS, are not counted; the
+benchmarks run with a single BLAS thread, such that the main thread does all work.
+
+Counters are often unavailable: on other operating systems, in virtual machines
+without a virtualized PMU, in containers with restricted system calls, or if the
+kernel forbids them. The counters which cannot be opened are left out, and the
+benchmarks of missing counters are skipped.
+
+"""
+
+import ctypes
+import fcntl
+import os
+import platform
+import struct
+import sys
+from typing import Optional
+
+from benchmarks.memory import STAGES
+from benchmarks.model_setups import (
+    GEOMETRIES,
+    PHYSICS,
+    default_case_args,
+    make_benchmark_model,
+    start_case_budget,
+    stop_case_budget,
+)
+
+# Generalized hardware events of perf, as (type, config) of ``perf_event_attr``.
+_PERF_TYPE_HARDWARE = 0
+EVENTS = {
+    "instructions": (_PERF_TYPE_HARDWARE, 1),
+    "cycles": (_PERF_TYPE_HARDWARE, 0),
+    "cache_misses": (_PERF_TYPE_HARDWARE, 3),
+    "branch_misses": (_PERF_TYPE_HARDWARE, 5),
+}
+
+_SYSCALL_NUMBERS = {"x86_64": 298, "aarch64": 241}
+
+# Bits of the flags of perf_event_attr.
+_DISABLED = 1 << 0
+_INHERIT = 1 << 1
+_EXCLUDE_KERNEL = 1 << 5
+_EXCLUDE_HV = 1 << 6
+
+# read_format: report the times enabled and running, to scale multiplexed counters.
+_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+
+_IOC_ENABLE = 0x2400
+_IOC_DISABLE = 0x2401
+_IOC_RESET = 0x2403
+_FLAG_FD_CLOEXEC = 1 << 3
+
+
+class _PerfEventAttr(ctypes.Structure):
+    # The first version of the structure (PERF_ATTR_SIZE_VER0), accepted by all
+    # kernels. Later fields are zero.
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("size", ctypes.c_uint32),
+        ("config", ctypes.c_uint64),
+        ("sample_period", ctypes.c_uint64),
+        ("sample_type", ctypes.c_uint64),
+        ("read_format", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("wakeup_events", ctypes.c_uint32),
+        ("bp_type", ctypes.c_uint32),
+        ("config1", ctypes.c_uint64),
+    ]
+
+
+def _open_event(type_: int, config: int) -> Optional[int]:
+    """File descriptor of a counter of the calling thread, or None if unavailable."""
+    number = _SYSCALL_NUMBERS.get(platform.machine())
+    if sys.platform != "linux" or number is None:
+        return None
+    attr = _PerfEventAttr(
+        type=type_,
+        size=ctypes.sizeof(_PerfEventAttr),
+        config=config,
+        read_format=_FORMAT_TOTAL_TIME_ENABLED | _FORMAT_TOTAL_TIME_RUNNING,
+        # Threads started in the block are only added once they exit, so the
+        # persistent thread pools of BLAS and OpenMP are not counted.
+        flags=_DISABLED | _INHERIT | _EXCLUDE_KERNEL | _EXCLUDE_HV,
+    )
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.syscall.restype = ctypes.c_long
+    fd = libc.syscall(
+        ctypes.c_long(number),
+        ctypes.byref(attr),
+        ctypes.c_int(0),  # The calling thread.
+        ctypes.c_int(-1),  # Any CPU.
+        ctypes.c_int(-1),  # No group.
+        ctypes.c_ulong(_FLAG_FD_CLOEXEC),
+    )
+    return None if fd < 0 else fd
+
+
+class PerfCounters:
+    """Count hardware events of the calling thread in a ``with`` block.
+
+    Example:
+        >>> counters = PerfCounters()
+        >>> with counters:
+        ...     model.assemble_linear_system()
+        >>> counters.counts
+        {'instructions': 1.2e10, 'cycles': 8.1e9, ...}
+
+    Parameters:
+        events: The names of the events in :data:`EVENTS` to count.
+
+    """
+
+    def __init__(self, events: Optional[list[str]] = None) -> None:
+        self.fds: dict[str, int] = {}
+        for name in events or list(EVENTS):
+            fd = _open_event(*EVENTS[name])
+            if fd is not None:
+                self.fds[name] = fd
+
+        self.counts: dict[str, float] = {}
+        """Events counted in the last block. Counters which were not running for the
+        whole block, since the CPU has fewer counters than requested, are scaled."""
+
+    @property
+    def available(self) -> list[str]:
+        """The events which could be opened."""
+        return list(self.fds)
+
+    def __enter__(self) -> "PerfCounters":
+        for fd in self.fds.values():
+            fcntl.ioctl(fd, _IOC_RESET, 0)
+            fcntl.ioctl(fd, _IOC_ENABLE, 0)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for fd in self.fds.values():
+            fcntl.ioctl(fd, _IOC_DISABLE, 0)
+        self.counts = {}
+        for name, fd in self.fds.items():
+            value, enabled, running = struct.unpack("QQQ", os.read(fd, 24))
+            if running > 0:
+                self.counts[name] = value * enabled / running
+
+    def close(self) -> None:
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+def count_stages(args: dict, counters: PerfCounters) -> dict[str, dict[str, float]]:
+    """Count the hardware events of each stage of a single Newton iteration.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``.
+        counters: The opened counters.
+
+    Returns:
+        For each stage in ``STAGES`` of ``memory.py``, the counted events.
+
+    """
+    model = make_benchmark_model(args)
+    stages = {
+        "prepare_simulation": [model.prepare_simulation],
+        "assemble_linear_system": [
+            model.before_nonlinear_loop,
+            model.before_nonlinear_iteration,
+            model.assemble_linear_system,
+        ],
+        "solve_linear_system": [model.solve_linear_system],
+    }
+    counts = {}
+    for stage, calls in stages.items():
+        with counters:
+            for call in calls:
+                call()
+        counts[stage] = counters.counts
+    return counts
+
+
+class HardwareCounters:
+    """Hardware events of each stage, on the representative case of every geometry.
+
+    The counts of all stages and cases are taken in a single run in ``setup_cache``.
+    Counters which are not available on the machine are skipped.
+
+    """
+
+    params = [PHYSICS, GEOMETRIES, STAGES, list(EVENTS)]
+    param_names = ["physics", "geometry", "stage", "counter"]
+    timeout = 3600
+
+    def setup_cache(self):
+        counters = PerfCounters()
+        if not counters.available:
+            print("No hardware performance counters available.", file=sys.stderr)
+            return {}
+        counts = {}
+        try:
+            for physics in PHYSICS:
+                for geometry in GEOMETRIES:
+                    args = default_case_args(physics, geometry)
+                    try:
+                        start_case_budget(physics, geometry, args["grid_refinement"])
+                    except NotImplementedError:
+                        continue
+                    try:
+                        counts[(physics, geometry)] = count_stages(args, counters)
+                    except TimeoutError:
+                        print(f"{physics=}, {geometry=} timed out.", file=sys.stderr)
+                    finally:
+                        stop_case_budget()
+        finally:
+            counters.close()
+        return counts
+
+    def setup(self, counts, physics, geometry, stage, counter):
+        if counter not in counts.get((physics, geometry), {}).get(stage, {}):
+            raise NotImplementedError(f"{physics=}, {geometry=}, {counter=}")
+
+    def track_count(self, counts, physics, geometry, stage, counter):
+        return counts[(physics, geometry)][stage][counter]
+
+    track_count.unit = "events"  # type: ignore[attr-defined]
@@ -0,0 +1,53 @@
+"""Deterministic profile of a benchmark case, for the comparison of two commits.
+
+``run_profile_diff.py`` runs this module in the environment of each commit:
+
+    >>> python -m benchmarks.profile_case --physics flow --geometry 0 --output a.pstats
+
+The case is created by ``make_benchmark_model`` and run as by the benchmarks, with
+``prepare_simulation`` and all time steps under ``cProfile``. cProfile records the
+exact number of calls of every function, which is needed to tell more calls from
+slower calls.
+
+"""
+
+import argparse
+import cProfile
+
+import porepy as pp
+
+from benchmarks.model_setups import RUN_PARAMS, make_benchmark_model
+
+
+def profile_case(args: dict, output: str) -> None:
+    """Run a benchmark case with cProfile enabled and save the statistics.
+
+    Parameters:
+        args: The case, as for ``make_benchmark_model``.
+        output: The file to save the statistics to, in the format of ``pstats``.
+
+    """
+    model = make_benchmark_model(args)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    model.prepare_simulation()
+    pp.run_time_dependent_model(model, RUN_PARAMS)
+    profiler.disable()
+    profiler.dump_stats(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--physics", type=str, default="flow")
+    parser.add_argument("--geometry", type=int, default=0)
+    parser.add_argument("--grid_refinement", type=int, default=0)
+    parser.add_argument("--output", type=str, required=True)
+    args = parser.parse_args()
+    profile_case(
+        {
+            "physics": args.physics,
+            "geometry": args.geometry,
+            "grid_refinement": args.grid_refinement,
+        },
+        args.output,
+    )
@@ -0,0 +1,239 @@
+"""Cost of the rediscretization in every Newton iteration of a THM model with contact.
+
+Models with fractures in contact (``THMModelBase`` of
+``larger_models/thermoporomechanics_models.py``, which includes ``ContactIndicators``)
+rediscretize their nonlinear discretizations, e.g. the upwinding of advective fluxes
+and the flow discretization on fractures with displacement-dependent apertures, at the
+start of every Newton iteration. ``TimedSolutionStrategy.rediscretize`` only records
+the total time.
+
+Here, a prepared model is driven through :data:`NUM_ITERATIONS` Newton iterations and
+every rediscretization of a discretization on a subdomain or interface is recorded with
+its time and number of cells. Before each, the parameters of the discretization are
+compared with those of the previous discretization on the same grid. Unchanged
+parameters mean that the work was redundant, which is the potential of incremental
+rediscretization.
+
+The discretization classes are those listed in ``model_setups.py``. Classes the model
+does not rediscretize are skipped, classes missing from the list are reported on
+stderr.
+
+"""
+
+import hashlib
+import sys
+from time import perf_counter
+
+import numpy as np
+import porepy as pp
+import scipy.sparse as sps
+from porepy.numerics.ad import _ad_utils
+
+from benchmarks.model_cache import with_model_cache
+from benchmarks.model_setups import DISCRETIZATIONS
+
+NUM_ITERATIONS = 4
+
+# Cell size of the 2D model with ten fractures.
+CELL_SIZE = 0.05
+
+# Depth to which the parameters of a discretization are followed into objects.
+_MAX_DEPTH = 4
+
+
+def _update_fingerprint(digest, value, depth: int = 0) -> None:
+    if depth > _MAX_DEPTH or isinstance(value, (pp.Grid, pp.MortarGrid)):
+        # Grids do not change, and following them would hash the geometry.
+        digest.update(type(value).__name__.encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif sps.issparse(value):
+        value = sps.csr_matrix(value)
+        for array in (value.data, value.indices, value.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            digest.update(str(key).encode())
+            _update_fingerprint(digest, value[key], depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update_fingerprint(digest, item, depth + 1)
+    elif hasattr(value, "__dict__"):
+        digest.update(type(value).__name__.encode())
+        _update_fingerprint(digest, vars(value), depth + 1)
+    else:
+        digest.update(repr(value).encode())
+
+
+def parameter_fingerprint(mdg: pp.MixedDimensionalGrid, discr, g) -> str:
+    """Hash of the parameters a discretization uses on a subdomain or interface.
+
+    Parameters:
+        mdg: The mixed-dimensional grid containing ``g``.
+        discr: The discretization. Its parameters are those stored under its keyword.
+        g: A subdomain or a mortar grid. For interfaces, the parameters of the
+            neighboring subdomains are included.
+
+    Returns:
+        A hex digest of the parameters.
+
+    """
+    if isinstance(g, pp.MortarGrid):
+        data = [mdg.interface_data(g)]
+        data += [mdg.subdomain_data(sd) for sd in mdg.interface_to_subdomain_pair(g)]
+    else:
+        data = [mdg.subdomain_data(g)]
+    keyword = getattr(discr, "keyword", None)
+    digest = hashlib.sha256()
+    for d in data:
+        _update_fingerprint(digest, d.get(pp.PARAMETERS, {}).get(keyword, {}))
+    return digest.hexdigest()
+
+
+def _record_key(discr, g) -> tuple:
+    return type(discr).__name__, getattr(discr, "keyword", None), g.id
+
+
+class RediscretizationRecorder:
+    """Rediscretize the nonlinear discretizations and record the cost of each.
+
+    Replaces the rediscretization of the model, in the same way as
+    ``TimedSolutionStrategy.rediscretize``.
+
+    """
+
+    def prepare_simulation(self) -> None:
+        super().prepare_simulation()  # type: ignore[misc]
+        self.rediscretization_log: list[list[dict]] = []
+        """Records of every rediscretization on a grid, per call of rediscretize."""
+
+        self._fingerprints = {
+            _record_key(discr, g): parameter_fingerprint(self.mdg, discr, g)
+            for discr, grids in self._unique_nonlinear_discretizations().items()
+            for g in grids
+        }
+
+    def _unique_nonlinear_discretizations(self) -> dict:
+        return _ad_utils.uniquify_discretization_list(
+            self.nonlinear_discretizations  # type: ignore[attr-defined]
+        )
+
+    def rediscretize(self) -> None:
+        from benchmarks.larger_models.base_model import discretize_on_grid
+
+        records = []
+        for discr, grids in self._unique_nonlinear_discretizations().items():
+            for g in grids:
+                fingerprint = parameter_fingerprint(self.mdg, discr, g)
+                key = _record_key(discr, g)
+                tic = perf_counter()
+                discretize_on_grid(self.mdg, discr, g)
+                records.append(
+                    {
+                        "discretization": type(discr).__name__,
+                        "dim": g.dim,
+                        "interface": isinstance(g, pp.MortarGrid),
+                        "cells": g.num_cells,
+                        "time": perf_counter() - tic,
+                        "unchanged": self._fingerprints.get(key) == fingerprint,
+                    }
+                )
+                self._fingerprints[key] = fingerprint
+        self.rediscretization_log.append(records)
+
+
+def make_thm_model():
+    """The 2D THM model with ten fractures in contact, recording its rediscretization.
+
+    The grid and the initial discretization are taken from the model cache.
+
+    """
+    # Imported here, since importing the models limits the threads of the process.
+    import benchmarks.larger_models.thermoporomechanics_models as thm
+
+    setup = {"steady_state": False, "grid_refinement": 0, "cell_size": CELL_SIZE}
+    params = thm.create_params(setup)
+    params["timings_file"] = None
+    model_class = type(
+        "RecordedTHMModel2dTenFracs",
+        (RediscretizationRecorder, thm.THMModel2dTenFracs),
+        {},
+    )
+    args = {"model": "THMModel2dTenFracs", "cell_size": CELL_SIZE}
+    return with_model_cache(model_class, args)(params)
+
+
+def run_newton_iterations(model, num_iterations: int) -> None:
+    """Run Newton iterations of the first time step of a prepared model."""
+    model.before_nonlinear_loop()
+    for _ in range(num_iterations):
+        model.before_nonlinear_iteration()
+        model.assemble_linear_system()
+        nonlinear_increment = model.solve_linear_system()
+        model.after_nonlinear_iteration(nonlinear_increment)
+
+
+class Rediscretization:
+    """Rediscretization per Newton iteration, in total and per discretization class."""
+
+    params = [["total"] + DISCRETIZATIONS]
+    param_names = ["discretization"]
+    timeout = 3600
+
+    def setup_cache(self):
+        model = make_thm_model()
+        model.prepare_simulation()
+        run_newton_iterations(model, NUM_ITERATIONS)
+
+        names = {
+            type(discr).__name__ for discr in model._unique_nonlinear_discretizations()
+        }
+        for name in sorted(names - set(DISCRETIZATIONS)):
+            print(f"Discretization {name!r} is not tracked.", file=sys.stderr)
+
+        stats: dict[str, dict[str, float]] = {}
+        for iteration, records in enumerate(model.rediscretization_log):
+            for record in records:
+                for name in ("total", record["discretization"]):
+                    s = stats.setdefault(
+                        name, {"time": 0.0, "cells": 0, "unchanged_cells": 0}
+                    )
+                    s["time"] += record["time"]
+                    s["cells"] += record["cells"]
+                    s["unchanged_cells"] += record["cells"] * record["unchanged"]
+                if record["unchanged"]:
+                    grid = "interface" if record["interface"] else "subdomain"
+                    print(
+                        f"Iteration {iteration}: {record['discretization']} on a "
+                        f"{record['dim']}D {grid} with {record['cells']} cells "
+                        "rediscretized with unchanged parameters.",
+                        file=sys.stderr,
+                    )
+        return stats
+
+    def setup(self, stats, discretization):
+        if discretization not in stats:
+            raise NotImplementedError(f"{discretization=}")
+
+    def track_time_per_iteration(self, stats, discretization):
+        return stats[discretization]["time"] / NUM_ITERATIONS
+
+    track_time_per_iteration.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_cells_per_iteration(self, stats, discretization):
+        return stats[discretization]["cells"] / NUM_ITERATIONS
+
+    track_cells_per_iteration.unit = "cells"  # type: ignore[attr-defined]
+
+    def track_time_per_cell(self, stats, discretization):
+        s = stats[discretization]
+        return s["time"] / max(s["cells"], 1)
+
+    track_time_per_cell.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_unchanged_fraction(self, stats, discretization):
+        s = stats[discretization]
+        return s["unchanged_cells"] / max(s["cells"], 1)
+
+    track_unchanged_fraction.unit = "fraction"  # type: ignore[attr-defined]
@@ -0,0 +1,372 @@
+"""Detection of performance regressions in the history of the asv results.
+
+asv flags a regression whenever the best value of a benchmark steps up between two
+commits, which reports noise on short benchmarks as regressions. Here, the history of
+every benchmark and parameter combination is scanned for change points instead:
+
+1. The most probable location of a change in the level of the series is found with a
+   Bayesian change-point model on the logarithm of the results (two segments with
+   unknown means and a common unknown variance, uniform prior on the location).
+2. The samples of up to ``window`` commits before and after the change are compared
+   with a Mann-Whitney U test. The samples are the individual repeats recorded by
+   ``asv run --record-samples``. Results without samples contribute their single value,
+   such changes need several commits on each side to become significant.
+3. Significant changes split the series, and both parts are scanned again.
+
+Every change is reported with its effect size, the relative change of the median and
+Cliff's delta, and ranked by a confidence combining the posterior probability of its
+location with the p-value of the test.
+
+Results measured by ``run_noise_controlled.py`` carry the calibration score of the
+machine, see ``benchmarks/noise.py``. The spread of the scores around a change is the
+noise of the machine between runs, and changes which are not larger than a multiple of
+it are ignored.
+
+"""
+
+import dataclasses
+import itertools
+import json
+import pathlib
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import numpy as np
+from scipy import stats
+
+from benchmarks.noise import read_calibration, relative_spread
+
+# Benchmark types whose results grow when the performance gets worse.
+_LOWER_IS_BETTER = {"time", "memory", "peakmemory"}
+
+# Units of ``track_`` benchmarks whose results drop when the performance gets worse.
+# The results of all other ``track_`` benchmarks, e.g. in seconds, bytes or events,
+# grow when it gets worse.
+HIGHER_IS_BETTER_UNITS = {"speedup", "efficiency", "fraction"}
+
+
+def is_regression(type_: str, unit: str, relative_change: float) -> bool:
+    """Whether a change of a benchmark result is a regression.
+
+    Parameters:
+        type_: The type of the benchmark, e.g. ``"time"`` or ``"track"``.
+        unit: The unit of the benchmark.
+        relative_change: The relative change of the result.
+
+    Returns:
+        True if the change makes the benchmark slower, use more memory, or worse in
+        the unit of a ``track_`` benchmark.
+
+    """
+    if type_ in _LOWER_IS_BETTER:
+        return relative_change > 0
+    if type_ == "track":
+        if unit in HIGHER_IS_BETTER_UNITS:
+            return relative_change < 0
+        return relative_change > 0
+    return False
+
+
+@dataclass
+class Point:
+    """The result of a benchmark at a single commit."""
+
+    commit: str
+    date: int
+    """Commit date, in milliseconds since the epoch as stored by asv."""
+
+    value: float
+    samples: list[float]
+    """The recorded repeats, or only ``value`` if no samples were recorded."""
+
+    calibration: Optional[float] = None
+    """The calibration score of the machine, if the result was calibrated."""
+
+
+@dataclass
+class Series:
+    """The history of a benchmark and parameter combination, ordered by commit date."""
+
+    benchmark: str
+    params: str
+    machine: str
+    env_name: str
+    unit: str
+    type: str
+    points: list[Point] = dataclasses.field(default_factory=list)
+
+
+@dataclass
+class Change:
+    """A change point in a series."""
+
+    benchmark: str
+    params: str
+    machine: str
+    env_name: str
+    unit: str
+    last_good: str
+    """The last commit before the change."""
+
+    first_bad: str
+    """The first commit after the change."""
+
+    before: float
+    """Median of the samples before the change."""
+
+    after: float
+    """Median of the samples after the change."""
+
+    relative_change: float
+    cliffs_delta: float
+    p_value: float
+    location_probability: float
+    """Posterior probability that the change happened at this or a neighboring
+    commit."""
+
+    confidence: float
+    regression: bool
+    """Whether the change makes the benchmark worse, see :func:`is_regression`."""
+
+    machine_noise: Optional[float] = None
+    """Relative spread of the calibration scores of the compared commits, if at
+    least three of them were calibrated."""
+
+    culprit: Optional[str] = None
+    """The offending commit, if the range was bisected."""
+
+    @property
+    def key(self) -> str:
+        """Identifier of the change, stable across runs of the detection."""
+        return (
+            f"{self.machine}/{self.env_name}/{self.benchmark}{self.params}/"
+            f"{self.last_good[:8]}..{self.first_bad[:8]}"
+        )
+
+
+def _param_labels(params: list[list[str]]) -> list[str]:
+    if not params:
+        return [""]
+    return [f"({', '.join(combination)})" for combination in itertools.product(*params)]
+
+
+def read_results_file(path: pathlib.Path) -> Iterator[tuple[str, str, Point]]:
+    """The successful results of an asv results file.
+
+    Parameters:
+        path: A results file, for a commit and environment of a machine.
+
+    Yields:
+        The benchmark name, the label of the parameter combination and the result.
+
+    """
+    data = json.loads(path.read_text())
+    columns = data["result_columns"]
+    for name, row in data["results"].items():
+        result = dict(zip(columns, row))
+        values = result.get("result")
+        if not isinstance(values, list):
+            continue
+        samples = result.get("samples") or [None] * len(values)
+        labels = _param_labels(result.get("params") or [])
+        for label, value, value_samples in zip(labels, values, samples):
+            if value is None or not np.isfinite(value):
+                continue
+            yield name, label, Point(
+                commit=data["commit_hash"],
+                date=data["date"],
+                value=value,
+                samples=value_samples or [value],
+            )
+
+
+def load_series(
+    results_dir: pathlib.Path, machine: Optional[str] = None
+) -> list[Series]:
+    """Read the asv results into one series per benchmark and parameter combination.
+
+    Parameters:
+        results_dir: The asv results directory.
+        machine: Only read the results of this machine. By default, all machines are
+            read, each with its own series.
+
+    Returns:
+        The series with at least one successful result.
+
+    """
+    benchmarks = json.loads((results_dir / "benchmarks.json").read_text())
+    series: dict[tuple[str, str, str, str], Series] = {}
+    for path in sorted(results_dir.glob(f"{machine or '*'}/*.json")):
+        if path.name == "machine.json":
+            continue
+        # Results files are named "<commit>-<environment>.json".
+        env_name = path.stem.split("-", 1)[1]
+        calibrations = read_calibration(results_dir, path.parent.name, path.name)
+        for name, label, point in read_results_file(path):
+            if name not in benchmarks:
+                continue
+            if name + label in calibrations:
+                point.calibration = calibrations[name + label].score
+            key = (path.parent.name, env_name, name, label)
+            if key not in series:
+                series[key] = Series(
+                    benchmark=name,
+                    params=label,
+                    machine=key[0],
+                    env_name=env_name,
+                    unit=benchmarks[name].get("unit", ""),
+                    type=benchmarks[name].get("type", ""),
+                )
+            series[key].points.append(point)
+    for s in series.values():
+        s.points.sort(key=lambda point: point.date)
+    return list(series.values())
+
+
+def change_point_posterior(y: np.ndarray, min_size: int) -> np.ndarray:
+    """Posterior of the location of a single change in the mean of a series.
+
+    The segments before and after the change have unknown means and a common unknown
+    variance, with flat priors on the means and the Jeffreys prior on the variance.
+
+    Parameters:
+        y: The series.
+        min_size: Minimum number of points of each segment.
+
+    Returns:
+        The probability that the second segment starts at each index. Indices leaving
+        a segment shorter than ``min_size`` have probability zero.
+
+    """
+    n = y.size
+    log_evidence = np.full(n, -np.inf)
+    for k in range(min_size, n - min_size + 1):
+        sse = ((y[:k] - y[:k].mean()) ** 2).sum() + ((y[k:] - y[k:].mean()) ** 2).sum()
+        # Identical segments leave no residual, the change is then certain.
+        sse = max(sse, np.finfo(float).tiny)
+        log_evidence[k] = -0.5 * np.log(k * (n - k)) - 0.5 * (n - 2) * np.log(sse)
+    posterior = np.exp(log_evidence - log_evidence.max())
+    return posterior / posterior.sum()
+
+
+def _pooled_samples(points: list[Point]) -> np.ndarray:
+    return np.concatenate([np.asarray(point.samples, dtype=float) for point in points])
+
+
+def _detect(
+    series: Series,
+    lo: int,
+    hi: int,
+    alpha: float,
+    window: int,
+    min_size: int,
+) -> Iterator[Change]:
+    points = series.points[lo:hi]
+    if len(points) < 2 * min_size:
+        return
+    y = np.log([max(point.value, np.finfo(float).tiny) for point in points])
+    posterior = change_point_posterior(y, min_size)
+    k = int(np.argmax(posterior))
+
+    before = _pooled_samples(points[max(k - window, 0) : k])
+    after = _pooled_samples(points[k : k + window])
+    u, p_value = stats.mannwhitneyu(after, before, alternative="two-sided")
+    if p_value >= alpha:
+        return
+
+    median_before, median_after = np.median(before), np.median(after)
+    scores = [
+        point.calibration
+        for point in points[max(k - window, 0) : k + window]
+        if point.calibration is not None
+    ]
+    relative_change = median_after / median_before - 1 if median_before else np.inf
+    location_probability = float(posterior[max(k - 1, 0) : k + 2].sum())
+    yield Change(
+        benchmark=series.benchmark,
+        params=series.params,
+        machine=series.machine,
+        env_name=series.env_name,
+        unit=series.unit,
+        last_good=points[k - 1].commit,
+        first_bad=points[k].commit,
+        before=float(median_before),
+        after=float(median_after),
+        relative_change=float(relative_change),
+        cliffs_delta=float(2 * u / (after.size * before.size) - 1),
+        p_value=float(p_value),
+        location_probability=location_probability,
+        confidence=location_probability * (1 - float(p_value)),
+        regression=is_regression(series.type, series.unit, relative_change),
+        machine_noise=relative_spread(scores) if len(scores) >= 3 else None,
+    )
+    yield from _detect(series, lo, lo + k, alpha, window, min_size)
+    yield from _detect(series, lo + k, hi, alpha, window, min_size)
+
+
+def detect_changes(
+    series: list[Series],
+    alpha: float = 0.01,
+    min_effect: float = 0.05,
+    min_time: float = 1e-3,
+    window: int = 10,
+    min_size: int = 2,
+    noise_factor: float = 3.0,
+) -> list[Change]:
+    """Find the significant changes in the history of every series.
+
+    Parameters:
+        series: The series returned by :func:`load_series`.
+        alpha: Significance level of the Mann-Whitney test.
+        min_effect: Changes of the median below this relative change are ignored.
+        min_time: Timing benchmarks faster than this, in seconds, are ignored. Their
+            results are dominated by the noise of the machine.
+        window: Number of commits on each side of a change whose samples are
+            compared.
+        min_size: Minimum number of commits between two changes.
+        noise_factor: Changes of calibrated results smaller than this multiple of the
+            noise of the machine are ignored.
+
+    Returns:
+        The changes, ordered by decreasing confidence and effect.
+
+    """
+    changes = []
+    for s in series:
+        if s.type == "time" and max(p.value for p in s.points) < min_time:
+            continue
+        for change in _detect(s, 0, len(s.points), alpha, window, min_size):
+            threshold = max(min_effect, noise_factor * (change.machine_noise or 0))
+            if abs(change.relative_change) >= threshold:
+                changes.append(change)
+    changes.sort(key=lambda c: (-c.confidence, -abs(c.relative_change)))
+    return changes
+
+
+def write_report(changes: list[Change], path: pathlib.Path) -> None:
+    """Write changes to a JSON file, keeping the culprits found for known changes.
+
+    Parameters:
+        changes: The detected changes.
+        path: The report file. Changes already in the report keep their ``culprit``.
+
+    """
+    culprits = {}
+    if path.exists():
+        culprits = {
+            entry["key"]: entry["culprit"] for entry in json.loads(path.read_text())
+        }
+    entries = []
+    for change in changes:
+        if change.culprit is None:
+            change.culprit = culprits.get(change.key)
+        entries.append(dataclasses.asdict(change) | {"key": change.key})
+    path.write_text(json.dumps(entries, indent=1))
+
+
+def read_report(path: pathlib.Path) -> list[Change]:
+    """Read the changes written by :func:`write_report`."""
+    return [
+        Change(**{k: v for k, v in entry.items() if k != "key"})
+        for entry in json.loads(path.read_text())
+    ]
@@ -0,0 +1,274 @@
+"""Columnar store of the asv results, for publishing a long history.
+
+asv keeps one JSON file per commit, environment and machine, and ``asv publish`` parses
+all of them on every run. The store parses every results file once and appends its
+results to flat binary columns, one value per benchmark and parameter combination,
+which are read back as memory-mapped numpy arrays:
+
+- ``file``: Index of the results file in the manifest.
+- ``benchmark``: Index of the benchmark name.
+- ``params``: Index of the label of the parameter combination, e.g. ``"(1, 'mpfa')"``.
+- ``version``: Index of the benchmark version, -1 if the file records none.
+- ``value``: The result, NaN if the benchmark failed or was skipped.
+- ``weight``: The weight of the result in the step detection of asv, the inverse of
+  the half width of its 99% confidence interval, NaN if unknown.
+- ``started_at``: When the benchmark was run, in milliseconds since the epoch, NaN if
+  unknown.
+
+The results of a file are appended as a contiguous block, so the rows of a commit or a
+machine are found from the file table in ``manifest.json``, which also holds the commit,
+date and machine parameters of every file and the tables of names, labels and versions.
+The rows of a benchmark are found through a persisted sort index. The manifest records
+the number of valid rows and is replaced atomically after the columns are appended, so
+an interrupted ingest leaves the store consistent. A results file which changes after
+it was ingested, e.g. by a rerun of its commit, is ingested again and its old rows are
+marked as superseded, as are the rows of a file which was deleted, e.g. by ``asv rm``.
+A store written with another layout of the columns is rebuilt.
+
+"""
+
+import json
+import os
+import pathlib
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.regressions import _param_labels
+
+STORE_DIR = pathlib.Path(__file__).parents[1] / ".asv" / "store"
+
+# Bump this if the columns change, the store is then rebuilt.
+STORE_FORMAT_VERSION = 2
+
+COLUMNS = {
+    "file": np.int32,
+    "benchmark": np.int32,
+    "params": np.int32,
+    "version": np.int32,
+    "value": np.float64,
+    "weight": np.float64,
+    "started_at": np.float64,
+}
+
+# Files in the results directory which hold no results.
+_NON_RESULTS = {"machine.json", "benchmarks.json"}
+
+
+def _weight(ci_a: Optional[float], ci_b: Optional[float]) -> float:
+    """Weight of a result in the step detection, as ``asv.statistics.get_weight``."""
+    if ci_a is None or ci_b is None or not np.isfinite([ci_a, ci_b]).all():
+        return np.nan
+    return 2 / abs(ci_b - ci_a) if ci_b != ci_a else np.nan
+
+
+class ResultsStore:
+    """Memory-mapped columns of asv results with incremental ingestion.
+
+    Parameters:
+        path: Directory of the store, created if needed.
+
+    """
+
+    def __init__(self, path: pathlib.Path = STORE_DIR) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest = self.path / "manifest.json"
+        self.manifest: dict = {
+            "format": STORE_FORMAT_VERSION,
+            "num_rows": 0,
+            "files": [],
+            "superseded": [],
+            "benchmarks": [],
+            "params": [],
+            "versions": [],
+        }
+        if manifest.exists():
+            stored = json.loads(manifest.read_text())
+            # Otherwise, the next ingest overwrites the columns.
+            if stored.get("format") == STORE_FORMAT_VERSION:
+                self.manifest = stored
+        self._ids = {
+            table: {name: i for i, name in enumerate(self.manifest[table])}
+            for table in ("benchmarks", "params", "versions")
+        }
+
+    @property
+    def num_rows(self) -> int:
+        return self.manifest["num_rows"]
+
+    @property
+    def files(self) -> list[dict]:
+        """The ingested results files, indexed by the ``file`` column."""
+        return self.manifest["files"]
+
+    def column(self, name: str) -> np.ndarray:
+        """A read-only memory map of a column, without rows of an interrupted ingest."""
+        if self.num_rows == 0:
+            return np.zeros(0, dtype=COLUMNS[name])
+        return np.memmap(
+            self.path / f"{name}.bin",
+            dtype=COLUMNS[name],
+            mode="r",
+            shape=(self.num_rows,),
+        )
+
+    def _intern(self, table: str, name: str) -> int:
+        ids = self._ids[table]
+        if name not in ids:
+            ids[name] = len(self.manifest[table])
+            self.manifest[table].append(name)
+        return ids[name]
+
+    def _read(self, results_dir: pathlib.Path, path: pathlib.Path) -> dict:
+        data = json.loads(path.read_text())
+        columns = data["result_columns"]
+        started_at = data.get("started_at", {})
+        rows: dict[str, list] = {name: [] for name in COLUMNS}
+        for name, row in data["results"].items():
+            result = dict(zip(columns, row))
+            labels = _param_labels(result.get("params") or [])
+            values = result.get("result")
+            if not isinstance(values, list):
+                values = [None] * len(labels)
+            ci_a = result.get("stats_ci_99_a") or [None] * len(labels)
+            ci_b = result.get("stats_ci_99_b") or [None] * len(labels)
+            version = result.get("version")
+            for label, value, a, b in zip(labels, values, ci_a, ci_b):
+                rows["benchmark"].append(self._intern("benchmarks", name))
+                rows["params"].append(self._intern("params", label))
+                rows["version"].append(
+                    -1 if version is None else self._intern("versions", version)
+                )
+                rows["value"].append(np.nan if value is None else value)
+                rows["weight"].append(_weight(a, b))
+                rows["started_at"].append(started_at.get(name) or np.nan)
+        rows["file"] = [len(self.files)] * len(rows["value"])
+        stat = path.stat()
+        self.files.append(
+            {
+                "path": path.relative_to(results_dir).as_posix(),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "offset": self.num_rows,
+                "rows": len(rows["value"]),
+                "commit_hash": data["commit_hash"],
+                "date": data["date"],
+                "env_name": data["env_name"],
+                "params": data["params"],
+                "env_vars": data.get("env_vars", {}),
+            }
+        )
+        return {name: np.asarray(rows[name], dtype=COLUMNS[name]) for name in COLUMNS}
+
+    def ingest(self, results_dir: pathlib.Path) -> int:
+        """Append the results files which are new or changed since the last ingest.
+
+        Parameters:
+            results_dir: The asv results directory.
+
+        Returns:
+            The number of ingested files.
+
+        """
+        superseded = set(self.manifest["superseded"])
+        # The current file of every path.
+        known = {
+            f["path"]: i for i, f in enumerate(self.files) if i not in superseded
+        }
+        new = []
+        for path in sorted(results_dir.glob("*/*.json")):
+            if path.name in _NON_RESULTS:
+                continue
+            stat = path.stat()
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            file_id = known.pop(path.relative_to(results_dir).as_posix(), None)
+            if file_id is not None:
+                entry = self.files[file_id]
+                if [entry["size"], entry["mtime_ns"]] == stamp:
+                    continue
+                superseded.add(file_id)
+            new.append(path)
+        # The remaining known files were deleted.
+        superseded.update(known.values())
+        if not new and len(superseded) == len(self.manifest["superseded"]):
+            return 0
+
+        handles = {}
+        for name in COLUMNS:
+            handle = open(self.path / f"{name}.bin", "ab")
+            # Drop rows of an interrupted ingest.
+            handle.truncate(self.num_rows * np.dtype(COLUMNS[name]).itemsize)
+            handles[name] = handle
+        try:
+            for path in new:
+                rows = self._read(results_dir, path)
+                for name, handle in handles.items():
+                    handle.write(rows[name].tobytes())
+                self.manifest["num_rows"] += len(rows["value"])
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+        self.manifest["superseded"] = sorted(superseded)
+        tmp = self.path / "manifest.json.tmp"
+        tmp.write_text(json.dumps(self.manifest))
+        os.replace(tmp, self.path / "manifest.json")
+        self._update_index()
+        return len(new)
+
+    def _update_index(self) -> None:
+        order = np.argsort(self.column("benchmark"), kind="stable").astype(np.int64)
+        np.save(self.path / "benchmark_index.npy", order)
+
+    def benchmark_index(self) -> np.ndarray:
+        """Row numbers sorted by benchmark, and by ingestion within a benchmark."""
+        path = self.path / "benchmark_index.npy"
+        if not path.exists() or np.load(path, mmap_mode="r").size != self.num_rows:
+            self._update_index()
+        return np.load(path, mmap_mode="r")
+
+    def rows(
+        self,
+        benchmark: Optional[str] = None,
+        commit: Optional[str] = None,
+        machine: Optional[str] = None,
+    ) -> np.ndarray:
+        """Row numbers of the current results, optionally of a single benchmark,
+        commit or machine.
+
+        Parameters:
+            benchmark: Name of a benchmark.
+            commit: A commit hash, or a prefix of one.
+            machine: Name of an asv machine.
+
+        Returns:
+            The sorted row numbers, excluding rows of superseded files.
+
+        """
+        if benchmark is not None:
+            benchmark_id = self._ids["benchmarks"].get(benchmark)
+            if benchmark_id is None:
+                return np.zeros(0, dtype=np.int64)
+            index = self.benchmark_index()
+            column = self.column("benchmark")[index]
+            start, stop = np.searchsorted(column, [benchmark_id, benchmark_id + 1])
+            rows = np.sort(index[start:stop])
+        else:
+            rows = np.arange(self.num_rows)
+
+        selected = self.file_mask(commit=commit, machine=machine)
+        return rows[selected[self.column("file")[rows]]]
+
+    def file_mask(
+        self, commit: Optional[str] = None, machine: Optional[str] = None
+    ) -> np.ndarray:
+        """Which of the ingested files are current and match a commit and machine."""
+        mask = np.ones(len(self.files), dtype=bool)
+        mask[self.manifest["superseded"]] = False
+        for i, entry in enumerate(self.files):
+            if commit is not None and not entry["commit_hash"].startswith(commit):
+                mask[i] = False
+            if machine is not None and entry["params"].get("machine") != machine:
+                mask[i] = False
+        return mask
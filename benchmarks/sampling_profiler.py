@@ -0,0 +1,225 @@
+"""Statistical sampling profiler for full-size runs.
+
+Deterministic tracing with viztracer records every call, which is too heavy for the
+large 3D cases unless short calls are dropped, and the short calls are where the
+overhead of the AD framework adds up. :class:`SamplingProfiler` instead records the
+call stack of the profiled thread at a fixed rate and counts the samples per stack in
+memory. The time spent in a function is proportional to the number of samples
+containing it, at an overhead which does not depend on the number of calls.
+
+Two samplers are available:
+
+- ``py-spy``, if installed: an external process which reads the stacks of the profiled
+  process without pausing it. With ``native=True``, it also includes native frames of
+  compiled extensions (SciPy, BLAS, SuperLU), but then py-spy pauses the process to
+  read every sample, which slows down the profiled code the more, the higher the rate.
+  Attaching to a process needs ptrace permissions, e.g. root or
+  ``kernel.yama.ptrace_scope=0``.
+- ``thread``: a thread of the profiled process which reads the Python stack of the
+  profiled thread with ``sys._current_frames``. Python frames only, and calls into
+  compiled code which hold the GIL delay the sample until they return.
+
+Example:
+    >>> with SamplingProfiler(rate=100) as profiler:
+    ...     pp.run_time_dependent_model(model)
+    >>> profiler.write_speedscope("profile.speedscope.json")
+    >>> profiler.write_collapsed_stacks("profile.collapsed")
+
+The speedscope file can be loaded into https://www.speedscope.app, the collapsed stacks
+can be rendered as a flame graph with ``flamegraph.pl``.
+
+"""
+
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+from typing import Optional
+
+from benchmarks.ad_profiler import relative_path
+
+# Time for py-spy to attach before the profiled code starts.
+_ATTACH_TIME = 1.0
+
+
+class SamplingProfiler:
+    """Sample the stack of the current thread at a fixed rate.
+
+    Parameters:
+        rate: Samples per second.
+        native: Include frames of native code, only available with py-spy. py-spy
+            pauses the process for every sample to read them.
+        backend: ``"py-spy"``, ``"thread"`` or ``"auto"``, which uses py-spy if it is
+            installed.
+
+    """
+
+    def __init__(self, rate: float = 100, native: bool = False, backend: str = "auto"):
+        if backend == "auto":
+            backend = "py-spy" if shutil.which("py-spy") else "thread"
+        if backend not in ("py-spy", "thread"):
+            raise ValueError(f"{backend=}")
+        self.rate = rate
+        self.native = native
+        self.backend = backend
+
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        """Number of samples of every stack, outermost frame first."""
+
+        self.duration = 0.0
+        """Wall time of the profiled code in seconds."""
+
+        self._labels: dict = {}
+
+    def __enter__(self) -> "SamplingProfiler":
+        if self.backend == "py-spy":
+            self._start_py_spy()
+        else:
+            self._target = threading.get_ident()
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        self._tic = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.duration = perf_counter() - self._tic
+        if self.backend == "py-spy":
+            self._stop_py_spy()
+        else:
+            self._stop.set()
+            self._sampler.join()
+
+    @property
+    def num_samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = relative_path(code.co_filename)
+            label = f"{code.co_name} ({path}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self) -> None:
+        interval = 1 / self.rate
+        next_sample = perf_counter() + interval
+        while not self._stop.wait(max(next_sample - perf_counter(), 0)):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            # Skip samples which are overdue, instead of taking them in a burst.
+            next_sample = max(next_sample + interval, perf_counter())
+
+    def _start_py_spy(self) -> None:
+        self._output = tempfile.NamedTemporaryFile(suffix=".txt", delete=False).name
+        cmd = [
+            "py-spy",
+            "record",
+            f"--pid={os.getpid()}",
+            f"--rate={self.rate}",
+            "--format=raw",
+            f"--output={self._output}",
+            # Aggregate by function instead of by line.
+            "--function",
+        ]
+        # py-spy can only read native stacks while the process is paused.
+        cmd.append("--native" if self.native else "--nonblocking")
+        self._py_spy = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        sleep(_ATTACH_TIME)
+        if self._py_spy.poll() is not None:
+            raise RuntimeError(
+                "py-spy failed to attach, it may need ptrace permissions. Use the"
+                " thread backend instead."
+            )
+
+    def _stop_py_spy(self) -> None:
+        # py-spy writes its output when interrupted.
+        self._py_spy.send_signal(signal.SIGINT)
+        self._py_spy.wait()
+        with open(self._output) as f:
+            for line in f:
+                # Frames are e.g. "solve (scipy/sparse/linalg/_dsolve/linsolve.py:143)".
+                frames, _, count = line.rstrip("\n").rpartition(" ")
+                self.stacks[tuple(frames.split(";"))] += int(count)
+        os.unlink(self._output)
+
+    def print_report(self, num_rows: int = 20, file: Optional[object] = None) -> None:
+        """Print the functions with the most samples, by self and inclusive time.
+
+        Parameters:
+            num_rows: Number of functions to print.
+            file: The output stream, defaults to ``sys.stdout``.
+
+        """
+        self_samples: Counter[str] = Counter()
+        inclusive_samples: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack[-1]] += count
+            for frame in set(stack):
+                inclusive_samples[frame] += count
+        total = max(self.num_samples, 1)
+        print(
+            f"{self.num_samples} samples in {self.duration:.1f} s ({self.backend})",
+            file=file,
+        )
+        for title, counts in (("Self", self_samples), ("Inclusive", inclusive_samples)):
+            print(f"\n{title:>9}  Function", file=file)
+            for frame, count in counts.most_common(num_rows):
+                print(f"{100 * count / total:8.1f}%  {frame}", file=file)
+
+    def write_collapsed_stacks(self, path: str) -> None:
+        """Write the samples in the collapsed stack format of flame graphs.
+
+        Parameters:
+            path: The output file. Every stack is written with its number of samples.
+
+        """
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                frames = ";".join(frame.replace(";", ",") for frame in stack)
+                f.write(f"{frames} {count}\n")
+
+    def write_speedscope(self, path: str, name: str = "porepy") -> None:
+        """Write the samples as a sampled profile in the format of speedscope.
+
+        Parameters:
+            path: The output file.
+            name: Name of the profile shown by speedscope.
+
+        """
+        frames: dict[str, int] = {}
+        samples = []
+        weights = []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count / self.rate)
+        profile = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": frame} for frame in frames]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": name,
+            "exporter": "porepy-profiling",
+        }
+        with open(path, "w") as f:
+            json.dump(profile, f)
@@ -0,0 +1,191 @@
+"""Complexity exponents of the simulation stages.
+
+For every geometry of ``make_benchmark_model``, the stages ``prepare_simulation``,
+``assemble_linear_system`` and ``solve_linear_system`` are timed on a ladder of grid
+sizes. A power law ``time = c * num_dofs**alpha`` is fitted to each stage and the
+exponent ``alpha`` is tracked. A fixed-size benchmark does not reveal a change in the
+complexity of a stage until it is run at production size, the exponent does.
+
+"""
+
+import sys
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.model_setups import (
+    CASE_TIMEOUTS,
+    PHYSICS,
+    make_benchmark_model,
+    start_case_budget,
+    stop_case_budget,
+)
+
+STAGES = ["prepare_simulation", "assemble_linear_system", "solve_linear_system"]
+
+# Grid ladders, from coarse to fine. The 2D geometries are refined through the cell
+# size, the 3D geometry only has its fixed refinement levels.
+LADDERS: dict[int, list[dict]] = {
+    0: [{"grid_refinement": 0, "cell_size": h} for h in (0.1, 0.05, 0.025, 0.0125)],
+    1: [{"grid_refinement": 0, "cell_size": h} for h in (0.1, 0.05, 0.025, 0.0125)],
+    2: [{"grid_refinement": 0, "cell_size": h} for h in (0.1, 0.05, 0.025)],
+    3: [{"grid_refinement": 0}, {"grid_refinement": 1}],
+}
+
+# Each point of a ladder is measured this many times, the fastest run is kept.
+SAMPLES_PER_POINT = 3
+
+# Cell sizes of the grid refinement levels of the 2D geometries in make_benchmark_model.
+_CELL_SIZES_2D = {0: 0.1, 1: 0.01, 2: 0.005}
+
+
+def measure_stages(args: dict) -> tuple[int, dict[str, float]]:
+    """Time the stages of a single Newton iteration of a fresh benchmark model.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``.
+
+    Returns:
+        The number of degrees of freedom of the model and the wall time in seconds of
+        each stage in :data:`STAGES`.
+
+    """
+    model = make_benchmark_model(args)
+    timings = {}
+
+    tic = perf_counter()
+    model.prepare_simulation()
+    timings["prepare_simulation"] = perf_counter() - tic
+
+    model.before_nonlinear_loop()
+    model.before_nonlinear_iteration()
+    tic = perf_counter()
+    model.assemble_linear_system()
+    timings["assemble_linear_system"] = perf_counter() - tic
+
+    tic = perf_counter()
+    model.solve_linear_system()
+    timings["solve_linear_system"] = perf_counter() - tic
+
+    return model.equation_system.num_dofs(), timings
+
+
+def fit_exponent(num_dofs: list[int], times: list[float]) -> float:
+    """Fit ``time = c * num_dofs**alpha`` in the least-squares sense in log-log space.
+
+    Parameters:
+        num_dofs: Problem sizes, at least two distinct values.
+        times: Measured times for the corresponding sizes.
+
+    Returns:
+        The exponent ``alpha``.
+
+    """
+    slope, _ = np.polyfit(np.log(num_dofs), np.log(times), 1)
+    return float(slope)
+
+
+def budget_refinement(point: dict) -> int:
+    """The grid refinement level whose time budget applies to a point of a ladder.
+
+    This is the coarsest level with a grid at least as fine as the point, so that the
+    budget is an upper bound for the point.
+
+    """
+    if "cell_size" not in point:
+        return point["grid_refinement"]
+    finer = [r for r, h in _CELL_SIZES_2D.items() if h <= point["cell_size"]]
+    return min(finer) if finer else max(_CELL_SIZES_2D)
+
+
+def ladder_points(physics: str, geometry: int) -> list[dict]:
+    """The points of the ladder of a geometry, without the skipped refinements."""
+    points = []
+    for point in LADDERS[geometry]:
+        key = (physics, geometry, budget_refinement(point))
+        if CASE_TIMEOUTS[key] is not None:
+            points.append({"physics": physics, "geometry": geometry} | point)
+    return points
+
+
+def measure_scaling(physics: str, geometry: int) -> Optional[dict[str, float]]:
+    """Measure a ladder and fit the complexity exponent of each stage.
+
+    Every sample runs under the time budget of :func:`budget_refinement`. The ladder
+    is cut at the first point exceeding its budget, the finer points would exceed
+    theirs as well.
+
+    Parameters:
+        physics: The physics of the model.
+        geometry: The geometry of the model.
+
+    Returns:
+        The fitted exponent of each stage in :data:`STAGES`, or None if fewer than two
+        points of the ladder were measured.
+
+    """
+    num_dofs: list[int] = []
+    times: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    for args in ladder_points(physics, geometry):
+        samples = []
+        try:
+            for _ in range(SAMPLES_PER_POINT):
+                start_case_budget(physics, geometry, budget_refinement(args))
+                try:
+                    samples.append(measure_stages(args))
+                finally:
+                    stop_case_budget()
+        except TimeoutError:
+            print(f"{args} timed out, the ladder ends before it.", file=sys.stderr)
+            break
+        num_dofs.append(samples[0][0])
+        for stage in STAGES:
+            times[stage].append(min(s[1][stage] for s in samples))
+    # A power law cannot be fitted through a single point.
+    if len(num_dofs) < 2:
+        return None
+    return {stage: fit_exponent(num_dofs, times[stage]) for stage in STAGES}
+
+
+class ScalingExponents:
+    """Complexity exponents of the stages, w.r.t. the number of degrees of freedom.
+
+    An exponent of one means linear scaling. Note that the exponent of the linear solve
+    depends on the solver, while assembly is expected to scale linearly.
+
+    """
+
+    params = [PHYSICS, list(LADDERS)]
+    param_names = ["physics", "geometry"]
+    timeout = 7200
+
+    def setup_cache(self):
+        exponents = {}
+        for physics in PHYSICS:
+            for geometry in LADDERS:
+                if len(ladder_points(physics, geometry)) < 2:
+                    continue
+                result = measure_scaling(physics, geometry)
+                if result is not None:
+                    exponents[(physics, geometry)] = result
+        return exponents
+
+    def setup(self, exponents, physics, geometry):
+        if (physics, geometry) not in exponents:
+            raise NotImplementedError(f"{physics=}, {geometry=}")
+
+    def track_prepare_simulation(self, exponents, physics, geometry):
+        return exponents[(physics, geometry)]["prepare_simulation"]
+
+    track_prepare_simulation.unit = "exponent"  # type: ignore[attr-defined]
+
+    def track_assemble_linear_system(self, exponents, physics, geometry):
+        return exponents[(physics, geometry)]["assemble_linear_system"]
+
+    track_assemble_linear_system.unit = "exponent"  # type: ignore[attr-defined]
+
+    def track_solve_linear_system(self, exponents, physics, geometry):
+        return exponents[(physics, geometry)]["solve_linear_system"]
+
+    track_solve_linear_system.unit = "exponent"  # type: ignore[attr-defined]
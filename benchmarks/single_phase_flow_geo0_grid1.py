@@ -1,11 +1,18 @@
 import porepy as pp
 import numpy as np
-from benchmarks.model_setups import make_benchmark_model
+from benchmarks.model_setups import (
+    RUN_PARAMS,
+    _RunSimulationNormalized,
+    fastest_run_statistics,
+    make_benchmark_model,
+)
 
 
-def make_model():
+def make_model(cached=False):
+    # The cached model skips meshing and discretization, use it whenever these are not
+    # what is being timed.
     return make_benchmark_model(
-        {"geometry": 0, "grid_refinement": 1, "physics": "flow"}
+        {"geometry": 0, "grid_refinement": 1, "physics": "flow"}, cached=cached
     )
 
 
@@ -25,7 +32,7 @@ class PreSolve:
     repeat = 5
 
     def setup(self):
-        self.model = make_model()
+        self.model = make_model(cached=True)
         self.model.prepare_simulation()
 
     def time_pre_solve(self):
@@ -39,7 +46,7 @@ class Solve:
     repeat = 5
 
     def setup(self):
-        self.model = make_model()
+        self.model = make_model(cached=True)
         self.model.prepare_simulation()
         self.model.before_nonlinear_loop()
         self.model.before_nonlinear_iteration()
@@ -49,22 +56,20 @@ class Solve:
         self.model.solve_linear_system()
 
 
-# class RunSimulation:
+class RunSimulation:
+
+    repeat = 1
+    timeout = 600
+
+    def setup(self):
+        self.model = make_model(cached=True)
+        self.model.prepare_simulation()
+
+    def time_run_simulation(self):
+        pp.run_time_dependent_model(self.model, RUN_PARAMS)
 
-#     repeat = 1
 
-#     def setup(self):
-#         self.model = make_model()
-#         self.model.prepare_simulation()
+class RunSimulationNormalized(_RunSimulationNormalized):
 
-#     def time_run_simulation(self):
-#         pp.run_time_dependent_model(
-#             self.model,
-#             {
-#                 "prepare_simulation": False,
-#                 "nl_divergence_tol": 1e8,
-#                 "max_iterations": 25,
-#                 "nl_convergence_tol": 1e-2,
-#                 "nl_convergence_tol_res": 1e-2,
-#             },
-#         )
+    def setup_cache(self):
+        return fastest_run_statistics(lambda: make_model(cached=True))
@@ -0,0 +1,85 @@
+"""Timings recorded by ``TimedSolutionStrategy`` as asv metrics.
+
+Every timing of ``larger_models/base_model.py::TimeMeasurements``, including the
+granular timings per discretization and per equation, gets its own graph on the
+dashboard. The timings are recorded for one time step of the nightly cases, geometry 0
+with grid refinement 1.
+
+The granular timings are parameterized over the equations and discretizations listed
+in ``model_setups.py``. Timings which a physics does not record are skipped, and
+recorded timings missing from the parameters are reported on stderr.
+
+"""
+
+import sys
+
+import porepy as pp
+
+from benchmarks.model_setups import (
+    DIMENSIONS,
+    DISCRETIZATIONS,
+    EQUATIONS,
+    PHYSICS,
+    RUN_PARAMS,
+    make_benchmark_model,
+)
+
+# The timings of the stages, the fields of ``TimeMeasurements`` in
+# ``larger_models/base_model.py``.
+STAGES = [
+    "set_geometry",
+    "set_equations",
+    "discretization_parameters",
+    "full_discretization",
+    "rediscretization",
+    "before_nonlinear_iteration",
+    "full_assembly",
+    "linear_solve",
+    "after_nonlinear_iteration",
+    "check_nonlinear_convergence",
+    "visualization",
+]
+
+# Names of the timings as flattened by ``TimeMeasurements.flatten``.
+TIMING_NAMES = (
+    STAGES
+    + [f"assembly: {name}" for name in EQUATIONS]
+    + [
+        f"discretization: {name}_ dim={dim}"
+        for name in DISCRETIZATIONS
+        for dim in DIMENSIONS
+    ]
+)
+
+
+class StageTimings:
+    """Total time of each stage and granular timing over the simulation."""
+
+    params = [PHYSICS, TIMING_NAMES]
+    param_names = ["physics", "timing"]
+    timeout = 1800
+
+    def setup_cache(self):
+        timings = {}
+        for physics in PHYSICS:
+            model = make_benchmark_model(
+                {"geometry": 0, "grid_refinement": 1, "physics": physics}, timed=True
+            )
+            # The records are returned to asv instead.
+            model.params["timings_file"] = None
+            model.prepare_simulation()
+            pp.run_time_dependent_model(model, RUN_PARAMS)
+            timings[physics] = model.timings_record()["timings"]
+            for name in sorted(set(timings[physics]) - set(TIMING_NAMES)):
+                print(f"Timing {name!r} of {physics} is not tracked.", file=sys.stderr)
+        return timings
+
+    def setup(self, timings, physics, timing):
+        # Granular timings of one physics do not exist for the other.
+        if timing not in timings[physics]:
+            raise NotImplementedError(f"{physics=}, {timing=}")
+
+    def track_time(self, timings, physics, timing):
+        return timings[physics][timing]
+
+    track_time.unit = "seconds"  # type: ignore[attr-defined]
@@ -0,0 +1,132 @@
+"""Thread scaling of the linear solve.
+
+The other benchmarks pin BLAS and OpenMP to a single thread. Here, the linear solve of
+each benchmark case is timed in fresh subprocesses with 1, 2, 4 and all available
+threads, since the thread pools of the numerical libraries are sized when they are
+loaded. Speedup and parallel efficiency are tracked relative to the single-threaded
+solve.
+
+"""
+
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+from benchmarks.model_setups import (
+    CASE_TIMEOUTS,
+    GEOMETRIES,
+    PHYSICS,
+    default_case_args,
+)
+
+# The CPUs this process may run on, e.g. the core of a worker of run_parallel.py.
+if hasattr(os, "sched_getaffinity"):
+    NUM_CPUS = len(os.sched_getaffinity(0))
+else:
+    NUM_CPUS = os.cpu_count() or 1
+THREAD_COUNTS = sorted({n for n in (1, 2, 4) if n <= NUM_CPUS} | {NUM_CPUS})
+
+# Number of timed solves per subprocess, the fastest is kept.
+NUM_SOLVES = 3
+
+_THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+_SOLVE_SCRIPT = """
+import json
+import sys
+from time import perf_counter
+
+from benchmarks.model_setups import make_benchmark_model
+
+model = make_benchmark_model(json.loads(sys.argv[1]), cached=True)
+model.prepare_simulation()
+model.before_nonlinear_loop()
+model.before_nonlinear_iteration()
+model.assemble_linear_system()
+times = []
+for _ in range(int(sys.argv[2])):
+    tic = perf_counter()
+    model.solve_linear_system()
+    times.append(perf_counter() - tic)
+print(json.dumps(min(times)))
+"""
+
+
+def _solve_time_with_threads(args: dict, num_threads: int) -> float:
+    """Time the linear solve of a benchmark case in a fresh subprocess.
+
+    Parameters:
+        args: The arguments passed to ``make_benchmark_model``.
+        num_threads: Number of threads of BLAS, OpenMP and related thread pools.
+
+    Returns:
+        The fastest of :data:`NUM_SOLVES` solves, in seconds.
+
+    """
+    env = os.environ | {name: str(num_threads) for name in _THREAD_VARIABLES}
+    result = subprocess.run(
+        [sys.executable, "-c", _SOLVE_SCRIPT, json.dumps(args), str(NUM_SOLVES)],
+        # The benchmarks package must be importable in the subprocess.
+        cwd=pathlib.Path(__file__).parents[1],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class ThreadScaling:
+    """Solve time, speedup and parallel efficiency per number of threads."""
+
+    params = [PHYSICS, GEOMETRIES, THREAD_COUNTS]
+    param_names = ["physics", "geometry", "threads"]
+    timeout = 7200
+
+    def setup_cache(self):
+        times = {}
+        for physics in PHYSICS:
+            for geometry in GEOMETRIES:
+                args = default_case_args(physics, geometry)
+                if CASE_TIMEOUTS[(physics, geometry, args["grid_refinement"])] is None:
+                    continue
+                for threads in THREAD_COUNTS:
+                    try:
+                        times[(physics, geometry, threads)] = (
+                            _solve_time_with_threads(args, threads)
+                        )
+                    except subprocess.CalledProcessError as error:
+                        print(
+                            f"{physics=}, {geometry=}, {threads=} failed:\n"
+                            f"{error.stderr}",
+                            file=sys.stderr,
+                        )
+        return times
+
+    def setup(self, times, physics, geometry, threads):
+        # The speedup is relative to the single-threaded solve.
+        if {(physics, geometry, threads), (physics, geometry, 1)} - times.keys():
+            raise NotImplementedError(f"{physics=}, {geometry=}, {threads=}")
+
+    def track_solve_time(self, times, physics, geometry, threads):
+        return times[(physics, geometry, threads)]
+
+    track_solve_time.unit = "seconds"  # type: ignore[attr-defined]
+
+    def track_speedup(self, times, physics, geometry, threads):
+        return times[(physics, geometry, 1)] / times[(physics, geometry, threads)]
+
+    track_speedup.unit = "speedup"  # type: ignore[attr-defined]
+
+    def track_parallel_efficiency(self, times, physics, geometry, threads):
+        return self.track_speedup(times, physics, geometry, threads) / threads
+
+    track_parallel_efficiency.unit = "efficiency"  # type: ignore[attr-defined]
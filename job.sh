@@ -17,10 +17,26 @@ git reset --hard main  # This is a safeguard if something unexpected happens.
 git pull origin main
 
 echo "Starting asv profiling"
-/usr/local/bin/asv run 2eade74a9441050215920da28370e1d701f800fd..develop --steps=10 --skip-existing-commits --launch-method=spawn --show-stderr
+/usr/local/bin/asv run 2eade74a9441050215920da28370e1d701f800fd..develop --steps=10 --skip-existing-commits --launch-method=spawn --show-stderr --record-samples
+# On a multi-core host, every commit can be benchmarked in parallel instead:
+# python run_parallel.py 2eade74a9441050215920da28370e1d701f800fd..develop --skip_existing -- --show-stderr --record-samples
+# Or without rebuilding PorePy for every commit, in reused environments:
+# python run_fast_sweep.py 2eade74a9441050215920da28370e1d701f800fd..develop --steps 10 --skip_existing -- --show-stderr --record-samples
+# Or only the benchmarks executing the changed PorePy modules in full:
+# python run_selective.py 2eade74a9441050215920da28370e1d701f800fd..develop --steps 10 --skip_existing -- --show-stderr --record-samples
+
+# Re-measure noisy benchmarks with calibration of the machine and adaptive repeats:
+# python run_noise_controlled.py develop --bench "Solve.time_solve"
+
+echo "Detecting regressions"
+python run_regressions.py || echo "Regression detection failed."
+# Narrow down the most confident new regression to a single commit.
+python run_bisect.py --max_regressions 1 || echo "Bisection failed."
 
 echo "Generating html report"
-/usr/local/bin/asv publish
+# Only new results files are parsed, see run_publish.py. For a full rebuild by asv:
+# /usr/local/bin/asv publish
+python run_publish.py
 
 # Folder to check
 FOLDER_TO_CHECK=".asv/"
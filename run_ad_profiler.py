@@ -0,0 +1,116 @@
+"""This runscript runs a selected porepy benchmark with the AD operator profiler
+enabled and reports which operators dominate the assembly.
+
+For every node of the evaluated operator trees, the profiler records self time, call
+count and the sparsity of the result. The report ranks the operator types and the
+source locations where the operators are created. The full call structure is written
+in the collapsed stack format, which can be turned into a flame graph.
+
+Example:
+    >>> python run_ad_profiler.py --physics poromechanics --geometry 0
+    # This will profile the operator evaluation of a poromechanics benchmark on the
+    # first 2D case with the default, coarsest grid refinement.
+    >>> flamegraph.pl profiling_ad_poromechanics_0_0.collapsed > flame.svg
+    # Render the flame graph, alternatively drop the file on https://www.speedscope.app.
+
+"""
+
+import argparse
+
+import porepy as pp
+
+from benchmarks.ad_profiler import OperatorProfiler
+from benchmarks.model_setups import make_benchmark_model
+
+
+def run_model_with_ad_profiler(args, model) -> None:
+    """Run a model with the AD operator profiler enabled.
+
+    Parameters:
+        args: Command-line arguments containing the following attributes:
+            - physics (str): The physics of the model.
+            - geometry (str): The geometry of the model.
+            - grid_refinement (int): The grid refinement level for the model.
+            - save_file (str): The file path to save the collapsed stacks to. If empty,
+            a default name is generated based on chosen physics, geometry, and grid
+            refinement.
+            - num_rows (int): Number of rows of the printed tables.
+        model: The model to be run and profiled.
+
+    Returns:
+        None
+
+    """
+    if args.save_file == "":
+        save_file = (
+            f"profiling_ad_{args.physics}_{args.geometry}_{args.grid_refinement}"
+            ".collapsed"
+        )
+    else:
+        save_file = args.save_file
+
+    # The profiler must be active during prepare_simulation to locate where the
+    # operators are created.
+    with OperatorProfiler() as profiler:
+        model.prepare_simulation()
+        print("Num dofs:", model.equation_system.num_dofs())
+        pp.run_time_dependent_model(
+            model,
+            {
+                "prepare_simulation": False,
+                "nl_divergence_tol": 1e8,
+                "max_iterations": 25,
+                "nl_convergence_tol": 1e-2,
+                "nl_convergence_tol_res": 1e-2,
+            },
+        )
+
+    profiler.print_report(num_rows=args.num_rows)
+    profiler.write_collapsed_stacks(save_file)
+    print(f"Collapsed stacks written to {save_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--physics",
+        type=str,
+        default="flow",
+        choices=["flow", "poromechanics"],
+        help="Physics to run. Choices are single-phase flow or poromechanics.",
+    )
+    parser.add_argument(
+        "--geometry",
+        type=int,
+        default=0,
+        choices=[0, 1, 2, 3],
+        help=(
+            "0: 1st 2D case, 1: 2nd 2D case, 2: 2D case with 64 fractures, 3: 3D case."
+        ),
+    )
+    parser.add_argument(
+        "--grid_refinement",
+        type=int,
+        default=0,
+        choices=[0, 1, 2],
+        help="Level of grid refinement. For the 2D cases, this corresponds to cell"
+        + " sizes 0.1, 0.01, and 0.005. For the 3D cases, this corresponds to 30K,"
+        + " 140K, 350K cells.",
+    )
+    parser.add_argument(
+        "--save_file",
+        type=str,
+        default="",
+        help="File to save the collapsed stacks to. If not specified, the file will be"
+        + " named after the chosen physics, geometry, and grid refinement.",
+    )
+    parser.add_argument(
+        "--num_rows",
+        type=int,
+        default=20,
+        help="Number of rows in the tables of operator types and creation sites.",
+    )
+
+    args = parser.parse_args()
+    model = make_benchmark_model(args.__dict__)
+    run_model_with_ad_profiler(args, model)
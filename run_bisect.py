@@ -0,0 +1,202 @@
+"""This runscript bisects the regressions found by ``run_regressions.py`` down to the
+offending commit and records it in the regression report.
+
+The nightly job only benchmarks a sample of the commits, so a regression is located
+between two sampled commits. For every regression of this machine without a culprit,
+only the affected benchmark is run on intermediate commits with ``asv run``, reusing
+the existing asv environments. The results of these runs are written to
+``.asv/bisect/results``, since the nightly job would take the commits for benchmarked
+if they had single results in ``.asv/results``. A commit is bad if its median is
+closer to the median after the regression than to the median before it, in
+logarithmic scale. Commits which fail to build or run are skipped.
+
+Example:
+    >>> python run_bisect.py
+    # Bisect all regressions of this machine in .asv/regressions.json.
+    >>> python run_bisect.py --max_regressions 1 -- --show-stderr
+    # Bisect only the most confident regression. Arguments after "--" are passed to
+    # "asv run".
+
+"""
+
+import argparse
+import json
+import math
+import pathlib
+import platform
+import re
+import statistics
+import subprocess
+from typing import Optional
+
+from asv import util as asv_util
+from asv.config import Config
+from asv.repo import get_repo
+
+from benchmarks.regressions import Change, read_report, read_results_file, write_report
+
+ROOT = pathlib.Path(__file__).parent
+BISECT_DIR = ROOT / ".asv" / "bisect"
+
+
+def bisect_config(config_path: pathlib.Path) -> pathlib.Path:
+    """Write an asv configuration for the bisection runs.
+
+    It is the main configuration with the results in ``.asv/bisect/results``, and the
+    environments of the main configuration.
+
+    Parameters:
+        config_path: Path to the main asv configuration.
+
+    Returns:
+        Path to the written configuration.
+
+    """
+    conf = Config.load(str(config_path))
+    bisect_dir = BISECT_DIR.resolve()
+    bisect_dir.mkdir(parents=True, exist_ok=True)
+    raw_conf = asv_util.load_json(str(config_path), js_comments=True)
+    bisect_conf = raw_conf | {
+        "env_dir": str((ROOT / conf.env_dir).resolve()),
+        "results_dir": str(bisect_dir / "results"),
+        "html_dir": str(bisect_dir / "html"),
+        "benchmark_dir": str((ROOT / conf.benchmark_dir).resolve()),
+    }
+    path = bisect_dir / "asv.conf.json"
+    path.write_text(json.dumps(bisect_conf, indent=4))
+    return path
+
+
+def run_benchmark(
+    conf: Config, change: Change, commit: str, asv_args: list[str]
+) -> Optional[float]:
+    """Run the benchmark of a change on a commit.
+
+    Parameters:
+        conf: The asv configuration of :func:`bisect_config`.
+        change: The regression, which determines benchmark, machine and environment.
+        commit: The commit to benchmark.
+        asv_args: Additional arguments for ``asv run``.
+
+    Returns:
+        The median of the samples of the parameter combination of the change, or None
+        if the commit failed to build or run.
+
+    """
+    python = change.env_name.rsplit("-py", 1)[1]
+    subprocess.run(
+        [
+            "asv",
+            "run",
+            f"{commit}^!",
+            f"--config={BISECT_DIR.resolve() / 'asv.conf.json'}",
+            # Parameterized benchmarks are matched as "name(param0, param1)".
+            f"--bench=^{re.escape(change.benchmark + change.params)}$",
+            f"--machine={change.machine}",
+            f"--python={python}",
+            "--launch-method=spawn",
+            "--record-samples",
+        ]
+        + asv_args,
+        cwd=ROOT,
+    )
+    results_file = f"{commit[:8]}-{change.env_name}.json"
+    path = pathlib.Path(conf.results_dir) / change.machine / results_file
+    if not path.exists():
+        return None
+    for name, label, point in read_results_file(path):
+        if name == change.benchmark and label == change.params:
+            return statistics.median(point.samples)
+    return None
+
+
+def is_bad(value: float, change: Change) -> bool:
+    """Whether a result is closer to the level after the regression than before."""
+    return abs(math.log(value / change.after)) < abs(math.log(value / change.before))
+
+
+def bisect(conf: Config, change: Change, asv_args: list[str]) -> str:
+    """Narrow the range of a regression down to a single commit.
+
+    Parameters:
+        conf: The asv configuration.
+        change: The regression.
+        asv_args: Additional arguments for ``asv run``.
+
+    Returns:
+        The first bad commit.
+
+    """
+    repo = get_repo(conf)
+    # Commits strictly between the last good and the first bad commit, oldest first.
+    candidates = list(
+        reversed(repo.get_hashes_from_range(f"{change.last_good}..{change.first_bad}"))
+    )[:-1]
+    bad = change.first_bad
+    while candidates:
+        mid = len(candidates) // 2
+        commit = candidates[mid]
+        print(f"{len(candidates)} candidates left, testing {commit[:8]}", flush=True)
+        value = run_benchmark(conf, change, commit, asv_args)
+        if value is None:
+            print(f"Skipping {commit[:8]}, no result.")
+            del candidates[mid]
+        elif is_bad(value, change):
+            bad = commit
+            candidates = candidates[:mid]
+        else:
+            candidates = candidates[mid + 1 :]
+    return bad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--report",
+        type=str,
+        default=str(ROOT / ".asv" / "regressions.json"),
+        help="The regression report written by run_regressions.py.",
+    )
+    parser.add_argument(
+        "--machine",
+        type=str,
+        default=platform.node(),
+        help="Bisect the regressions of this asv machine. Defaults to the hostname.",
+    )
+    parser.add_argument(
+        "--max_regressions",
+        type=int,
+        default=None,
+        help="Bisect at most this many regressions, the most confident first.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+    parser.add_argument(
+        "asv_args",
+        nargs=argparse.REMAINDER,
+        help="Additional arguments for 'asv run', after '--'.",
+    )
+
+    args = parser.parse_args()
+    asv_args = [a for a in args.asv_args if a != "--"]
+    conf = Config.load(str(bisect_config(pathlib.Path(args.config))))
+    report = pathlib.Path(args.report)
+    changes = read_report(report)
+    pending = [
+        change
+        for change in changes
+        if change.regression
+        and change.culprit is None
+        and change.machine == args.machine
+    ]
+    get_repo(conf).pull()
+    for change in pending[: args.max_regressions]:
+        print(f"Bisecting {change.key}")
+        change.culprit = bisect(conf, change, asv_args)
+        print(f"Culprit: {change.culprit}")
+        # Save after every bisection, a single one may take hours.
+        write_report(changes, report)
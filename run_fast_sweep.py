@@ -0,0 +1,267 @@
+"""This runscript benchmarks a range of commits without rebuilding PorePy for every
+commit, and files the results under the regular asv environments.
+
+For every commit, asv builds a wheel of PorePy and reinstalls it in each environment,
+which takes most of the time of a nightly sweep. Since PorePy is pure Python, this is
+not needed: here, every Python version has a single virtual environment, created once
+with the dependencies of PorePy, in which PorePy is installed in editable mode from a
+git worktree. Switching to the next commit is a checkout of the worktree. PorePy is
+only reinstalled if its dependencies changed. The benchmarks run through asv on the
+environment as an existing environment, and the results are renamed to the regular
+environment names, e.g. ``virtualenv-py3.11``, so the dashboard shows a single series.
+
+Example:
+    >>> python run_fast_sweep.py 2eade74a9441050215920da28370e1d701f800fd..develop
+    # Benchmark every commit in the range.
+    >>> python run_fast_sweep.py HEAD~20..develop --steps 10 --skip_existing
+    # Benchmark 10 commits of the range which have no results yet.
+    >>> python run_fast_sweep.py HEAD^! -- --quick --show-stderr
+    # Arguments after "--" are passed to "asv run".
+
+Note: The environments live in ``.asv/env/fast``. Delete the directory to recreate them,
+    e.g. after an update of the dependencies which is not reflected in the dependency
+    files of PorePy.
+
+"""
+
+import argparse
+import hashlib
+import json
+import pathlib
+import subprocess
+from typing import Optional
+
+from asv import util as asv_util
+from asv.config import Config
+
+from run_parallel import merge_results
+
+ROOT = pathlib.Path(__file__).parent
+
+# Files of PorePy which define its dependencies. PorePy is reinstalled if they change.
+DEPENDENCY_FILES = ["pyproject.toml", "setup.py", "setup.cfg", "requirements.txt"]
+
+
+def git(*args: str) -> str:
+    """Run a git command and return its output."""
+    return subprocess.run(
+        ["git", *args], capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def update_mirror(conf: Config) -> pathlib.Path:
+    """Clone or fetch a local mirror of the benchmarked repository.
+
+    Parameters:
+        conf: The asv configuration, which defines the repository.
+
+    Returns:
+        The path of the bare mirror in the asv environment directory.
+
+    """
+    mirror = (ROOT / conf.env_dir / "fast" / "porepy.git").resolve()
+    if not mirror.exists():
+        git("clone", "--mirror", conf.repo, str(mirror))
+    else:
+        git(f"--git-dir={mirror}", "fetch", "--prune", "origin")
+    return mirror
+
+
+class FastSweep:
+    """Benchmark commits in reused environments with an editable install of PorePy.
+
+    Parameters:
+        config_path: Path to the asv configuration.
+        asv_args: Additional arguments for ``asv run``.
+
+    """
+
+    def __init__(self, config_path: pathlib.Path, asv_args: list[str]) -> None:
+        self.conf = Config.load(str(config_path))
+        self.results_dir = (ROOT / self.conf.results_dir).resolve()
+        self.asv_args = asv_args
+
+        self.path = (ROOT / self.conf.env_dir / "fast").resolve()
+        self.mirror = self.path / "porepy.git"
+        self.worktree = self.path / "porepy"
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        # The environments are created here, asv only runs the benchmarks.
+        raw_conf = asv_util.load_json(str(config_path), js_comments=True)
+        self.config_file = self.path / "asv.conf.json"
+        self.config_file.write_text(
+            json.dumps(
+                raw_conf
+                | {
+                    "results_dir": str(self.path / "results"),
+                    "html_dir": str(self.path / "html"),
+                    "benchmark_dir": str((ROOT / self.conf.benchmark_dir).resolve()),
+                },
+                indent=4,
+            )
+        )
+
+    def update_source(self) -> None:
+        """Fetch the PorePy repository and create the worktree if needed."""
+        update_mirror(self.conf)
+        if not self.worktree.exists():
+            git(
+                f"--git-dir={self.mirror}",
+                "worktree",
+                "add",
+                "--detach",
+                str(self.worktree),
+                self.conf.branches[0],
+            )
+
+    def checkout(self, commit: str) -> None:
+        """Check out a commit in the worktree, which the environments import from."""
+        git("-C", str(self.worktree), "checkout", "--detach", "--force", commit)
+
+    def commits(self, range_spec: str, steps: Optional[int]) -> list[str]:
+        """Commit hashes in a range, oldest first, optionally sampled to ``steps``."""
+        hashes = git(
+            f"--git-dir={self.mirror}",
+            "rev-list",
+            "--first-parent",
+            "--reverse",
+            range_spec,
+        ).split()
+        if steps is not None and len(hashes) > steps:
+            stride = (len(hashes) - 1) / max(steps - 1, 1)
+            hashes = [hashes[round(i * stride)] for i in range(steps)]
+        return hashes
+
+    def env_name(self, python: str) -> str:
+        """Name of the regular asv environment of a Python version."""
+        return f"{self.conf.environment_type}-py{python}"
+
+    def has_results(self, commit: str, python: str) -> bool:
+        """Whether the main results already contain a commit."""
+        pattern = f"*/{commit[:8]}-{self.env_name(python)}.json"
+        return any(self.results_dir.glob(pattern))
+
+    def python_executable(self, python: str) -> pathlib.Path:
+        """The interpreter of the environment of a Python version, created if needed."""
+        venv = self.path / f"py{python}"
+        executable = venv / "bin" / "python"
+        if not executable.exists():
+            subprocess.run([f"python{python}", "-m", "venv", str(venv)], check=True)
+            subprocess.run(
+                [executable, "-m", "pip", "install", "--upgrade", "pip", "asv_runner"],
+                check=True,
+            )
+        return executable
+
+    def install(self, python: str) -> None:
+        """Install PorePy in editable mode, unless its dependencies are unchanged."""
+        digest = hashlib.sha256()
+        for name in DEPENDENCY_FILES:
+            if (self.worktree / name).exists():
+                digest.update(name.encode() + (self.worktree / name).read_bytes())
+        executable = self.python_executable(python)
+        stamp = executable.parents[1] / "porepy-dependencies.sha256"
+        if stamp.exists() and stamp.read_text() == digest.hexdigest():
+            return
+        subprocess.run(
+            [executable, "-m", "pip", "install", "--editable", str(self.worktree)],
+            check=True,
+        )
+        stamp.write_text(digest.hexdigest())
+
+    def run(self, commit: str, python: str) -> int:
+        """Benchmark the checked out commit with a Python version, merge the results."""
+        self.install(python)
+        executable = self.python_executable(python)
+        returncode = subprocess.run(
+            [
+                "asv",
+                "run",
+                f"--config={self.config_file}",
+                f"--environment=existing:{executable}",
+                f"--set-commit-hash={commit}",
+                "--launch-method=spawn",
+            ]
+            + self.asv_args,
+            cwd=ROOT,
+        ).returncode
+
+        # File the results under the regular environment.
+        results = self.path / "results"
+        for path in results.glob(f"*/{commit[:8]}-existing-*.json"):
+            data = json.loads(path.read_text())
+            data["env_name"] = self.env_name(python)
+            path.with_name(f"{commit[:8]}-{data['env_name']}.json").write_text(
+                json.dumps(data)
+            )
+            path.unlink()
+        merge_results(results, self.results_dir)
+        return returncode
+
+    def sweep(self, commits: list[str], pythons: list[str], skip_existing: bool) -> int:
+        """Benchmark all commits and return the number of failed runs."""
+        num_failed = 0
+        for commit in commits:
+            todo = [
+                python
+                for python in pythons
+                if not (skip_existing and self.has_results(commit, python))
+            ]
+            if not todo:
+                continue
+            self.checkout(commit)
+            for python in todo:
+                print(f"{commit[:8]} py{python}", flush=True)
+                num_failed += self.run(commit, python) != 0
+        return num_failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "range",
+        type=str,
+        help="Commit range to benchmark, in the syntax of 'git rev-list', e.g."
+        + " A..develop.",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=None,
+        help="Sample this many commits from the range. By default, all commits run.",
+    )
+    parser.add_argument(
+        "--skip_existing",
+        action="store_true",
+        default=False,
+        help="Skip commits which already have results in the main results directory.",
+    )
+    parser.add_argument(
+        "--python",
+        type=str,
+        action="append",
+        default=None,
+        help="Python version to run, can be repeated. Defaults to the asv config.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+    parser.add_argument(
+        "asv_args",
+        nargs=argparse.REMAINDER,
+        help="Additional arguments for 'asv run', after '--'.",
+    )
+
+    args = parser.parse_args()
+    asv_args = [a for a in args.asv_args if a != "--"]
+    sweep = FastSweep(pathlib.Path(args.config), asv_args)
+    sweep.update_source()
+    commits = sweep.commits(args.range, args.steps)
+    pythons = args.python or sweep.conf.pythons
+    print(f"Running {len(commits)} commits.")
+    num_failed = sweep.sweep(commits, pythons, args.skip_existing)
+    if num_failed:
+        raise SystemExit(f"{num_failed} runs failed.")
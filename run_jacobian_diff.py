@@ -0,0 +1,98 @@
+"""This runscript compares the archived Jacobian structures of two PorePy commits and
+lists the equations and variables whose blocks gained or lost nonzeros.
+
+The structures are archived in ``.asv/jacobians`` by the ``JacobianSize`` benchmarks
+for every benchmarked commit. A commit which is not archived yet can be recorded with
+``--record``, using the currently installed PorePy.
+
+Example:
+    >>> python run_jacobian_diff.py 1a2b3c4d 5e6f7a8b
+    # Compare all cases archived for both commits.
+    >>> python run_jacobian_diff.py 1a2b3c4d 5e6f7a8b --case poromechanics-0
+    # Compare a single case, named "<physics>-<geometry>".
+    >>> python run_jacobian_diff.py 1a2b3c4d --record
+    # Archive the Jacobians of the installed PorePy under its commit, then compare.
+
+"""
+
+import argparse
+
+from benchmarks.jacobian_structure import (
+    ARCHIVE_DIR,
+    archive_path,
+    diff_structures,
+    load_structure,
+    record_structures,
+)
+from benchmarks.larger_models.base_model import porepy_commit
+
+
+def archived_cases(commit: str) -> set[str]:
+    """Names of the cases archived for a commit."""
+    return {path.stem for path in archive_path(commit, "").parent.glob("*.npz")}
+
+
+def print_diff(old_commit: str, new_commit: str, cases: list[str]) -> int:
+    """Print the structural differences of each case.
+
+    Parameters:
+        old_commit: The earlier commit.
+        new_commit: The later commit.
+        cases: The cases to compare.
+
+    Returns:
+        The number of cases whose structure changed.
+
+    """
+    num_changed = 0
+    for case in cases:
+        old = load_structure(archive_path(old_commit, case))
+        new = load_structure(archive_path(new_commit, case))
+        lines = diff_structures(old, new)
+        if not lines:
+            print(f"{case}: unchanged")
+            continue
+        num_changed += 1
+        print(f"{case}:")
+        for line in lines:
+            print(f"    {line}")
+    return num_changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old_commit", type=str, help="The earlier commit.")
+    parser.add_argument(
+        "new_commit",
+        type=str,
+        nargs="?",
+        default=None,
+        help="The later commit. Defaults to the commit of the installed PorePy.",
+    )
+    parser.add_argument(
+        "--case",
+        type=str,
+        action="append",
+        default=None,
+        help="Case to compare, e.g. 'flow-0', can be repeated. Defaults to all cases"
+        + " archived for both commits.",
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        default=False,
+        help="Archive the Jacobians of the installed PorePy before comparing.",
+    )
+
+    args = parser.parse_args()
+    new_commit = args.new_commit or porepy_commit()
+    if new_commit is None:
+        raise ValueError("The commit of the installed PorePy cannot be determined.")
+    if args.record:
+        record_structures(new_commit)
+
+    common = archived_cases(args.old_commit) & archived_cases(new_commit)
+    cases = args.case or sorted(common)
+    if missing := [case for case in cases if case not in common]:
+        raise FileNotFoundError(f"Cases {missing} are not archived in {ARCHIVE_DIR}.")
+    print_diff(args.old_commit, new_commit, cases)
@@ -0,0 +1,420 @@
+"""This runscript runs timing benchmarks on a commit with control of the noise of the
+machine, and records the noise with each result.
+
+Every benchmark is measured in rounds of ``asv run`` with a given number of repeats.
+Before each round, a fixed workload calibrates the machine (see
+``benchmarks/noise.py``). If the machine is slower than its reference, e.g. throttled,
+or the workload times spread, e.g. by noisy neighbors on the host, the round waits
+and calibrates again. The samples of all rounds are pooled and outliers are dropped.
+Rounds are added until the relative width of the 99% confidence interval of the
+median falls below the target, with the number of repeats estimated from the width
+of the last round, or until the maximum number of repeats is reached.
+
+The pooled samples replace the result of the benchmark in the asv results file. The
+calibration score, the noise of the workload, the width of the interval and the
+numbers of kept and rejected samples are saved to ``.asv/calibration/<machine>``.
+``run_regressions.py`` ignores changes of such results which are not larger than the
+spread of the calibration scores of the compared commits.
+
+Example:
+    >>> python run_noise_controlled.py develop --bench "Solve.time_solve"
+    # Measure the solve benchmarks on the head of develop.
+    >>> python run_noise_controlled.py 1a2b3c4d --bench "model_matrix" --target_ci 0.05
+    # Measure all timing benchmarks of a module, to 5% precision.
+    >>> python run_noise_controlled.py develop --bench "Assemble" -- --python=3.11
+    # Arguments after "--" are passed to "asv run".
+
+Note: Only timing benchmarks are measured. The benchmarks are selected from the last
+    benchmark discovery of asv, in ``.asv/results/benchmarks.json``.
+
+"""
+
+import argparse
+import json
+import math
+import os
+import pathlib
+import platform
+import re
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from asv.config import Config
+from asv.repo import get_repo
+
+from benchmarks.noise import (
+    CalibratedResult,
+    Calibration,
+    calibrate,
+    median_ci,
+    reject_outliers,
+    relative_ci_width,
+    write_calibration,
+)
+from benchmarks.regressions import _param_labels
+
+ROOT = pathlib.Path(__file__).parent
+
+
+@dataclass
+class Measurement:
+    """The pooled samples of a parameter combination in an environment."""
+
+    samples: list[float] = field(default_factory=list)
+    calibrations: list[Calibration] = field(default_factory=list)
+
+    def kept(self, threshold: float) -> np.ndarray:
+        return reject_outliers(np.array(self.samples), threshold)
+
+
+def wait_for_machine(
+    results_dir: pathlib.Path,
+    machine: str,
+    min_score: float,
+    max_noise: float,
+    max_waits: int,
+    wait: float,
+) -> Calibration:
+    """Calibrate the machine until it runs at its usual speed and without noise.
+
+    Parameters:
+        results_dir: The asv results directory.
+        machine: The asv machine name.
+        min_score: The lowest acceptable calibration score.
+        max_noise: The largest acceptable relative spread of the calibration timings.
+        max_waits: Number of times to wait for the machine before giving up.
+        wait: Seconds to wait between calibrations.
+
+    Returns:
+        The last calibration. It may be below the limits if the machine did not
+        recover in time.
+
+    """
+    for attempt in range(max_waits + 1):
+        calibration = calibrate(results_dir, machine)
+        if calibration.score >= min_score and calibration.noise <= max_noise:
+            break
+        print(
+            f"Machine noisy or throttled: score {calibration.score:.3f}, noise"
+            f" {calibration.noise:.3f}.",
+            flush=True,
+        )
+        if attempt < max_waits:
+            time.sleep(wait)
+    return calibration
+
+
+def run_round(
+    commit: str, name: str, labels: list[str], repeats: int, args: argparse.Namespace
+) -> None:
+    """Run a round of a benchmark with ``asv run``, for some parameter combinations."""
+    # Parameterized benchmarks are matched as "name(param0, param1)".
+    pattern = "|".join(re.escape(name + label) for label in labels)
+    subprocess.run(
+        [
+            "asv",
+            "run",
+            f"{commit}^!",
+            f"--bench=^({pattern})$",
+            f"--machine={args.machine}",
+            "--launch-method=spawn",
+            "--record-samples",
+            f"--attribute=repeat={repeats}",
+            "--attribute=rounds=1",
+        ]
+        + args.asv_args,
+        cwd=ROOT,
+    )
+
+
+def read_round(
+    results_dir: pathlib.Path,
+    machine: str,
+    commit: str,
+    name: str,
+    started_after: float,
+) -> dict[tuple[str, str], list[float]]:
+    """The samples of a benchmark in all results files of a commit.
+
+    Parameters:
+        results_dir: The asv results directory.
+        machine: The asv machine name.
+        commit: The commit hash.
+        name: The benchmark name.
+        started_after: Only read results started after this time, in seconds since
+            the epoch, to skip results of earlier runs.
+
+    Returns:
+        The samples by results file name and parameter label.
+
+    """
+    samples = {}
+    for path in sorted((results_dir / machine).glob(f"{commit[:8]}-*.json")):
+        data = json.loads(path.read_text())
+        if name not in data["results"]:
+            continue
+        result = dict(zip(data["result_columns"], data["results"][name]))
+        started_at = result.get("started_at") or 0
+        values = result.get("result")
+        if started_at < int(1000 * started_after) or not isinstance(values, list):
+            continue
+        labels = _param_labels(result.get("params") or [])
+        value_samples = result.get("samples") or [None] * len(values)
+        for label, value, s in zip(labels, values, value_samples):
+            if value is not None and np.isfinite(value):
+                samples[(path.name, label)] = s or [value]
+    return samples
+
+
+def write_result(
+    path: pathlib.Path, name: str, measurements: dict[str, np.ndarray]
+) -> None:
+    """Replace the result of a benchmark in an asv results file by pooled samples.
+
+    Parameters:
+        path: The results file.
+        name: The benchmark name.
+        measurements: The kept samples by parameter label.
+
+    """
+    data = json.loads(path.read_text())
+    columns = data["result_columns"]
+    row = data["results"][name]
+    row += [None] * (len(columns) - len(row))
+    result = dict(zip(columns, row))
+    labels = _param_labels(result.get("params") or [])
+    for key in ("result", "samples") + tuple(c for c in columns if "stats_" in c):
+        if result.get(key) is None:
+            result[key] = [None] * len(labels)
+    for i, label in enumerate(labels):
+        if label not in measurements:
+            continue
+        samples = measurements[label]
+        result["result"][i] = float(np.median(samples))
+        result["samples"][i] = samples.tolist()
+        ci = median_ci(samples)
+        q_25, q_75 = np.percentile(samples, [25, 75])
+        stats = {
+            "stats_ci_99_a": ci[0] if np.isfinite(ci[0]) else None,
+            "stats_ci_99_b": ci[1] if np.isfinite(ci[1]) else None,
+            "stats_q_25": float(q_25),
+            "stats_q_75": float(q_75),
+            "stats_repeat": int(samples.size),
+        }
+        for key, value in stats.items():
+            if key in result:
+                result[key][i] = value
+    data["results"][name] = [result[column] for column in columns]
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def measure(
+    results_dir: pathlib.Path,
+    commit: str,
+    name: str,
+    params: list[list[str]],
+    args: argparse.Namespace,
+) -> None:
+    """Measure a benchmark in rounds until the target precision is reached.
+
+    Parameters:
+        results_dir: The asv results directory.
+        commit: The commit hash.
+        name: The benchmark name.
+        params: The parameters of the benchmark, as in ``benchmarks.json``.
+        args: The arguments of this script.
+
+    """
+    measurements: dict[tuple[str, str], Measurement] = {}
+    pending = _param_labels(params)
+    repeats = args.min_repeats
+    while pending:
+        calibration = wait_for_machine(
+            results_dir,
+            args.machine,
+            args.min_score,
+            args.max_noise,
+            args.max_waits,
+            args.wait,
+        )
+        print(
+            f"{name}: {len(pending)} combinations, {repeats} repeats, score"
+            f" {calibration.score:.3f}",
+            flush=True,
+        )
+        started = time.time()
+        run_round(commit, name, pending, repeats, args)
+        new = read_round(results_dir, args.machine, commit, name, started)
+
+        needed = 0
+        unfinished = set()
+        for label in pending:
+            keys = [key for key in new if key[1] == label]
+            if not keys:
+                print(f"{name}{label} failed.")
+            for key in keys:
+                measurement = measurements.setdefault(key, Measurement())
+                measurement.samples += new[key]
+                measurement.calibrations.append(calibration)
+                kept = measurement.kept(args.outlier_threshold)
+                width = relative_ci_width(kept)
+                total = len(measurement.samples)
+                if width <= args.target_ci or total >= args.max_repeats:
+                    continue
+                unfinished.add(label)
+                # The width decreases with the square root of the number of samples.
+                estimate = kept.size * ((width / args.target_ci) ** 2 - 1)
+                missing = math.ceil(estimate) if math.isfinite(estimate) else 0
+                missing = min(max(missing, args.min_repeats), args.max_repeats - total)
+                needed = max(needed, missing)
+        pending = [label for label in pending if label in unfinished]
+        repeats = needed
+
+    by_file: dict[str, dict[str, CalibratedResult]] = {}
+    for (results_file, label), measurement in measurements.items():
+        kept = measurement.kept(args.outlier_threshold)
+        scores = [c.score for c in measurement.calibrations]
+        by_file.setdefault(results_file, {})[label] = CalibratedResult(
+            score=float(np.median(scores)),
+            min_score=min(scores),
+            noise=max(c.noise for c in measurement.calibrations),
+            ci_width=relative_ci_width(kept),
+            repeats=int(kept.size),
+            outliers=len(measurement.samples) - int(kept.size),
+        )
+        print(
+            f"{name}{label} [{results_file}]: {np.median(kept):.4g} s,"
+            f" {100 * relative_ci_width(kept):.1f}% CI width, {kept.size} samples,"
+            f" {len(measurement.samples) - kept.size} outliers"
+        )
+    for results_file, results in by_file.items():
+        write_result(
+            results_dir / args.machine / results_file,
+            name,
+            {
+                label: measurements[(results_file, label)].kept(args.outlier_threshold)
+                for label in results
+            },
+        )
+        write_calibration(
+            results_dir,
+            args.machine,
+            results_file,
+            {name + label: result for label, result in results.items()},
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "commit", type=str, help="The commit to benchmark, a hash, branch or tag."
+    )
+    parser.add_argument(
+        "--bench",
+        type=str,
+        required=True,
+        help="Regular expression of the names of the timing benchmarks to run.",
+    )
+    parser.add_argument(
+        "--target_ci",
+        type=float,
+        default=0.02,
+        help="Target width of the 99%% confidence interval of the median, relative"
+        + " to the median.",
+    )
+    parser.add_argument(
+        "--min_repeats",
+        type=int,
+        default=10,
+        help="Number of repeats of the first round, and the least of a later round.",
+    )
+    parser.add_argument(
+        "--max_repeats",
+        type=int,
+        default=100,
+        help="Stop adding rounds after this many samples.",
+    )
+    parser.add_argument(
+        "--outlier_threshold",
+        type=float,
+        default=3.0,
+        help="Drop samples deviating from the median by more than this many scaled"
+        + " median absolute deviations.",
+    )
+    parser.add_argument(
+        "--min_score",
+        type=float,
+        default=0.9,
+        help="Wait before a round if the machine is slower than this fraction of its"
+        + " reference speed.",
+    )
+    parser.add_argument(
+        "--max_noise",
+        type=float,
+        default=0.05,
+        help="Wait before a round if the relative spread of the calibration timings"
+        + " is larger.",
+    )
+    parser.add_argument(
+        "--max_waits",
+        type=int,
+        default=5,
+        help="Run the round anyway after waiting this many times for the machine.",
+    )
+    parser.add_argument(
+        "--wait",
+        type=float,
+        default=30.0,
+        help="Seconds to wait for the machine before calibrating again.",
+    )
+    parser.add_argument(
+        "--machine",
+        type=str,
+        default=platform.node(),
+        help="The asv machine name. Defaults to the hostname.",
+    )
+    parser.add_argument(
+        "--recalibrate",
+        action="store_true",
+        default=False,
+        help="Measure a new reference time of the machine, e.g. after a change of"
+        + " its hardware.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+    parser.add_argument(
+        "asv_args",
+        nargs=argparse.REMAINDER,
+        help="Additional arguments for 'asv run', after '--'.",
+    )
+
+    args = parser.parse_args()
+    args.asv_args = [a for a in args.asv_args if a != "--"]
+    conf = Config.load(args.config)
+    results_dir = ROOT / conf.results_dir
+    if args.recalibrate:
+        calibrate(results_dir, args.machine, recalibrate=True)
+    repo = get_repo(conf)
+    repo.pull()
+    commit = repo.get_hash_from_name(args.commit)
+
+    benchmarks = json.loads((results_dir / "benchmarks.json").read_text())
+    names = [
+        name
+        for name, benchmark in benchmarks.items()
+        if name != "version"
+        and benchmark["type"] == "time"
+        and re.search(args.bench, name)
+    ]
+    if not names:
+        raise SystemExit(f"No timing benchmark matches {args.bench!r}.")
+    for name in names:
+        measure(results_dir, commit, name, benchmarks[name].get("params") or [], args)
@@ -0,0 +1,341 @@
+"""This runscript runs the asv benchmarks for a range of commits in parallel, one job
+per CPU core, and merges the results into the standard ``.asv/results`` layout.
+
+A job is a commit and a Python version, optionally split further by benchmark module.
+Every worker owns one physical core, pinned together with its memory to the NUMA node
+of that core, so that the parallel jobs do not add timing noise to each other. The
+first core(s) are left to the system and the runner. Each worker has its own asv
+environments and results directory, results are merged after every job.
+
+Example:
+    >>> python run_parallel.py 2eade74a9441050215920da28370e1d701f800fd..develop
+    # Benchmark every commit in the range, one (commit, python) pair per core.
+    >>> python run_parallel.py HEAD~5..develop --split module --workers 4
+    # Run each benchmark module as a separate job on at most 4 cores.
+    >>> python run_parallel.py HEAD^! -- --quick --show-stderr
+    # Arguments after "--" are passed to "asv run".
+
+Note: The results of a worker are merged per benchmark, a benchmark run in several
+    jobs keeps the result of the job which finished last. On a single-core machine,
+    no core is left after reserving one for the system, use ``job.sh`` there.
+
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import queue
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from asv import util as asv_util
+from asv.config import Config
+from asv.repo import get_repo
+
+ROOT = pathlib.Path(__file__).parent
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    """Parse a Linux CPU list, e.g. ``"0-3,8,10-11"``."""
+    cpus: list[int] = []
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def isolated_cores(reserve: int) -> list[tuple[int, int]]:
+    """Select one logical CPU per physical core, with the NUMA node of the core.
+
+    Parameters:
+        reserve: Number of cores which are left to the system and the runner.
+
+    Returns:
+        Pairs of CPU and NUMA node, alternating between NUMA nodes.
+
+    """
+    sysfs = pathlib.Path("/sys/devices/system")
+    node_of_cpu: dict[int, int] = {}
+    for node_dir in sysfs.glob("node/node[0-9]*"):
+        node = int(node_dir.name[len("node") :])
+        for cpu in parse_cpu_list((node_dir / "cpulist").read_text()):
+            node_of_cpu[cpu] = node
+
+    cores: list[tuple[int, int]] = []
+    seen_siblings: set[frozenset[int]] = set()
+    for cpu in sorted(os.sched_getaffinity(0)):
+        # Hyperthreads share the execution units of a core, use only one of them.
+        siblings_file = sysfs / f"cpu/cpu{cpu}/topology/thread_siblings_list"
+        if siblings_file.exists():
+            siblings = frozenset(parse_cpu_list(siblings_file.read_text()))
+        else:
+            siblings = frozenset([cpu])
+        if siblings in seen_siblings:
+            continue
+        seen_siblings.add(siblings)
+        cores.append((cpu, node_of_cpu.get(cpu, 0)))
+    cores = cores[reserve:]
+
+    # Spread the workers over the NUMA nodes before filling them up.
+    rank_in_node: dict[int, int] = {}
+    ranked = []
+    for cpu, node in cores:
+        rank_in_node[node] = rank_in_node.get(node, -1) + 1
+        ranked.append((rank_in_node[node], node, cpu))
+    return [(cpu, node) for _, node, cpu in sorted(ranked)]
+
+
+def benchmark_modules(results_dir: pathlib.Path) -> list[str]:
+    """Benchmark modules known from the last benchmark discovery of asv."""
+    benchmarks_file = results_dir / "benchmarks.json"
+    if not benchmarks_file.exists():
+        return []
+    names = json.loads(benchmarks_file.read_text())
+    return sorted({name.split(".")[0] for name in names if name != "version"})
+
+
+def merge_results(source: pathlib.Path, target: pathlib.Path) -> None:
+    """Merge the asv results of a worker into the main results directory.
+
+    Result files of the same machine, commit and environment are merged benchmark by
+    benchmark. The merged files are removed from ``source``.
+
+    Parameters:
+        source: The results directory of a worker.
+        target: The main results directory.
+
+    """
+    for path in sorted(source.rglob("*.json")):
+        destination = target / path.relative_to(source)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if path.name == "benchmarks.json" or not destination.exists():
+            shutil.copyfile(path, destination)
+            path.unlink()
+            continue
+        if path.name == "machine.json":
+            path.unlink()
+            continue
+
+        merged = json.loads(destination.read_text())
+        new = json.loads(path.read_text())
+        if merged.get("result_columns") != new.get("result_columns"):
+            merged = new
+        else:
+            merged["results"].update(new["results"])
+            merged["durations"].update(new.get("durations", {}))
+        tmp = destination.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(merged))
+        os.replace(tmp, destination)
+        path.unlink()
+
+
+class ParallelRunner:
+    """Run asv jobs on a pool of pinned workers.
+
+    Parameters:
+        config_path: Path to the asv configuration.
+        cores: Pairs of CPU and NUMA node, one per worker.
+        asv_args: Additional arguments for ``asv run``.
+
+    """
+
+    def __init__(
+        self,
+        config_path: pathlib.Path,
+        cores: list[tuple[int, int]],
+        asv_args: list[str],
+    ) -> None:
+        self.conf = Config.load(str(config_path))
+        self.results_dir = (ROOT / self.conf.results_dir).resolve()
+        self.asv_args = asv_args
+        self.merge_lock = threading.Lock()
+
+        raw_conf = asv_util.load_json(str(config_path), js_comments=True)
+        self.workers: "queue.Queue[tuple[int, int, pathlib.Path]]" = queue.Queue()
+        for i, (cpu, node) in enumerate(cores):
+            worker_dir = (ROOT / self.conf.env_dir / f"worker-{i}").resolve()
+            worker_dir.mkdir(parents=True, exist_ok=True)
+            # Each worker builds into its own environments and writes its own results,
+            # asv does not support concurrent access to either.
+            worker_conf = raw_conf | {
+                "env_dir": str(worker_dir / "env"),
+                "results_dir": str(worker_dir / "results"),
+                "html_dir": str(worker_dir / "html"),
+                "benchmark_dir": str((ROOT / self.conf.benchmark_dir).resolve()),
+            }
+            config_file = worker_dir / "asv.conf.json"
+            config_file.write_text(json.dumps(worker_conf, indent=4))
+            self.workers.put((cpu, node, config_file))
+
+    def commits(self, range_spec: str, steps: Optional[int]) -> list[str]:
+        """Commit hashes in a range, oldest first, optionally sampled to ``steps``."""
+        repo = get_repo(self.conf)
+        repo.pull()
+        hashes = list(reversed(repo.get_hashes_from_range(range_spec)))
+        if steps is not None and len(hashes) > steps:
+            stride = (len(hashes) - 1) / max(steps - 1, 1)
+            hashes = [hashes[round(i * stride)] for i in range(steps)]
+        return hashes
+
+    def has_results(self, commit: str, python: str, module: Optional[str]) -> bool:
+        """Whether the main results already contain a job."""
+        pattern = f"*/{commit[:8]}-*py{python}.json"
+        for path in self.results_dir.glob(pattern):
+            if module is None:
+                return True
+            results = json.loads(path.read_text())["results"]
+            if any(name.startswith(f"{module}.") for name in results):
+                return True
+        return False
+
+    def run_job(self, commit: str, python: str, module: Optional[str]) -> int:
+        """Run a single job on the next free worker and merge its results."""
+        cpu, node, config_file = self.workers.get()
+        try:
+            cmd = [
+                "asv",
+                "run",
+                f"{commit}^!",
+                f"--config={config_file}",
+                f"--python={python}",
+                f"--cpu-affinity={cpu}",
+                "--launch-method=spawn",
+                # The mirror is pulled once in commits(), concurrent fetches of the
+                # workers would race on its ref locks.
+                "--no-pull",
+            ]
+            if module is not None:
+                cmd.append(f"--bench=^{module}\\.")
+            cmd += self.asv_args
+            # Builds and discovery run on the core of the worker as well.
+            if shutil.which("numactl"):
+                cmd = ["numactl", f"--membind={node}", f"--physcpubind={cpu}"] + cmd
+            elif shutil.which("taskset"):
+                cmd = ["taskset", "--cpu-list", str(cpu)] + cmd
+
+            env = os.environ | {
+                "OPENBLAS_NUM_THREADS": "1",
+                "MKL_NUM_THREADS": "1",
+                "OMP_NUM_THREADS": "1",
+            }
+            print(f"[cpu {cpu}] {commit[:8]} py{python} {module or ''}", flush=True)
+            process = subprocess.Popen(cmd, cwd=ROOT, env=env)
+            if cmd[0] == "asv":
+                # Without a pinning tool, pin the process once it started, before asv
+                # starts its own processes. preexec_fn is not safe in threads.
+                try:
+                    os.sched_setaffinity(process.pid, {cpu})
+                except ProcessLookupError:
+                    pass
+            returncode = process.wait()
+
+            with self.merge_lock:
+                merge_results(config_file.parent / "results", self.results_dir)
+            return returncode
+        finally:
+            self.workers.put((cpu, node, config_file))
+
+    def run(
+        self,
+        commits: list[str],
+        pythons: list[str],
+        split_by_module: bool,
+        skip_existing: bool,
+    ) -> int:
+        """Run all jobs and return the number of failed jobs."""
+        modules: list[Optional[str]] = [None]
+        if split_by_module:
+            if known_modules := benchmark_modules(self.results_dir):
+                modules = list(known_modules)
+            else:
+                print("No benchmarks.json found, running whole commits per job.")
+
+        jobs = [(c, p, m) for c in commits for p in pythons for m in modules]
+        if skip_existing:
+            jobs = [job for job in jobs if not self.has_results(*job)]
+        with ThreadPoolExecutor(max_workers=self.workers.qsize()) as pool:
+            returncodes = list(pool.map(lambda job: self.run_job(*job), jobs))
+        return sum(code != 0 for code in returncodes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "range",
+        type=str,
+        help="Commit range to benchmark, in the syntax of 'asv run', e.g. A..develop.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of parallel jobs. Defaults to the number of free cores.",
+    )
+    parser.add_argument(
+        "--reserve_cores",
+        type=int,
+        default=1,
+        help="Number of cores left to the system and the runner.",
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        default="commit",
+        choices=["commit", "module"],
+        help="Granularity of the jobs: (commit, python) pairs, or additionally one job"
+        + " per benchmark module.",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=None,
+        help="Sample this many commits from the range. By default, all commits run.",
+    )
+    parser.add_argument(
+        "--skip_existing",
+        action="store_true",
+        default=False,
+        help="Skip jobs which already have results in the main results directory.",
+    )
+    parser.add_argument(
+        "--python",
+        type=str,
+        action="append",
+        default=None,
+        help="Python version to run, can be repeated. Defaults to the asv config.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+    parser.add_argument(
+        "asv_args",
+        nargs=argparse.REMAINDER,
+        help="Additional arguments for 'asv run', after '--'.",
+    )
+
+    args = parser.parse_args()
+    cores = isolated_cores(args.reserve_cores)
+    if not cores:
+        raise RuntimeError(f"No cores left after reserving {args.reserve_cores}.")
+    if args.workers is not None:
+        cores = cores[: args.workers]
+    asv_args = [a for a in args.asv_args if a != "--"]
+
+    runner = ParallelRunner(pathlib.Path(args.config), cores, asv_args)
+    commits = runner.commits(args.range, args.steps)
+    pythons = args.python or runner.conf.pythons
+    print(f"Running {len(commits)} commits on {len(cores)} cores.")
+    num_failed = runner.run(
+        commits, pythons, args.split == "module", args.skip_existing
+    )
+    if num_failed:
+        raise SystemExit(f"{num_failed} jobs failed.")
@@ -0,0 +1,282 @@
+"""This runscript profiles a benchmark case on two PorePy commits and ranks the
+functions whose time grew the most.
+
+The commits run in the environments of ``run_fast_sweep.py`` in ``.asv/env/fast``, in
+which PorePy is installed in editable mode from a git worktree: each commit is checked
+out in turn, and PorePy is only reinstalled if its dependencies differ. The case,
+created by ``make_benchmark_model`` as in the benchmarks, runs under cProfile
+(``benchmarks/profile_case.py``) and the statistics are saved next to this script.
+
+The profiles are aligned by function, identified by its module path relative to the
+package and its qualified name, e.g. ``Operator.parse``, so that moved line numbers
+and different install locations do not matter. cProfile only records the line and
+name of a function, the qualified name is found by parsing its file right after the
+profile of the commit is taken. The table lists the functions with the largest growth
+of self time (or inclusive time with ``--sort inclusive``), with their numbers of
+calls on both commits. More calls at the same time per call point to added work, the
+same calls at a higher time per call to slower code.
+
+Example:
+    >>> python run_profile_diff.py 1a2b3c4d 5e6f7a8b --physics poromechanics
+    # Compare the poromechanics benchmark on the first 2D case between two commits.
+    >>> python run_profile_diff.py v1.10 develop --geometry 3 --sort inclusive
+    # Compare the 3D case, ranked by inclusive time.
+
+Note: Do not run this during a sweep of ``run_fast_sweep.py``, which uses the same
+    worktree. cProfile slows down the run by a factor of about two, but does so on both
+    commits. Compare relative changes, the absolute times are not those of the
+    benchmarks.
+
+"""
+
+import argparse
+import ast
+import functools
+import os
+import pathlib
+import pstats
+import subprocess
+from dataclasses import dataclass
+
+from run_fast_sweep import FastSweep, git
+from run_selective import porepy_module
+
+ROOT = pathlib.Path(__file__).parent
+
+
+@dataclass
+class FunctionStats:
+    """Profile of a function, summed over all its definitions with the same qualified
+    name."""
+
+    calls: int = 0
+    self_time: float = 0.0
+    inclusive_time: float = 0.0
+
+
+@functools.cache
+def qualified_names(filename: str) -> dict[int, str]:
+    """Qualified names of the functions defined in a file, by their first line.
+
+    Parameters:
+        filename: A Python source file.
+
+    Returns:
+        The qualified name of every function, e.g. ``"Operator.parse"``, under the line
+        of its ``def`` and of its first decorator, which cProfile reports for
+        decorated functions. Empty if the file cannot be parsed.
+
+    """
+    try:
+        tree = ast.parse(pathlib.Path(filename).read_text())
+    except (OSError, SyntaxError, ValueError):
+        return {}
+    names: dict[int, str] = {}
+
+    def visit(node: ast.AST, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                names[child.lineno] = name
+                if child.decorator_list:
+                    names[min(d.lineno for d in child.decorator_list)] = name
+                visit(child, name + ".<locals>.")
+            elif isinstance(child, ast.ClassDef):
+                visit(child, prefix + child.name + ".")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+    return names
+
+
+def function_key(filename: str, lineno: int, name: str) -> str:
+    """Identifier of a function which is the same in all environments.
+
+    Parameters:
+        filename: The file of the function as recorded by cProfile, ``"~"`` for
+            built-in functions.
+        lineno: The first line of the function as recorded by cProfile.
+        name: The name of the function.
+
+    Returns:
+        The path of the module relative to its package and the qualified name of the
+        function, e.g. ``"porepy/numerics/ad/operators.py:Operator.parse"``. Functions
+        whose qualified name is not found keep their name.
+
+    """
+    if filename == "~":
+        return name
+    path = filename.replace("\\", "/")
+    module = porepy_module(path)
+    if module is None and "site-packages/" in path:
+        module = path.rsplit("site-packages/", 1)[1]
+    elif module is None and path.startswith(str(ROOT)):
+        module = os.path.relpath(path, ROOT)
+    name = qualified_names(filename).get(lineno, name)
+    return f"{module or path}:{name}"
+
+
+def load_profile(path: pathlib.Path) -> dict[str, FunctionStats]:
+    """The statistics of every function of a cProfile profile.
+
+    Parameters:
+        path: A profile saved by ``benchmarks/profile_case.py``.
+
+    Returns:
+        The statistics by the key of :func:`function_key`.
+
+    """
+    # The sources of the worktree change with the commit.
+    qualified_names.cache_clear()
+    functions: dict[str, FunctionStats] = {}
+    raw = pstats.Stats(str(path)).stats  # type: ignore[attr-defined]
+    for (filename, lineno, name), (_, calls, self_time, total, _) in raw.items():
+        stats = functions.setdefault(
+            function_key(filename, lineno, name), FunctionStats()
+        )
+        stats.calls += calls
+        stats.self_time += self_time
+        stats.inclusive_time += total
+    return functions
+
+
+def print_diff(
+    old: dict[str, FunctionStats],
+    new: dict[str, FunctionStats],
+    sort: str = "self",
+    num_rows: int = 20,
+) -> None:
+    """Print the functions whose time grew the most between two profiles.
+
+    Parameters:
+        old: The profile of the earlier commit.
+        new: The profile of the later commit.
+        sort: Rank by the growth of ``"self"`` or ``"inclusive"`` time.
+        num_rows: Number of functions to print.
+
+    """
+    attribute = "self_time" if sort == "self" else "inclusive_time"
+    empty = FunctionStats()
+
+    def growth(key: str) -> float:
+        return getattr(new.get(key, empty), attribute) - getattr(
+            old.get(key, empty), attribute
+        )
+
+    total_old = sum(s.self_time for s in old.values())
+    total_new = sum(s.self_time for s in new.values())
+    print(
+        f"Total time: {total_old:.3f} s -> {total_new:.3f} s "
+        f"({100 * (total_new / total_old - 1):+.1f}%)\n"
+    )
+    print(
+        f"{'Self [s]':>9} {'new':>9} {'delta':>9} {'Incl. [s]':>9} {'new':>9} "
+        f"{'delta':>9} {'Calls':>9} {'new':>9} {'delta':>9}  Function"
+    )
+    for key in sorted(old.keys() | new.keys(), key=growth, reverse=True)[:num_rows]:
+        a, b = old.get(key, empty), new.get(key, empty)
+        print(
+            f"{a.self_time:9.3f} {b.self_time:9.3f} {b.self_time - a.self_time:+9.3f} "
+            f"{a.inclusive_time:9.3f} {b.inclusive_time:9.3f} "
+            f"{b.inclusive_time - a.inclusive_time:+9.3f} "
+            f"{a.calls:9d} {b.calls:9d} {b.calls - a.calls:+9d}  {key}"
+        )
+
+
+def profile_case(executable: pathlib.Path, case: dict, output: pathlib.Path) -> None:
+    """Profile a benchmark case with the PorePy of an environment.
+
+    Parameters:
+        executable: The interpreter of the environment.
+        case: The physics, geometry and grid refinement of the case.
+        output: The file the profile is saved to.
+
+    """
+    subprocess.run(
+        [executable, "-m", "benchmarks.profile_case"]
+        + [f"--{key}={value}" for key, value in case.items()]
+        + [f"--output={output}"],
+        cwd=ROOT,
+        check=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old_commit", type=str, help="The earlier commit.")
+    parser.add_argument("new_commit", type=str, help="The later commit.")
+    parser.add_argument(
+        "--physics",
+        type=str,
+        default="flow",
+        choices=["flow", "poromechanics"],
+        help="Physics to run. Choices are single-phase flow or poromechanics.",
+    )
+    parser.add_argument(
+        "--geometry",
+        type=int,
+        default=0,
+        choices=[0, 1, 2, 3],
+        help=(
+            "0: 1st 2D case, 1: 2nd 2D case, 2: 2D case with 64 fractures, 3: 3D case."
+        ),
+    )
+    parser.add_argument(
+        "--grid_refinement",
+        type=int,
+        default=0,
+        choices=[0, 1, 2],
+        help="Level of grid refinement. For the 2D cases, this corresponds to cell"
+        + " sizes 0.1, 0.01, and 0.005. For the 3D cases, this corresponds to 30K,"
+        + " 140K, 350K cells.",
+    )
+    parser.add_argument(
+        "--sort",
+        type=str,
+        default="self",
+        choices=["self", "inclusive"],
+        help="Rank the functions by the growth of their self or inclusive time.",
+    )
+    parser.add_argument(
+        "--num_rows",
+        type=int,
+        default=20,
+        help="Number of functions in the table.",
+    )
+    parser.add_argument(
+        "--python",
+        type=str,
+        default=None,
+        help="Python version of the environments. Defaults to the first one of the asv"
+        + " config.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+
+    args = parser.parse_args()
+    sweep = FastSweep(pathlib.Path(args.config), [])
+    sweep.update_source()
+    python = args.python or sweep.conf.pythons[0]
+    case = {
+        "physics": args.physics,
+        "geometry": args.geometry,
+        "grid_refinement": args.grid_refinement,
+    }
+    profiles = []
+    for name in (args.old_commit, args.new_commit):
+        commit = git(f"--git-dir={sweep.mirror}", "rev-parse", f"{name}^{{commit}}")
+        sweep.checkout(commit)
+        sweep.install(python)
+        output = ROOT / (
+            f"profiling_{args.physics}_{args.geometry}_{args.grid_refinement}"
+            f"_{commit[:8]}.pstats"
+        )
+        print(f"Profiling {commit[:8]}", flush=True)
+        profile_case(sweep.python_executable(python), case, output)
+        profiles.append(load_profile(output))
+    print_diff(*profiles, sort=args.sort, num_rows=args.num_rows)
@@ -0,0 +1,518 @@
+"""This runscript publishes the asv report from a columnar results store, instead of
+``asv publish``.
+
+``asv publish`` parses every results file on each run, which dominates the nightly job
+as the history grows. Here, only results files which are new or changed since the
+last run are parsed and appended to the store in ``.asv/store`` (see
+``benchmarks/results_store.py``). The graphs of all benchmarks are then computed from
+the memory-mapped store in one vectorized pass: the results are sorted once by
+benchmark, graph and revision, averaged per revision and written to the graph files of
+the asv frontend, together with the summary graphs of the grid view and
+``index.json``. Revisions, tags and branches are read from the local mirror of the
+PorePy repository.
+
+The list view and the regressions page need the step detection of asv. It runs on the
+averaged series with the publishers of asv, such that the pages are the same as those
+of ``asv publish``. The steps of a series are cached in the store with a hash of the
+series, and only detected again if the series changed. The regressions feed takes the
+dates of the runs from the store as well.
+
+Example:
+    >>> python run_publish.py
+    # Ingest new results and rewrite the graphs and the index.
+    >>> python run_publish.py --full
+    # Run "asv publish" instead, e.g. to check the report against the one of asv.
+
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+from unittest import mock
+
+import asv
+import asv.plugins.regressions
+import numpy as np
+from asv import util as asv_util
+from asv.config import Config
+from asv.graph import RESAMPLED_POINTS, Graph, GraphSet
+from asv.plugins.git import Git
+from asv.plugins.regressions import Regressions
+from asv.plugins.summarylist import SummaryList
+
+from benchmarks.regressions import _param_labels
+from benchmarks.results_store import ResultsStore
+from run_fast_sweep import git, update_mirror
+
+ROOT = pathlib.Path(__file__).parent
+
+# The pages of the asv frontend, as written by "asv publish".
+PAGES = [
+    ["", "Grid view", "Display as a agrid"],
+    ["summarylist", "List view", "Display as a list"],
+    ["regressions", "Show regressions", "Display information about recent regressions"],
+]
+
+
+def revisions(mirror: pathlib.Path) -> dict[str, int]:
+    """Revision numbers of all commits of the mirror, numbered as by asv."""
+    hashes = git(
+        f"--git-dir={mirror}", "rev-list", "--all", "--date-order", "--reverse"
+    ).split()
+    return {commit: i for i, commit in enumerate(hashes)}
+
+
+def tags(mirror: pathlib.Path) -> dict[str, tuple[str, int]]:
+    """Commit and author date, in milliseconds, of every tag of the mirror."""
+    lines = git(
+        f"--git-dir={mirror}",
+        "for-each-ref",
+        "--format=%(refname:short)|%(objectname)|%(authordate:unix)"
+        + "|%(*objectname)|%(*authordate:unix)",
+        "refs/tags",
+    ).splitlines()
+    result = {}
+    for line in lines:
+        name, commit, date, target, target_date = line.split("|")
+        if target:
+            # Annotated tags are dereferenced to their commit.
+            commit, date = target, target_date
+        result[name] = (commit, int(date) * 1000)
+    return result
+
+
+def fill_missing(y: np.ndarray, max_gap_fraction: float = 0.1) -> np.ndarray:
+    """Interpolate linearly in gaps of NaN shorter than a fraction of the valid data.
+
+    Equivalent to the filling of missing data in the summary graphs of asv.
+
+    """
+    valid = np.flatnonzero(~np.isnan(y))
+    if valid.size < 2:
+        return y
+    max_gap = np.ceil(max_gap_fraction * valid.size)
+    gaps = np.diff(valid) - 1
+    filled = y.copy()
+    for start in valid[:-1][(gaps > 0) & (gaps <= max_gap)]:
+        # A handful of short gaps per series, np.interp fills each at once.
+        stop = valid[np.searchsorted(valid, start) + 1]
+        filled[start + 1 : stop] = np.interp(
+            np.arange(start + 1, stop), [start, stop], y[[start, stop]]
+        )
+    return filled
+
+
+def summary_graph(x: np.ndarray, ys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The summary of all series of a benchmark, as in the grid view of asv.
+
+    Parameters:
+        x: The sorted revisions with data in any series.
+        ys: The series, one per row, with NaN for missing data.
+
+    Returns:
+        Revisions and the geometric mean of the series, resampled to at most
+        ``RESAMPLED_POINTS`` points.
+
+    """
+    filled = np.array([fill_missing(y) for y in ys])
+    finite = ~np.isnan(filled)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        count = finite.sum(axis=0)
+        log_mean = np.where(finite, np.log(np.abs(filled)), 0).sum(axis=0) / count
+        sign = np.where(np.where(finite, filled, 0).sum(axis=0) < 0, -1.0, 1.0)
+        y = np.where(np.isnan(ys).all(axis=0), np.nan, sign * np.exp(log_mean))
+
+    if len(x) >= RESAMPLED_POINTS:
+        step = int((x[-1] - x[0]) / RESAMPLED_POINTS) or int(x[-1] - x[0] + 1)
+        bins, inverse = np.unique((x - x[0]) // step, return_inverse=True)
+        finite = ~np.isnan(y)
+        with np.errstate(invalid="ignore"):
+            y = np.bincount(inverse, np.where(finite, y, 0)) / np.bincount(
+                inverse, finite
+            )
+        x = x[0] + (bins + 1) * step
+    return x, y
+
+
+def _data_slice(values: np.ndarray) -> slice:
+    # As asv, drop revisions without any data at both ends of a graph.
+    has_data = ~np.isnan(values.reshape(len(values), -1)).all(axis=1)
+    if not has_data.any():
+        return slice(0, 0)
+    first, last = np.flatnonzero(has_data)[[0, -1]]
+    return slice(first, last + 1)
+
+
+def _trim(x: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    kept = _data_slice(values)
+    return x[kept], values[kept]
+
+
+def _add_points(
+    graph: Graph, x: np.ndarray, values: np.ndarray, weights: np.ndarray
+) -> None:
+    """Add the averaged results of a graph to the graph of asv, for step detection.
+
+    Parameters:
+        graph: The graph of asv.
+        x: The revisions.
+        values: The results, one row per revision and one column per parameter
+            combination, or one value per revision if the benchmark has no parameters.
+        weights: The weights of the results, shaped as ``values``.
+
+    """
+    rows = []
+    for array in (values, weights):
+        data = array.astype(object)
+        data[np.isnan(array)] = None
+        rows.append(data.tolist())
+    for revision, value, weight in zip(x.tolist(), *rows):
+        graph.add_data_point(revision, value, weight)
+
+
+def detect_steps(graphs: GraphSet, cache_file: pathlib.Path) -> None:
+    """Run the step detection of asv on all graphs, in parallel as ``asv publish``.
+
+    Parameters:
+        graphs: The graphs, with all their data points.
+        cache_file: The steps of every graph with a hash of its data. Graphs whose data
+            did not change take their steps from here. Rewritten with the new steps.
+
+    """
+    cache = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+    keys = {}
+    pool = asv_util.get_multiprocessing_pool(os.cpu_count())
+    try:
+        for path, graph in graphs:
+            data = json.dumps(graph.get_data()).encode()
+            keys[path] = hashlib.sha256(data).hexdigest()
+            cached = cache.get(path)
+            if cached is not None and cached["key"] == keys[path]:
+                # As set by Graph.detect_steps, one list of steps per series.
+                graph._steps = cached["steps"]
+            else:
+                graph.detect_steps(pool)
+        for _, graph in graphs:
+            graph.get_steps()
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+    cache_file.write_text(
+        json.dumps(
+            {
+                path: {"key": keys[path], "steps": graph._steps}
+                for path, graph in graphs
+            }
+        )
+    )
+
+
+@dataclass
+class StoredResults:
+    """The parts of a results file of asv which the regressions feed of asv reads."""
+
+    commit_hash: str
+    date: int
+    started_at: dict[str, Optional[int]]
+    """When each benchmark of the file was run, in milliseconds since the epoch."""
+
+    def get_result_keys(self, benchmarks: dict) -> list[str]:
+        return [name for name in self.started_at if name in benchmarks]
+
+
+def stored_results(store: ResultsStore) -> list[StoredResults]:
+    """The current results files of the store, as read by the regressions feed."""
+    rows = store.rows()
+    names = store.manifest["benchmarks"]
+    file = np.asarray(store.column("file"))[rows].astype(np.int64)
+    benchmark = np.asarray(store.column("benchmark"))[rows]
+    started_at = np.asarray(store.column("started_at"))[rows]
+    pairs, first = np.unique(file * len(names) + benchmark, return_index=True)
+    results: dict[int, StoredResults] = {}
+    for f, b, t in zip(*np.divmod(pairs, len(names)), started_at[first].tolist()):
+        entry = store.files[f]
+        stored = results.setdefault(
+            f, StoredResults(entry["commit_hash"], entry["date"], {})
+        )
+        stored.started_at[names[b]] = None if np.isnan(t) else int(t)
+    return list(results.values())
+
+
+def _mean_na(values: np.ndarray, start: np.ndarray) -> np.ndarray:
+    # Mean of the finite values of each segment beginning at ``start``, else NaN.
+    finite = ~np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        return np.add.reduceat(np.where(finite, values, 0), start) / np.add.reduceat(
+            finite.astype(np.int64), start
+        )
+
+
+def _write_graph(path: pathlib.Path, x: np.ndarray, values: np.ndarray) -> None:
+    data = values.astype(object)
+    data[np.isnan(values)] = None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    points = [list(point) for point in zip(x.tolist(), data.tolist())]
+    path.write_text(json.dumps(points))
+
+
+def publish(
+    store: ResultsStore,
+    html_dir: pathlib.Path,
+    benchmarks: dict,
+    revision_of: dict[str, int],
+    branches: dict[str, set[str]],
+    graph_set: GraphSet,
+) -> dict:
+    """Write the graphs of all benchmarks and return the graph parameters.
+
+    Parameters:
+        store: The results store.
+        html_dir: The root of the asv report.
+        benchmarks: The benchmarks of ``benchmarks.json``, by name.
+        revision_of: The revision number of every commit.
+        branches: The commits of every branch.
+        graph_set: The averaged results of every graph are added to this, for the
+            step detection.
+
+    Returns:
+        The values of all graph parameters and the list of parameter sets of graphs, as
+        in ``index.json``.
+
+    """
+    files = store.files
+    current = store.file_mask()
+    params: dict[str, set] = {}
+    for entry in np.array(files, dtype=object)[current]:
+        for key, value in entry["params"].items():
+            params.setdefault(key, set()).add("" if value is None else value)
+        for key, value in entry["env_vars"].items():
+            params.setdefault(f"env-{key}", set()).add(value)
+
+    # Graph of every file and branch, -1 for files without a graph.
+    graph_params: list[dict] = []
+    graph_ids: dict[str, int] = {}
+    file_graph = np.full((len(branches), len(files)), -1)
+    for i, (branch, commits) in enumerate(branches.items()):
+        for j, entry in enumerate(files):
+            if not current[j] or entry["commit_hash"] not in commits:
+                continue
+            cur = {k: "" if v is None else v for k, v in entry["params"].items()}
+            cur |= {f"env-{key}": value for key, value in entry["env_vars"].items()}
+            cur["branch"] = branch
+            # As asv, parameters of other files which this file lacks are null.
+            for key in params.keys() - cur.keys():
+                cur[key] = None
+                params[key].add(None)
+            path = Graph.get_file_path(cur, "")
+            if path not in graph_ids:
+                graph_ids[path] = len(graph_params)
+                graph_params.append(cur)
+            file_graph[i, j] = graph_ids[path]
+    file_revision = np.array(
+        [revision_of.get(entry["commit_hash"], -1) for entry in files], dtype=np.int64
+    )
+
+    # Index of every stored parameter label in the current parameters of a benchmark,
+    # and the current version of every benchmark, -2 if it was never stored.
+    names = store.manifest["benchmarks"]
+    versions = {v: i for i, v in enumerate(store.manifest["versions"])}
+    current_version = np.array(
+        [versions.get(benchmarks.get(name, {}).get("version"), -2) for name in names]
+    )
+    labels = {
+        name: {label: k for k, label in enumerate(_param_labels(b["params"]))}
+        for name, b in benchmarks.items()
+    }
+
+    benchmark = np.asarray(store.column("benchmark"))
+    file = np.asarray(store.column("file"))
+    version = np.asarray(store.column("version"))
+    pairs, pair_inverse = np.unique(
+        benchmark.astype(np.int64) * len(store.manifest["params"])
+        + store.column("params"),
+        return_inverse=True,
+    )
+    pair_index = np.array(
+        [
+            labels.get(names[b], {}).get(store.manifest["params"][p], -1)
+            for b, p in zip(*np.divmod(pairs, len(store.manifest["params"])))
+        ],
+        dtype=np.int64,
+    )
+    param_index = pair_index[pair_inverse]
+    valid = (
+        (file_revision[file] >= 0)
+        & (param_index >= 0)
+        & ((version == -1) | (version == current_version[benchmark]))
+    )
+
+    graphs: dict[str, list] = {}
+    for i in range(len(branches)):
+        rows = np.flatnonzero(valid & (file_graph[i][file] >= 0))
+        if rows.size == 0:
+            continue
+        b = benchmark[rows]
+        g = file_graph[i][file[rows]]
+        r = file_revision[file[rows]]
+        p = param_index[rows]
+        v = np.asarray(store.column("value"))[rows]
+        w = np.asarray(store.column("weight"))[rows]
+
+        # Average the results of a benchmark, graph, revision and parameter set.
+        order = np.lexsort((p, r, g, b))
+        b, g, r, p, v, w = b[order], g[order], r[order], p[order], v[order], w[order]
+        keys = np.column_stack((b, g, r, p))
+        start = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        mean, weight = (
+            _mean_na(values, start) for values in (v, np.where(np.isnan(v), np.nan, w))
+        )
+        b, g, r, p = b[start], g[start], r[start], p[start]
+
+        # Split into graphs, one per benchmark and graph parameters.
+        bounds = np.flatnonzero(np.r_[True, (b[1:] != b[:-1]) | (g[1:] != g[:-1])])
+        for lo, hi in zip(bounds, np.r_[bounds[1:], len(b)]):
+            name = names[b[lo]]
+            num_params = max(len(labels[name]), 1)
+            x, inverse = np.unique(r[lo:hi], return_inverse=True)
+            values = np.full((len(x), num_params), np.nan)
+            values[inverse, p[lo:hi]] = mean[lo:hi]
+            weights = np.full((len(x), num_params), np.nan)
+            weights[inverse, p[lo:hi]] = weight[lo:hi]
+            kept = _data_slice(values)
+            x, values, weights = x[kept], values[kept], weights[kept]
+            graphs.setdefault(name, []).append((x, values))
+            if not benchmarks[name]["params"]:
+                values, weights = values[:, 0], weights[:, 0]
+            path = Graph.get_file_path(graph_params[g[lo]], name)
+            _write_graph(html_dir / f"{path}.json", x, values)
+            graph = graph_set.get_graph(name, graph_params[g[lo]])
+            _add_points(graph, x, values, weights)
+
+    for name, series in graphs.items():
+        x = np.unique(np.concatenate([s[0] for s in series]))
+        ys = np.full((sum(s[1].shape[1] for s in series), len(x)), np.nan)
+        k = 0
+        for graph_x, values in series:
+            ys[k : k + values.shape[1], np.searchsorted(x, graph_x)] = values.T
+            k += values.shape[1]
+        x, y = summary_graph(x, ys)
+        _write_graph(html_dir / "graphs" / "summary" / f"{name}.json", *_trim(x, y))
+
+    sorted_params = {
+        key: sorted(values, key=lambda v: "[none]" if v is None else str(v))
+        for key, values in params.items()
+    }
+    sorted_params["branch"] = list(branches)
+    return {"params": sorted_params, "graph_param_list": graph_params}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        default=False,
+        help="Run 'asv publish' for a full rebuild of the report.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+
+    args = parser.parse_args()
+    conf = Config.load(args.config)
+    results_dir = ROOT / conf.results_dir
+    html_dir = ROOT / conf.html_dir
+    store = ResultsStore()
+    print(f"Ingested {store.ingest(results_dir)} new results files.")
+    if args.full:
+        subprocess.run(["asv", "publish", f"--config={args.config}"], check=True)
+        raise SystemExit()
+
+    mirror = update_mirror(conf)
+    revision_of = revisions(mirror)
+    repo_tags = tags(mirror)
+    branches = {
+        branch: set(
+            git(f"--git-dir={mirror}", "rev-list", "--first-parent", branch).split()
+        )
+        for branch in conf.branches
+    }
+    benchmarks = json.loads((results_dir / "benchmarks.json").read_text())
+    benchmarks.pop("version", None)
+
+    if not (html_dir / "index.html").exists():
+        shutil.copytree(pathlib.Path(asv.__file__).parent / "www", html_dir)
+    graph_set = GraphSet()
+    index = publish(store, html_dir, benchmarks, revision_of, branches, graph_set)
+
+    # The list view and the regressions page, by the publishers of asv.
+    detect_steps(graph_set, store.path / "steps.json")
+    conf.html_dir = str(html_dir)
+    repo = Git(conf.repo, str(mirror))
+    SummaryList.publish(conf, repo, benchmarks, graph_set, revision_of)
+    # The feed reads the dates of the runs from the results files.
+    with mock.patch.object(
+        asv.plugins.regressions,
+        "iter_results",
+        lambda results_dir: stored_results(store),
+    ):
+        Regressions.publish(conf, repo, benchmarks, graph_set, revision_of)
+
+    hash_to_date = {
+        entry["commit_hash"]: entry["date"]
+        for entry, current in zip(store.files, store.file_mask())
+        if current
+    }
+    hash_to_date |= dict(repo_tags.values())
+    used = {
+        commit: revision_of[commit] for commit in hash_to_date if commit in revision_of
+    }
+    machines = {}
+    for path in results_dir.glob("*/machine.json"):
+        machine = json.loads(path.read_text())
+        machines[machine["machine"]] = machine
+    (html_dir / "index.json").write_text(
+        json.dumps(
+            {
+                "project": conf.project,
+                "project_url": conf.project_url,
+                "show_commit_url": conf.show_commit_url,
+                "hash_length": conf.hash_length,
+                "revision_to_hash": {r: h for h, r in used.items()},
+                "revision_to_date": {r: hash_to_date[h] for h, r in used.items()},
+                "params": index["params"],
+                "graph_param_list": index["graph_param_list"],
+                "benchmarks": benchmarks,
+                "machines": machines,
+                "tags": {
+                    tag: revision_of[commit]
+                    for tag, (commit, _) in repo_tags.items()
+                    if commit in revision_of
+                },
+                "pages": PAGES,
+            }
+        )
+    )
+    (html_dir / "info.json").write_text(
+        json.dumps(
+            {
+                "asv-version": asv.__version__,
+                "timestamp": int(
+                    datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000
+                ),
+            },
+            indent=4,
+        )
+    )
+    print(f"Report written to {html_dir}.")
@@ -0,0 +1,118 @@
+"""This runscript scans the asv results for significant performance changes and writes
+them, ranked by confidence, to a JSON report.
+
+See ``benchmarks/regressions.py`` for the statistics. The samples of the individual
+repeats are only stored if asv runs with ``--record-samples``, as in ``job.sh``. Older
+results contribute a single value per commit, so changes in them need several commits
+on each side to become significant.
+
+Example:
+    >>> python run_regressions.py
+    # Report the regressions of all machines and write .asv/regressions.json.
+    >>> python run_regressions.py --machine 131448eb3407 --all_changes --num_rows 50
+    # Report improvements as well, for a single machine.
+
+"""
+
+import argparse
+import pathlib
+
+from benchmarks.regressions import Change, detect_changes, load_series, write_report
+
+ROOT = pathlib.Path(__file__).parent
+
+
+def print_changes(changes: list[Change], num_rows: int) -> None:
+    """Print a table of the most confident changes."""
+    print(
+        f"{'Conf.':>6} {'Change':>8} {'Delta':>6} {'p-value':>9}  Range"
+        "              Benchmark"
+    )
+    for change in changes[:num_rows]:
+        print(
+            f"{change.confidence:6.3f} {change.relative_change:+8.1%} "
+            f"{change.cliffs_delta:+6.2f} {change.p_value:9.2e}  "
+            f"{change.last_good[:8]}..{change.first_bad[:8]}  "
+            f"{change.benchmark}{change.params} [{change.env_name}]"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--results_dir",
+        type=str,
+        default=str(ROOT / ".asv" / "results"),
+        help="The asv results directory.",
+    )
+    parser.add_argument(
+        "--machine",
+        type=str,
+        default=None,
+        help="Only analyze the results of this machine. Defaults to all machines.",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.01,
+        help="Significance level of the Mann-Whitney test.",
+    )
+    parser.add_argument(
+        "--min_effect",
+        type=float,
+        default=0.05,
+        help="Ignore changes of the median smaller than this relative change.",
+    )
+    parser.add_argument(
+        "--min_time",
+        type=float,
+        default=1e-3,
+        help="Ignore timing benchmarks faster than this, in seconds.",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=10,
+        help="Number of commits on each side of a change whose samples are compared.",
+    )
+    parser.add_argument(
+        "--noise_factor",
+        type=float,
+        default=3.0,
+        help="Ignore changes of calibrated results smaller than this multiple of the"
+        + " noise of the machine, see run_noise_controlled.py.",
+    )
+    parser.add_argument(
+        "--all_changes",
+        action="store_true",
+        default=False,
+        help="Report improvements and changes of tracked values, not only"
+        + " regressions.",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        default=str(ROOT / ".asv" / "regressions.json"),
+        help="The JSON report to write.",
+    )
+    parser.add_argument(
+        "--num_rows",
+        type=int,
+        default=20,
+        help="Number of changes printed.",
+    )
+
+    args = parser.parse_args()
+    series = load_series(pathlib.Path(args.results_dir), args.machine)
+    changes = detect_changes(
+        series,
+        alpha=args.alpha,
+        min_effect=args.min_effect,
+        min_time=args.min_time,
+        window=args.window,
+        noise_factor=args.noise_factor,
+    )
+    if not args.all_changes:
+        changes = [change for change in changes if change.regression]
+    print_changes(changes, args.num_rows)
+    write_report(changes, pathlib.Path(args.report))
@@ -0,0 +1,237 @@
+"""This runscript benchmarks a range of commits, running only the benchmarks which can
+be affected by the changes of each commit at full repeat count.
+
+Which PorePy modules a benchmark executes is read from the profiles asv records with
+``asv run --profile``, and stored as a map from benchmark to modules in
+``.asv/benchmark_modules.json``. For each commit, the PorePy files changed since the
+previously benchmarked commit are mapped to the benchmarks executing them. These
+benchmarks run as usual, all others only get a smoke run with ``--quick``, which
+checks that they still work but records no results.
+
+Benchmarks without a profile, e.g. ``timeraw_`` benchmarks, always run in full. So do
+benchmarks whose profile executes no PorePy module, and benchmarks with a
+``setup_cache``: their profile only covers the benchmark method, while the measured
+work runs in ``setup_cache``, e.g. the ``track_`` methods returning cached timings. All
+benchmarks run in full if the dependencies of PorePy changed, or if the map is missing.
+
+Example:
+    >>> python run_selective.py HEAD~1..develop --update_map
+    # Run all benchmarks of the last commit with profiling and rebuild the map.
+    >>> python run_selective.py HEAD~20..develop --steps 10 --skip_existing
+    # Benchmark 10 commits of the range, each with its benchmarks of interest.
+
+"""
+
+import argparse
+import json
+import pathlib
+import re
+import subprocess
+from typing import Optional
+
+from asv.config import Config
+from asv.results import Results
+
+from run_fast_sweep import DEPENDENCY_FILES, git, update_mirror
+
+ROOT = pathlib.Path(__file__).parent
+
+MAP_FILE = ROOT / ".asv" / "benchmark_modules.json"
+
+
+def porepy_module(path: str) -> Optional[str]:
+    """Path of a file relative to the PorePy package, e.g. ``porepy/grids/grid.py``.
+
+    Parameters:
+        path: A path in the PorePy repository or in an installation of PorePy.
+
+    Returns:
+        The relative path, or None if the file is not part of the package.
+
+    """
+    path = path.replace("\\", "/")
+    if path.startswith("porepy/"):
+        return path
+    if "/porepy/" in path:
+        return "porepy/" + path.rsplit("/porepy/", 1)[1]
+    return None
+
+
+def setup_cache_benchmarks(results_dir: pathlib.Path) -> set[str]:
+    """Benchmarks with a ``setup_cache``, from the ``benchmarks.json`` of asv."""
+    path = results_dir / "benchmarks.json"
+    if not path.exists():
+        return set()
+    benchmarks = json.loads(path.read_text())
+    return {
+        name
+        for name, benchmark in benchmarks.items()
+        if isinstance(benchmark, dict) and benchmark.get("setup_cache_key")
+    }
+
+
+def build_map(results_dir: pathlib.Path, commit: str) -> dict[str, list[str]]:
+    """Map every profiled benchmark of a commit to the PorePy modules it executes.
+
+    Benchmarks with a ``setup_cache`` and benchmarks whose profile executes no PorePy
+    module are left out of the map, such that they always run in full.
+
+    Parameters:
+        results_dir: The asv results directory.
+        commit: A commit benchmarked with ``asv run --profile``.
+
+    Returns:
+        The sorted modules executed by each benchmark with a profile.
+
+    """
+    cached = setup_cache_benchmarks(results_dir)
+    modules: dict[str, set[str]] = {}
+    for path in results_dir.glob(f"*/{commit[:8]}-*.json"):
+        results = Results.load(str(path))
+        for name in results.get_all_result_keys():
+            if name in cached or not results.has_profile(name):
+                continue
+            stats = results.get_profile_stats(name)
+            modules.setdefault(name, set()).update(
+                module
+                for filename, _, _ in stats.stats  # type: ignore[attr-defined]
+                if (module := porepy_module(filename)) is not None
+            )
+    return {
+        name: sorted(files) for name, files in sorted(modules.items()) if files
+    }
+
+
+def changed_files(mirror: pathlib.Path, old: str, new: str) -> list[str]:
+    """Files changed between two commits of the mirror."""
+    return git(f"--git-dir={mirror}", "diff", "--name-only", old, new).split()
+
+
+def select_benchmarks(
+    module_map: dict[str, list[str]], changed: list[str]
+) -> Optional[list[str]]:
+    """Profiled benchmarks which execute none of the changed PorePy modules.
+
+    Parameters:
+        module_map: The modules executed by each profiled benchmark.
+        changed: Files changed in the PorePy repository.
+
+    Returns:
+        The benchmarks which only need a smoke run, or None if all benchmarks must run
+        in full since the dependencies changed.
+
+    """
+    if any(pathlib.PurePosixPath(f).name in DEPENDENCY_FILES for f in changed):
+        return None
+    modules = {module for f in changed if (module := porepy_module(f)) is not None}
+    return [
+        name for name, executed in module_map.items() if not modules & set(executed)
+    ]
+
+
+def asv_run(commit: str, bench: list[str], asv_args: list[str]) -> int:
+    """Run ``asv run`` on a single commit, restricted by ``--bench`` expressions."""
+    cmd = ["asv", "run", f"{commit}^!", "--launch-method=spawn"]
+    cmd += [f"--bench={expression}" for expression in bench]
+    return subprocess.run(cmd + asv_args, cwd=ROOT).returncode
+
+
+def _names(names: list[str]) -> str:
+    # Parameterized benchmarks are matched as "name(param0, param1)".
+    return "(" + "|".join(re.escape(name) for name in names) + r")(\(.*\))?$"
+
+
+def name_pattern(names: list[str]) -> str:
+    """Regular expression matching exactly the given benchmarks."""
+    return "^" + _names(names)
+
+
+def complement_pattern(names: list[str]) -> str:
+    """Regular expression matching all benchmarks except the given ones."""
+    return f"^(?!{_names(names)})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "range",
+        type=str,
+        help="Commit range to benchmark, in the syntax of 'git rev-list', e.g."
+        + " A..develop.",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=None,
+        help="Sample this many commits from the range. By default, all commits run.",
+    )
+    parser.add_argument(
+        "--skip_existing",
+        action="store_true",
+        default=False,
+        help="Skip commits which already have results in the main results directory.",
+    )
+    parser.add_argument(
+        "--update_map",
+        action="store_true",
+        default=False,
+        help="Run all benchmarks of the last commit of the range with profiling, and"
+        + " rebuild the map of executed modules from it.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=str(ROOT / "asv.conf.json"),
+        help="Path to the asv configuration.",
+    )
+    parser.add_argument(
+        "asv_args",
+        nargs=argparse.REMAINDER,
+        help="Additional arguments for 'asv run', after '--'.",
+    )
+
+    args = parser.parse_args()
+    asv_args = [a for a in args.asv_args if a != "--"]
+    conf = Config.load(args.config)
+    results_dir = ROOT / conf.results_dir
+    mirror = update_mirror(conf)
+    commits = git(
+        f"--git-dir={mirror}", "rev-list", "--first-parent", "--reverse", args.range
+    ).split()
+    if args.steps is not None and len(commits) > args.steps:
+        stride = (len(commits) - 1) / max(args.steps - 1, 1)
+        commits = [commits[round(i * stride)] for i in range(args.steps)]
+    if not commits:
+        raise SystemExit("No commits in the range.")
+
+    if args.update_map:
+        asv_run(commits[-1], [], ["--profile"] + asv_args)
+        MAP_FILE.write_text(json.dumps(build_map(results_dir, commits[-1]), indent=1))
+        print(f"Map of executed modules written to {MAP_FILE}.")
+        raise SystemExit()
+
+    module_map = json.loads(MAP_FILE.read_text()) if MAP_FILE.exists() else {}
+    # The changes of the first commit are relative to its parent.
+    previous = git(f"--git-dir={mirror}", "rev-parse", f"{commits[0]}^")
+    num_failed = 0
+    for commit in commits:
+        changed = changed_files(mirror, previous, commit)
+        previous = commit
+        if args.skip_existing and any(results_dir.glob(f"*/{commit[:8]}-*.json")):
+            continue
+        smoke = select_benchmarks(module_map, changed) if module_map else None
+        if not smoke:
+            print(f"{commit[:8]}: all benchmarks in full", flush=True)
+            num_failed += asv_run(commit, [], asv_args) != 0
+            continue
+        print(
+            f"{commit[:8]}: {len(changed)} changed files, "
+            f"{len(module_map) - len(smoke)} of {len(module_map)} profiled benchmarks"
+            " in full",
+            flush=True,
+        )
+        num_failed += asv_run(commit, [complement_pattern(smoke)], asv_args) != 0
+        smoke_args = ["--quick"] + asv_args
+        num_failed += asv_run(commit, [name_pattern(smoke)], smoke_args) != 0
+    if num_failed:
+        raise SystemExit(f"{num_failed} runs failed.")
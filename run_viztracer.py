@@ -18,6 +18,15 @@ Example (intended to show basic input and output functionality):
     >>> python run_viztracer.py --physics poromechanics --geometry 2 --grid_refinement 2
     # This will run a single-phase poromechanics benchmark on a 3D grid with the finest
     # grid refinement.
+    >>> python run_viztracer.py --physics poromechanics --geometry 3 --sampling
+    # This will profile the 3D case with the sampling profiler instead of viztracer,
+    # which records all calls at a low overhead. Load the .speedscope.json file into
+    # https://www.speedscope.app. With py-spy installed, add --native to include the
+    # frames of native code, at the cost of pausing the run for every sample.
+    >>> python run_viztracer.py --physics poromechanics --geometry 3 --headless
+    # This will write one compressed trace per stage into the directory
+    # profiling_poromechanics_3_0, without starting vizviewer. The stages are listed in
+    # index.json; open a single one with "vizviewer <file>.json.gz".
 
 Note: Running the 3D model on the finest grid requires ~20 GB ram (!), thus is not
     recommended on a local machine.
@@ -25,13 +34,27 @@ Note: Running the 3D model on the finest grid requires ~20 GB ram (!), thus is n
 """
 
 import argparse
+import json
 import pathlib
 import subprocess
+from time import perf_counter
+from typing import Callable, Optional
+
 import porepy as pp
 # VizTracer is missing stubs or py.typed marker, hence we ignore type errors.
 from viztracer import VizTracer  # type: ignore[import]
 
-from benchmarks.model_setups import make_benchmark_model
+from benchmarks.model_setups import RUN_PARAMS, make_benchmark_model
+from benchmarks.sampling_profiler import SamplingProfiler
+
+
+def run_simulation(model) -> None:
+    """Prepare and run a benchmark model."""
+    model.prepare_simulation()
+    print("Num dofs:", model.equation_system.num_dofs())
+    # Material parameters are defaults and not realistic, as these bencmarks are
+    # focusing on code segments (e.g., AD assembly) independent of parameter realism.
+    pp.run_time_dependent_model(model, RUN_PARAMS)
 
 
 def run_model_with_tracer(args, model) -> None:
@@ -74,22 +97,7 @@ def run_model_with_tracer(args, model) -> None:
         ignore_frozen=True,
     )
     tracer.start()
-    model.prepare_simulation()
-    print("Num dofs:", model.equation_system.num_dofs())
-    # Simulations use a single time step and relaxed Newton tolerance to ensure 1-2
-    # Newton iterations. Material parameters are defaults and not realistic, as these
-    # bencmarks are focusing on code segments (e.g., AD assembly) independent of
-    # parameter realism.
-    pp.run_time_dependent_model(
-        model,
-        {
-            "prepare_simulation": False,
-            "nl_divergence_tol": 1e8,
-            "max_iterations": 25,
-            "nl_convergence_tol": 1e-2,
-            "nl_convergence_tol_res": 1e-2,
-        },
-    )
+    run_simulation(model)
     tracer.stop()
 
     # Save the results and open them in a browser with vizviewer.
@@ -100,6 +108,196 @@ def run_model_with_tracer(args, model) -> None:
         results_path.unlink()
 
 
+class StageTraces:
+    """Write the trace of a model run in one compressed file per stage.
+
+    The stages are ``prepare_simulation``, the time steps and the Newton iterations.
+    At the boundaries of the stages, the trace recorded so far is saved and cleared,
+    so the traces are streamed to disk during the run. A time step is split into the
+    parts before, between and after its Newton iterations. The index file lists all
+    traces in order, with their stage, time step, Newton iteration and wall time, and
+    is rewritten after every trace, so it is valid also for an interrupted run.
+
+    Parameters:
+        tracer: The tracer, not yet started.
+        model: The model to be run, before ``prepare_simulation``.
+        output_dir: Directory of the traces and of ``index.json``.
+
+    """
+
+    def __init__(self, tracer: VizTracer, model, output_dir: pathlib.Path) -> None:
+        self.tracer = tracer
+        self.output_dir = output_dir
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.index: list[dict] = []
+        self.time_step = 0
+        self.iteration = 0
+        self.stage = "prepare_simulation"
+
+        self._wrap(model, "prepare_simulation", after=self._next_time_step)
+        self._wrap(model, "before_nonlinear_iteration", before=self._start_iteration)
+        self._wrap(model, "after_nonlinear_iteration", after=self._stop_iteration)
+        for name in ("after_nonlinear_convergence", "after_nonlinear_failure"):
+            self._wrap(model, name, after=self._next_time_step)
+
+    def _wrap(
+        self,
+        model,
+        name: str,
+        before: Optional[Callable] = None,
+        after: Optional[Callable] = None,
+    ) -> None:
+        method = getattr(model, name)
+
+        def wrapper(*args, **kwargs):
+            if before is not None:
+                before()
+            result = method(*args, **kwargs)
+            if after is not None:
+                after()
+            return result
+
+        setattr(model, name, wrapper)
+
+    def start(self) -> None:
+        self._tic = perf_counter()
+        self.tracer.start()
+
+    def stop(self) -> None:
+        """Stop tracing and save the trace after the last stage."""
+        self.stage = "finalize"
+        self._save()
+        self.tracer.stop()
+
+    def _start_iteration(self) -> None:
+        self._save()
+        self.iteration += 1
+        self.stage = "newton_iteration"
+
+    def _stop_iteration(self) -> None:
+        self._save()
+        self.stage = "time_step"
+
+    def _next_time_step(self) -> None:
+        self._save()
+        self.time_step += 1
+        self.iteration = 0
+        self.stage = "time_step"
+
+    def _save(self) -> None:
+        toc = perf_counter()
+        name = f"{len(self.index):04d}_{self.stage}"
+        if self.stage in ("time_step", "newton_iteration"):
+            name += f"_step{self.time_step}"
+        if self.stage == "newton_iteration":
+            name += f"_iteration{self.iteration}"
+        path = self.output_dir / f"{name}.json.gz"
+        # Saving pauses the tracer, the time spent here is not part of any stage.
+        self.tracer.save(str(path))
+        self.tracer.clear()
+        self.index.append(
+            {
+                "file": path.name,
+                "stage": self.stage,
+                "time_step": self.time_step,
+                "iteration": (
+                    self.iteration if self.stage == "newton_iteration" else None
+                ),
+                "wall_time": toc - self._tic,
+                "size": path.stat().st_size,
+            }
+        )
+        (self.output_dir / "index.json").write_text(json.dumps(self.index, indent=1))
+        self._tic = perf_counter()
+
+
+def run_model_headless(args, model) -> None:
+    """Run a model with VizTracer enabled, writing one trace per stage.
+
+    Parameters:
+        args: Command-line arguments containing the following attributes:
+            - physics (str): The physics of the model.
+            - geometry (str): The geometry of the model.
+            - grid_refinement (int): The grid refinement level for the model.
+            - save_file (str): The directory to save the traces to. If empty, a
+            default name is generated based on chosen physics, geometry, and grid
+            refinement.
+            - min_duration (int): Minimum duration in microseconds for a function to be
+            recorded by VizTracer.
+        model: The model to be run and profiled.
+
+    Returns:
+        None
+
+    """
+    if args.save_file == "":
+        save_dir = f"profiling_{args.physics}_{args.geometry}_{args.grid_refinement}"
+    else:
+        save_dir = args.save_file
+
+    tracer = VizTracer(
+        min_duration=args.min_duration,  # μs
+        ignore_c_function=True,
+        ignore_frozen=True,
+        verbose=0,
+    )
+    output_dir = pathlib.Path(__file__).parent / save_dir
+    traces = StageTraces(tracer, model, output_dir)
+    traces.start()
+    run_simulation(model)
+    traces.stop()
+    print(f"{len(traces.index)} traces written to {output_dir}")
+
+
+def run_model_with_sampler(args, model) -> None:
+    """Run a model with the sampling profiler enabled.
+
+    Parameters:
+        args: Command-line arguments containing the following attributes:
+            - physics (str): The physics of the model.
+            - geometry (str): The geometry of the model.
+            - grid_refinement (int): The grid refinement level for the model.
+            - save_file (str): The file path to save the speedscope profile to. The
+            collapsed stacks are saved next to it with the suffix .collapsed. If
+            empty, a default name is generated based on chosen physics, geometry, and
+            grid refinement.
+            - sampling_rate (float): Samples per second.
+            - native (bool): Whether to include the frames of native code.
+        model: The model to be run and profiled.
+
+    Raises:
+        ValueError: If ``args.save_file`` does not end in .json.
+
+    Returns:
+        None
+
+    """
+    if args.save_file == "":
+        save_file: str = (
+            f"profiling_{args.physics}_{args.geometry}_{args.grid_refinement}"
+            ".speedscope.json"
+        )
+    else:
+        if not args.save_file.endswith(".json"):
+            raise ValueError(f"{args.save_file=}")
+        save_file = args.save_file
+
+    with SamplingProfiler(
+        rate=args.sampling_rate, native=args.native
+    ) as profiler:
+        run_simulation(model)
+
+    profiler.print_report()
+    results_path = pathlib.Path(__file__).parent / save_file
+    profiler.write_speedscope(str(results_path), name=results_path.stem)
+    collapsed_path = results_path.with_name(
+        results_path.name.removesuffix(".json").removesuffix(".speedscope")
+        + ".collapsed"
+    )
+    profiler.write_collapsed_stacks(str(collapsed_path))
+    print(f"Profile written to {results_path} and {collapsed_path}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -147,7 +345,40 @@ if __name__ == "__main__":
         help="Profiling will include only the function calls with execution time higher"
         + " than this threshold, μs.",
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        default=False,
+        help="Do not start vizviewer, and write one compressed trace per stage"
+        + " (prepare_simulation, time steps, Newton iterations) and an index file"
+        + " into the directory given by --save_file.",
+    )
+    parser.add_argument(
+        "--sampling",
+        action="store_true",
+        default=False,
+        help="Profile with the sampling profiler instead of viztracer. The profile is"
+        + " written in the speedscope and the collapsed stack format.",
+    )
+    parser.add_argument(
+        "--sampling_rate",
+        type=float,
+        default=100,
+        help="Samples per second of the sampling profiler.",
+    )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        default=False,
+        help="Include the frames of native code in the sampling profiler. Needs"
+        + " py-spy, which pauses the run for every sample.",
+    )
 
     args = parser.parse_args()
     model = make_benchmark_model(args.__dict__)
-    run_model_with_tracer(args, model)
+    if args.sampling:
+        run_model_with_sampler(args, model)
+    elif args.headless:
+        run_model_headless(args, model)
+    else:
+        run_model_with_tracer(args, model)